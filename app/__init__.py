@@ -11,6 +11,34 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     login_manager.init_app(app)
 
+    # Leituras na réplica com read-your-writes (DATABASE_REPLICA_URL)
+    from app import db_routing
+    db_routing.init_app(app)
+
+    # Barramento de eventos (SSE das telas de recebimento)
+    from app import events
+    events.init_app(app)
+
+    # Contagem de queries por requisição (X-Query-Count / painel de debug)
+    from app import instrumentation
+    instrumentation.init_app(app)
+
+    # Cache dos dados de referência (fornecedores, categorias, listas de produtos)
+    from app import reference_data
+    reference_data.init_app(app)
+
+    # Usuário logado vem do cache (sem SELECT em user a cada requisição)
+    from app import user_cache
+    user_cache.init_app(app)
+
+    # ETag pelas versões das tabelas (304 sem montar a página) e trechos de template em cache
+    from app import http_cache
+    http_cache.init_app(app)
+
+    # Uploads de imagem pelo conteúdo, miniaturas e /media com cache imutável
+    from app import media
+    media.init_app(app)
+
     # --- IMPORTAÇÕES DE BLUEPRINTS ---
     from app.blueprints.auth import auth_bp 
     from app.blueprints.inventory.routes import inventory_bp
@@ -0,0 +1,267 @@
+"""
+Indicadores de estoque por SKU (relatório e dashboard), vetorizados com NumPy.
+
+O banco entrega os dados já reduzidos e em lotes colunares (yield_per):
+
+    - produtos ativos: id, categoria, saldo, custo, preço;
+    - UMA linha por produto com as saídas/entradas da janela (365 dias) e
+      as saídas dos últimos 30 e 90 dias (somas condicionais num GROUP BY);
+    - a saída total por dia (série do gráfico).
+
+Com os arrays alinhados por produto (junção por searchsorted nos ids
+ordenados), tudo é aritmética de array, sem laço em Python por SKU:
+
+    - curva ABC pelo custo das saídas no ano (A = 80% do valor, B = 15%, C = resto);
+    - giro = custo das saídas / estoque médio a custo, com o saldo de abertura
+      da janela = saldo atual - entradas + saídas (identidade do extrato);
+    - consumo médio diário em 30 e 90 dias (médias móveis) e dias de cobertura
+      = saldo / consumo médio de 30 dias;
+    - média móvel de 7 dias da série diária.
+
+O cálculo (segundos, em catálogos grandes) roda só no job 'analytics' do
+'flask worker' (app/jobs.py). O resultado (só resumos e listas curtas, nunca
+os arrays inteiros) fica no cache de dados de referência com a data do dia na
+chave e no indicadores.json do job. As telas leem com published_analytics():
+o cache ou, se vazio (LRU de outro processo), o arquivo do último job do dia.
+Sem nenhum dos dois, request_analytics() enfileira o job e a tela mostra
+"calculando".
+"""
+import json
+import os
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import case, func, select
+
+from app.archive import movement_source
+from app.extensions import db
+from app.jobs import enqueue_unique, job_folder
+from app.models import Category, Job, Product
+from app.reference_data import get_cache
+
+WINDOW_DAYS = 365
+SHORT_DAYS = 30
+LONG_DAYS = 90
+ABC_LIMITS = (0.80, 0.95) # fração acumulada do valor que fecha as classes A e B
+TOP = 10
+BATCH_SIZE = 50000
+
+
+def fetch_columns(stmt, dtypes):
+    """Executa 'stmt' em lotes e devolve uma lista de arrays, um por coluna."""
+    parts = [[] for _ in dtypes]
+    # Pela conexão (Core), sem a camada do ORM: ~30% menos tempo por linha.
+    # A cláusula vai junto para a sessão escolher o engine (réplica nas rotas de leitura)
+    result = db.session.connection(bind_arguments={'clause': stmt})\
+        .execute(stmt.execution_options(stream_results=True))
+    while True:
+        rows = result.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        for i, column in enumerate(zip(*rows)):
+            parts[i].append(np.array(column, dtype=dtypes[i]))
+    return [np.concatenate(p) if p else np.array([], dtype=dtypes[i]) for i, p in enumerate(parts)]
+
+
+def align(ids, other_ids, values):
+    """Espalha 'values' (indexados por other_ids) nas posições de 'ids' (ordenado); o resto fica 0."""
+    aligned = np.zeros(len(ids), dtype=values.dtype)
+    if len(ids) and len(other_ids):
+        pos = np.searchsorted(ids, other_ids)
+        pos[pos == len(ids)] = 0
+        found = ids[pos] == other_ids
+        aligned[pos[found]] = values[found]
+    return aligned
+
+
+def abc_classes(values, limits=ABC_LIMITS):
+    """0/1/2 (= A/B/C) por item, pela participação acumulada no valor total."""
+    classes = np.full(len(values), 2, dtype=np.int8)
+    total = values.sum()
+    if total <= 0:
+        return classes
+    order = np.argsort(-values, kind='stable')
+    # Participação acumulada ANTES do item: quem cruza o limite ainda entra na classe
+    before = (np.cumsum(values[order]) - values[order]) / total
+    ranked = np.where(before < limits[0], 0, np.where(before < limits[1], 1, 2))
+    ranked[values[order] <= 0] = 2
+    classes[order] = ranked
+    return classes
+
+
+def moving_average(series, window):
+    """Média móvel simples; os primeiros dias usam a janela disponível."""
+    if not len(series):
+        return series.astype(float)
+    sums = np.cumsum(np.insert(series.astype(float), 0, 0.0))
+    counts = np.minimum(np.arange(1, len(series) + 1), window)
+    return (sums[1:] - sums[np.maximum(np.arange(1, len(series) + 1) - window, 0)]) / counts
+
+
+def _load(today):
+    end = datetime.combine(today, datetime.min.time())
+    start = end - timedelta(days=WINDOW_DAYS)
+    short_start, long_start = end - timedelta(days=SHORT_DAYS), end - timedelta(days=LONG_DAYS)
+
+    ids, category_ids, quantity, cost, price = fetch_columns(
+        select(Product.id, func.coalesce(Product.category_id, 0), func.coalesce(Product.quantity, 0),
+               func.coalesce(Product.cost, 0.0), func.coalesce(Product.price, 0.0))
+        .where(Product.active.is_(True)).order_by(Product.id),
+        (np.int64, np.int64, np.int64, np.float64, np.float64))
+
+    source = movement_source(start)
+    out_qty = case((source.type == 'OUT', source.quantity), else_=0)
+    in_qty = case((source.type == 'IN', source.quantity), else_=0)
+
+    def recent(since):
+        return func.sum(case(((source.type == 'OUT') & (source.date >= since), source.quantity), else_=0))
+
+    window = (source.date >= start) & (source.date < end)
+    moved_ids, out_year, in_year, out_short, out_long = fetch_columns(
+        select(source.product_id, func.sum(out_qty), func.sum(in_qty), recent(short_start), recent(long_start))
+        .where(window).group_by(source.product_id),
+        (np.int64,) * 5)
+
+    day = func.date(source.date)
+    days, daily_out = fetch_columns(
+        select(day, func.sum(source.quantity)).where(window, source.type == 'OUT').group_by(day),
+        (object, np.int64))
+
+    return {
+        'start': start, 'end': end, 'ids': ids, 'category_ids': category_ids,
+        'quantity': quantity, 'cost': cost, 'price': price,
+        'out_year': align(ids, moved_ids, out_year), 'in_year': align(ids, moved_ids, in_year),
+        'out_short': align(ids, moved_ids, out_short), 'out_long': align(ids, moved_ids, out_long),
+        'days': days, 'daily_out': daily_out,
+    }
+
+
+def _names(product_ids):
+    if not product_ids:
+        return {}
+    rows = db.session.execute(select(Product.id, Product.sku, Product.name).where(Product.id.in_(product_ids)))
+    return {row.id: (row.sku, row.name) for row in rows}
+
+
+def compute(today=None):
+    """Calcula os indicadores do dia (sem cache)."""
+    today = today or date.today()
+    d = _load(today)
+    quantity, cost = d['quantity'], d['cost']
+    stock_value = quantity * cost
+
+    # ABC pelo custo das mercadorias que saíram no ano
+    consumed_value = d['out_year'] * cost
+    classes = abc_classes(consumed_value)
+
+    # Giro: custo das saídas / estoque médio (abertura e fechamento da janela) a custo
+    opening = np.maximum(quantity - d['in_year'] + d['out_year'], 0)
+    average_value = (quantity + opening) / 2 * cost
+    total_average = average_value.sum()
+    turnover = consumed_value.sum() / total_average if total_average > 0 else None
+
+    # Médias móveis de consumo e cobertura
+    daily_short = d['out_short'] / SHORT_DAYS
+    daily_long = d['out_long'] / LONG_DAYS
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(daily_short > 0, quantity / daily_short, np.inf)
+
+    abc = []
+    for cls, label in enumerate('ABC'):
+        mask = classes == cls
+        abc.append({'label': label, 'count': int(mask.sum()),
+                    'consumed_value': float(consumed_value[mask].sum()),
+                    'stock_value': float(stock_value[mask].sum())})
+
+    # Giro por categoria (bincount sobre o índice da categoria)
+    cat_keys, cat_index = np.unique(d['category_ids'], return_inverse=True)
+    cat_consumed = np.bincount(cat_index, weights=consumed_value, minlength=len(cat_keys))
+    cat_average = np.bincount(cat_index, weights=average_value, minlength=len(cat_keys))
+    names = dict(db.session.execute(select(Category.id, Category.name)).all())
+    categories = sorted(({
+        'name': names.get(int(key), 'Sem categoria'),
+        'consumed_value': float(consumed), 'average_value': float(average),
+        'turnover': float(consumed / average) if average > 0 else None,
+    } for key, consumed, average in zip(cat_keys, cat_consumed, cat_average)),
+        key=lambda row: -row['consumed_value'])
+
+    # Em risco: consumindo e com menos dias de cobertura
+    consuming = np.flatnonzero(daily_short > 0)
+    at_risk = consuming[np.argsort(cover[consuming], kind='stable')[:TOP]]
+    # Parados: com saldo e sem saída no ano, por valor parado
+    idle = np.flatnonzero((quantity > 0) & (d['out_year'] == 0))
+    idle_top = idle[np.argsort(-stock_value[idle], kind='stable')[:TOP]]
+
+    info = _names([int(d['ids'][i]) for i in np.concatenate([at_risk, idle_top])])
+
+    def item(i):
+        sku, name = info.get(int(d['ids'][i]), ('', ''))
+        return {'id': int(d['ids'][i]), 'sku': sku, 'name': name, 'quantity': int(quantity[i]),
+                'abc': 'ABC'[classes[i]], 'daily_short': float(daily_short[i]), 'daily_long': float(daily_long[i]),
+                'cover_days': float(cover[i]) if np.isfinite(cover[i]) else None,
+                'stock_value': float(stock_value[i])}
+
+    series = d['daily_out']
+    by_day = dict(zip((str(x)[:10] for x in d['days']), series.tolist()))
+    labels = [(d['start'].date() + timedelta(days=i)).isoformat() for i in range(WINDOW_DAYS)]
+    daily = np.array([by_day.get(label, 0) for label in labels], dtype=np.int64)
+
+    return {
+        'date': today.isoformat(),
+        'products': int(len(d['ids'])),
+        'stock_value': float(stock_value.sum()),
+        'consumed_value': float(consumed_value.sum()),
+        'turnover': turnover,
+        'cover_days': float(quantity.sum() / daily_short.sum()) if daily_short.sum() > 0 else None,
+        'abc': abc,
+        'categories': categories,
+        'at_risk': [item(i) for i in at_risk],
+        'idle_count': int(len(idle)),
+        'idle_value': float(stock_value[idle].sum()),
+        'idle': [item(i) for i in idle_top],
+        'daily_labels': labels,
+        'daily_out': daily.tolist(),
+        'daily_average': np.round(moving_average(daily, 7), 2).tolist(),
+    }
+
+
+def inventory_analytics(today=None):
+    """Indicadores do dia, calculados uma vez e servidos do cache até a virada do dia."""
+    today = today or date.today()
+    return get_cache().get_or_set('analytics', today.isoformat(), lambda: compute(today),
+                                  ttl=current_app.config['ANALYTICS_CACHE_TTL'])
+
+
+def _job_result(today):
+    """indicadores.json do último job 'analytics' terminado hoje (None se não há ou foi apagado)."""
+    row = db.session.execute(
+        select(Job.id, Job.result_file)
+        .where(Job.kind == 'analytics', Job.status == 'done', Job.finished_at >= datetime.combine(today, time.min))
+        .order_by(Job.id.desc()).limit(1)
+    ).first()
+    if row is None or not row.result_file:
+        return None
+    try:
+        with open(os.path.join(job_folder(row.id), row.result_file), encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if data.get('date') == today.isoformat() else None
+
+
+def published_analytics(today=None):
+    """Indicadores do dia já calculados pelo worker, sem calcular aqui. None se ainda não há."""
+    today = today or date.today()
+    cache = get_cache()
+    data = cache.get('analytics', today.isoformat())
+    if data is None:
+        data = _job_result(today)
+        if data is not None:
+            cache.set('analytics', today.isoformat(), data, ttl=current_app.config['ANALYTICS_CACHE_TTL'])
+    return data
+
+
+def request_analytics(user_id=None):
+    """Enfileira o cálculo do dia, se ainda não há um na fila (índice único parcial). Não faz commit."""
+    return enqueue_unique('analytics', {'day': date.today().isoformat()}, user_id)
@@ -0,0 +1,122 @@
+"""
+Arquivamento de movimentações antigas (retenção da tabela quente).
+
+A tabela Movement cresce sem parar, e as telas de lançamento (por usuário e
+data) e de extrato (por produto e data) leem sempre o período recente. Aqui:
+
+    - archive_movements(cutoff) move, em lotes com commit, as movimentações
+      com date < cutoff para MovementArchive (mesmo id). Rodar pelo cron com
+      'flask archive-movements' (horizonte em MOVEMENT_RETENTION_DAYS);
+    - no PostgreSQL, MovementArchive é particionada por mês e as partições
+      são criadas antes de cada lote; partições velhas podem ser desanexadas
+      (DETACH PARTITION) e guardadas fora do banco;
+    - history_entity() é um Movement "virtual" sobre UNION ALL das duas
+      tabelas. Quem monta histórico só usa quando a janela pedida alcança o
+      arquivo (needs_archive), senão continua só na tabela quente.
+
+Assim o tamanho da tabela quente (e dos seus índices) fica limitado ao
+horizonte de retenção, não aos anos de operação.
+"""
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, insert, select, text, union_all
+from sqlalchemy.orm import aliased
+
+from app.extensions import db
+from app.models import Movement, MovementArchive
+
+DEFAULT_BATCH_SIZE = 5000
+COLUMNS = [column.name for column in Movement.__table__.columns]
+
+
+def archived_until():
+    """Data da movimentação arquivada mais recente (None = arquivo vazio). Busca no índice de date."""
+    return db.session.execute(select(func.max(MovementArchive.date))).scalar()
+
+
+def needs_archive(start):
+    """A janela que começa em 'start' (None = desde sempre) alcança o arquivo?"""
+    boundary = archived_until()
+    return boundary is not None and (start is None or start <= boundary)
+
+
+def _source_select(table, filters):
+    query = select(*[table.c[name] for name in COLUMNS])
+    for name, value in filters.items():
+        if value is not None:
+            query = query.where(table.c[name] == value)
+    return query
+
+
+def history_entity(product_id=None, user_id=None):
+    """
+    Movement mapeado sobre (tabela quente UNION ALL arquivo), já filtrado por
+    produto/usuário dentro de cada lado do UNION (cada um usa o próprio índice).
+    Use como o próprio Movement: db.session.query(H).filter(H.date < x)...
+    """
+    filters = {'product_id': product_id, 'user_id': user_id}
+    history = union_all(_source_select(Movement.__table__, filters),
+                        _source_select(MovementArchive.__table__, filters)).subquery('movement_history')
+    return aliased(Movement, history)
+
+
+def movement_source(start, product_id=None, user_id=None):
+    """Movement (só tabela quente) ou o histórico completo, conforme a janela pedida."""
+    return history_entity(product_id, user_id) if needs_archive(start) else Movement
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def ensure_partitions(first, last):
+    """PostgreSQL: cria as partições mensais que cobrem [first, last]."""
+    month, last = _month_start(first), _month_start(last)
+    while month <= last:
+        upper = _next_month(month)
+        db.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS movement_archive_{month:%Y_%m} PARTITION OF movement_archive "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        ))
+        month = upper
+
+
+def archive_movements(cutoff, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Move as movimentações com date < cutoff para o arquivo, 'batch_size' por
+    vez (INSERT ... SELECT + DELETE e commit por lote). Retorna quantas moveu.
+    """
+    partitioned = db.engine.dialect.name == 'postgresql'
+    hot = Movement.__table__
+    moved = 0
+    while True:
+        # Lote = as N mais antigas por id; "id <= último" evita uma lista IN enorme
+        ids = db.session.scalars(
+            select(hot.c.id).where(hot.c.date < cutoff).order_by(hot.c.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return moved
+        batch = (hot.c.id <= ids[-1]) & (hot.c.date < cutoff)
+
+        if partitioned:
+            first, last = db.session.execute(select(func.min(hot.c.date), func.max(hot.c.date)).where(batch)).one()
+            ensure_partitions(first, last)
+        db.session.execute(insert(MovementArchive.__table__).from_select(
+            COLUMNS, select(*[hot.c[name] for name in COLUMNS]).where(batch)))
+        db.session.execute(hot.delete().where(batch))
+        db.session.commit()
+
+        moved += len(ids)
+        if progress:
+            progress(moved)
+
+
+def retention_cutoff(days=None):
+    """Meia-noite de 'days' dias atrás (padrão: MOVEMENT_RETENTION_DAYS)."""
+    days = current_app.config['MOVEMENT_RETENTION_DAYS'] if days is None else days
+    return datetime.combine(date.today() - timedelta(days=days), datetime.min.time())
@@ -2,6 +2,7 @@ from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User
 from app.extensions import db
+from app import user_cache
 from . import auth_bp
 from app.decorators import admin_required # <--- Importante!
 
@@ -73,6 +74,7 @@ def user_create():
             new_user = User(username=username, role=role)
             new_user.set_password(password)
             db.session.add(new_user)
+            user_cache.invalidate() # o id pode estar no cache como "não existe"
             db.session.commit()
             flash(f'Usuário {username} criado com sucesso!', 'success')
             return redirect(url_for('auth.users_list'))
@@ -95,7 +97,10 @@ def user_edit(id):
             user.set_password(new_password)
             
         try:
+            user_cache.invalidate()
             db.session.commit()
+            if user.id == current_user.id:
+                user_cache.refresh_stamp(user) # senão o próprio admin perde a sessão
             flash('Dados do usuário atualizados.', 'success')
             return redirect(url_for('auth.users_list'))
         except Exception as e:
@@ -114,6 +119,7 @@ def user_delete(id):
         
     user = User.query.get_or_404(id)
     db.session.delete(user)
+    user_cache.invalidate()
     db.session.commit()
     flash(f'Usuário {user.username} removido.', 'success')
     return redirect(url_for('auth.users_list'))
\ No newline at end of file
@@ -1,71 +1,90 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
-from app.models import Product, Movement, Supplier, Category, User ,PurchaseOrder, PurchaseOrderItem
+from app.models import Product, Movement, Supplier, PurchaseOrder, PurchaseOrderItem
 from app.decorators import admin_required
 from datetime import datetime, date
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 from app.extensions import db
-import os
-import secrets
+from app.stock_stats import product_state, apply_change
+from app.ledger import post_movements, record_movement, receive_stock, InsufficientStock, ProductNotFound
+from app.order_status import pending_status, notify_order_change, wait_for_change
+from app.events import get_bus, longpoll_enabled, sse_enabled, stream_slot
+from app.search import search_products
+from app.pagination import decode_cursor, keyset_paginate
+from app.archive import archived_until, history_entity
+from app import reference_data
+from app.product_lookup import lookup_products
+from app.snapshots import BALANCE_QUERY_LIMIT, balances_at
+from app.replenishment import by_supplier, create_drafts, suggestions, supplier_names
+from app import media
+from app.media import MediaError
+from app.db_routing import read_replica
+from app.http_cache import conditional
+import json
+import time
 from flask import current_app # Para acessar a config da pasta
-from werkzeug.utils import secure_filename
 
 inventory_bp = Blueprint('inventory', __name__)
 
 # --- NOVIDADE: Injetor de Contadores para o Menu ---
 @inventory_bp.context_processor
 def inject_pending_counts():
-    # Conta quantos pedidos estão esperando conferência
-    pending_count = PurchaseOrder.query.filter_by(status='pending').count()
-    return dict(pending_orders_count=pending_count)
+    # Conta quantos pedidos estão esperando conferência (em cache, ver app/order_status.py)
+    pending_count, version = pending_status()
+    return dict(pending_orders_count=pending_count, pending_orders_version=version)
+
+# O menu mostra o contador de pendentes (em cache): ele entra no ETag das telas
+def listing(*tables):
+    return conditional(*tables, vary=pending_status)
 
 @inventory_bp.route('/')
 @login_required
+@read_replica
+@listing('product', 'category', 'supplier')
 def index():
-    # 1. Captura termo de busca e número da página da URL
+    # 1. Captura termo de busca e a posição (cursor) da URL
     search_query = request.args.get('q', '')
-    page = request.args.get('page', 1, type=int) # Padrão é página 1
     per_page = 10 # Produtos por página (mude para testar, ex: 2)
 
     # Começamos filtrando apenas os produtos ATIVOS
-    query = Product.query.filter_by(active=True)
-    # 3. Aplica filtro de busca se existir
+    # (categoria e fornecedor vêm no mesmo SELECT: a tabela mostra os dois)
+    query = Product.query.filter_by(active=True)\
+        .options(joinedload(Product.category), joinedload(Product.supplier))
+    # Ordem padrão: alfabética (o id desempata nomes iguais)
+    keys = [Product.name, Product.id]
+
+    # 3. Aplica filtro de busca se existir (índice de texto, ver app/search.py)
     if search_query:
-        query = query.filter(
-            (Product.name.contains(search_query)) | 
-            (Product.sku.contains(search_query))
-        )
+        query, rank = search_products(query, search_query)
+        keys = [rank, Product.id] # mais relevantes primeiro
     
-    # 4. A MÁGICA: .paginate() em vez de .all()
-    # Isso executa a query no banco com LIMIT e OFFSET automaticamente
-    products_pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    # 4. A MÁGICA: paginação por chave em vez de LIMIT/OFFSET (ver app/pagination.py)
+    # A página 5000 custa o mesmo que a página 1, e o total é aproximado
+    products_page = keyset_paginate(
+        query, keys, per_page,
+        after=request.args.get('after'), before=request.args.get('before'),
+        count_cap=current_app.config['PAGINATION_COUNT_CAP']
+    )
     
     formatted_date = datetime.now().strftime('%d/%m/%Y')
     
     return render_template('inventory/index.html', 
-                         products=products_pagination, # Passamos o objeto paginador
+                         products=products_page, # Passamos a página (itens + cursores)
                          now=formatted_date,
                          search_query=search_query)
 
 def save_picture(form_picture):
-    # Gera um nome aleatório (ex: a1b2c3d4.jpg)
-    random_hex = secrets.token_hex(8)
-    _, f_ext = os.path.splitext(form_picture.filename)
-    picture_fn = random_hex + f_ext
-    
-    # Cria o caminho completo
-    picture_path = os.path.join(current_app.config['UPLOAD_FOLDER'], picture_fn)
-    
-    # Salva o arquivo
-    form_picture.save(picture_path)
-    
-    return picture_fn
+    # Guarda pelo hash do conteúdo (upload repetido não duplica, nome igual não
+    # sobrescreve); as miniaturas WebP saem em segundo plano (ver app/media.py)
+    return media.store(form_picture)
 
 
 @inventory_bp.route('/movement/new', methods=['GET', 'POST'])
 @login_required
 def new_movement():
-    # AJUSTE 1: Só mostramos produtos ATIVOS na lista de seleção (Soft Delete)
-    products = Product.query.filter_by(active=True).all()
+    # O produto é escolhido pelo autocomplete (/api/products/lookup), que só
+    # sugere produtos ATIVOS (Soft Delete); a página não carrega o catálogo.
     
     # --- MELHORIA SÊNIOR: Lógica de Abas (Hoje vs Histórico) ---
     # Define o início do dia de hoje (00:00:00)
@@ -73,20 +92,30 @@ def new_movement():
     
     # Lista 1: O que este usuário fez HOJE (Foco imediato)
     movements_today = Movement.query\
+        .options(joinedload(Movement.product))\
         .filter(Movement.date >= today_start)\
         .filter_by(user_id=current_user.id)\
         .order_by(Movement.date.desc()).all()
 
     # Lista 2: Histórico antigo deste usuário (para consulta)
     movements_history = Movement.query\
+        .options(joinedload(Movement.product))\
         .filter(Movement.date < today_start)\
         .filter_by(user_id=current_user.id)\
         .order_by(Movement.date.desc())\
         .limit(20).all()
+    if len(movements_history) < 20 and archived_until() is not None:
+        # Pouca coisa na tabela quente: completa com as movimentações arquivadas
+        history = history_entity(user_id=current_user.id)
+        movements_history = db.session.query(history)\
+            .options(joinedload(history.product))\
+            .filter(history.date < today_start)\
+            .order_by(history.date.desc())\
+            .limit(20).all()
     # -----------------------------------------------------
 
     if request.method == 'POST':
-        product_id = request.form.get('product_id')
+        product_id = request.form.get('product_id', type=int)
         mov_type = request.form.get('type') # 'IN' ou 'OUT'
         # Convertemos para int, mas protegemos caso venha vazio
         try:
@@ -95,37 +124,26 @@ def new_movement():
             flash('Quantidade inválida.', 'danger')
             return redirect(url_for('inventory.new_movement'))
         
-        product = Product.query.get(product_id)
-        
-        if not product:
-            flash('Produto não encontrado.', 'danger')
-            return redirect(url_for('inventory.new_movement'))
-
         try:
-            if mov_type == 'OUT':
-                if product.quantity < quantity:
-                    flash(f'Erro: Saldo insuficiente! Estoque atual: {product.quantity}', 'danger')
-                    return redirect(url_for('inventory.new_movement'))
-                
-                product.quantity -= quantity
-                
-            elif mov_type == 'IN':
-                product.quantity += quantity
-            
+            # O saldo é alterado com UPDATE condicional (ver app/ledger.py):
+            # dois OUT simultâneos não conseguem vender o mesmo estoque.
             # Registra quem fez (current_user.id) e quando (data automática do banco)
-            movement = Movement(
-                type=mov_type, 
-                quantity=quantity, 
-                product_id=product.id,
-                user_id=current_user.id
-            )
-            
-            db.session.add(movement)
+            record_movement(product_id, mov_type, quantity, current_user.id)
             db.session.commit()
             flash('Movimentação realizada com sucesso!', 'success')
             
             # Mantemos na mesma tela para facilitar lançamentos contínuos
             return redirect(url_for('inventory.new_movement'))
+
+        except InsufficientStock as e:
+            db.session.rollback()
+            flash(f'Erro: Saldo insuficiente! Estoque atual: {e.available}', 'danger')
+            return redirect(url_for('inventory.new_movement'))
+
+        except ProductNotFound:
+            db.session.rollback()
+            flash('Produto não encontrado.', 'danger')
+            return redirect(url_for('inventory.new_movement'))
             
         except Exception as e:
             db.session.rollback()
@@ -133,19 +151,93 @@ def new_movement():
             
     # AJUSTE FINAL: Passamos as duas listas separadas para o HTML novo
     return render_template('inventory/movement_form.html', 
-                         products=products, 
                          movements_today=movements_today,     # Nova variável
                          movements_history=movements_history) # Nova variável
 
 
 
+# --- API DE LANÇAMENTO EM LOTE (COLETORES / INTEGRAÇÕES) ---
+
+@inventory_bp.route('/api/movements/batch', methods=['POST'])
+@login_required
+def movements_batch():
+    """
+    Recebe um lote de movimentações em JSON:
+    {"atomic": true, "movements": [{"sku": "BEB-001", "type": "OUT", "quantity": 2}, ...]}
+    Uma busca de produtos, um UPDATE e um INSERT em massa, um único commit.
+    """
+    payload = request.get_json(silent=True) or {}
+    lines = payload.get('movements')
+    atomic = bool(payload.get('atomic', True))
+
+    if not isinstance(lines, list) or not lines:
+        return jsonify(error="Envie a lista 'movements'."), 400
+    limit = current_app.config['MOVEMENT_BATCH_LIMIT']
+    if len(lines) > limit:
+        return jsonify(error=f'Lote muito grande (máximo {limit} linhas).'), 413
+
+    try:
+        applied, results = post_movements(lines, current_user.id, atomic=atomic)
+        db.session.commit()
+    except (InsufficientStock, ProductNotFound) as e:
+        # Outro worker mexeu no saldo entre a validação e a gravação
+        db.session.rollback()
+        return jsonify(error=f'{str(e)} Nada foi lançado, tente novamente.'), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(error=f'Erro ao processar lote: {str(e)}'), 500
+
+    rejected = sum(1 for r in results if not r['ok'])
+    status = 422 if atomic and rejected else 200
+    return jsonify(applied=applied, rejected=rejected, results=results), status
+
+
+@inventory_bp.route('/api/products/lookup')
+@login_required
+def product_lookup():
+    """
+    Autocomplete dos formulários: /api/products/lookup?q=cafe&limit=20&supplier_id=3
+    Produtos ativos cujo SKU ou nome começa com 'q' (SKU primeiro).
+    """
+    limit = request.args.get('limit', current_app.config['PRODUCT_LOOKUP_LIMIT'], type=int)
+    products = lookup_products(request.args.get('q', ''), limit, request.args.get('supplier_id', type=int))
+    return jsonify(results=[
+        {'id': p.id, 'sku': p.sku, 'name': p.name, 'quantity': p.quantity, 'supplier_id': p.supplier_id}
+        for p in products
+    ])
+
+
+@inventory_bp.route('/api/stock/balance')
+@login_required
+def stock_balance():
+    """
+    Saldo histórico pelo extrato: /api/stock/balance?product_id=1&product_id=2&at=2026-10-01T00:00
+    Sem 'at' = agora. Última foto diária antes da data + movimentações desde ela.
+    """
+    product_ids = request.args.getlist('product_id', type=int)
+    if not product_ids:
+        return jsonify(error="Informe ao menos um 'product_id'."), 400
+    if len(product_ids) > BALANCE_QUERY_LIMIT:
+        return jsonify(error=f'Máximo de {BALANCE_QUERY_LIMIT} produtos por consulta.'), 413
+    at = None
+    if request.args.get('at'):
+        try:
+            at = datetime.fromisoformat(request.args['at'])
+        except ValueError:
+            return jsonify(error="Data inválida em 'at' (use AAAA-MM-DD ou AAAA-MM-DDTHH:MM)."), 400
+
+    balances = balances_at(at, product_ids)
+    return jsonify(at=at.isoformat() if at else None,
+                   balances=[{'product_id': pid, 'quantity': qty} for pid, qty in balances.items()])
+
+
 @inventory_bp.route('/product/new', methods=['GET', 'POST'])
 @login_required
 @admin_required   # <--- BLOQUEIA OPERADORES AQUI
 def add_product():
     # 1. Buscamos todos os fornecedores para preencher o <select> no formulário
-    suppliers = Supplier.query.all()
-    categories = Category.query.all() 
+    suppliers = reference_data.suppliers()
+    categories = reference_data.categories()
     
     if request.method == 'POST':
         name = request.form.get('name')
@@ -169,7 +261,11 @@ def add_product():
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename != '':
-                image_file = save_picture(file) # Usa nossa função
+                try:
+                    image_file = save_picture(file) # Usa nossa função
+                except MediaError as e:
+                    flash(str(e), 'danger')
+                    return render_template('inventory/product_form.html', suppliers=suppliers, categories=categories)
             
         # Criação do Objeto Produto
         # Nota: Começamos com quantity=0. O correto é dar entrada via Movimentação depois.
@@ -187,6 +283,7 @@ def add_product():
         
         try:
             db.session.add(new_product)
+            apply_change(None, product_state(new_product))
             db.session.commit()
             flash(f'Produto "{name}" cadastrado com sucesso!', 'success')
             return redirect(url_for('inventory.index'))
@@ -205,10 +302,13 @@ def add_product():
 def edit_product(id):
     # Busca o produto pelo ID ou retorna erro 404 se não existir
     product = Product.query.get_or_404(id)
-    suppliers = Supplier.query.all()
-    categories = Category.query.all() # <--- Busca categorias
+    suppliers = reference_data.suppliers()
+    categories = reference_data.categories() # <--- Busca categorias (em cache)
     
     if request.method == 'POST':
+        # Estado antes da edição (para atualizar os KPIs do relatório)
+        before = product_state(product)
+
         # Atualiza os campos com o que veio do formulário
         product.name = request.form.get('name')
         # product.sku = request.form.get('sku') # Geralmente não permitimos mudar SKU (Regra de Negócio)
@@ -222,13 +322,18 @@ def edit_product(id):
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename != '':
-                # (Opcional: Poderíamos deletar a foto antiga aqui para economizar espaço)
-                product.image_file = save_picture(file)
+                # A foto antiga fica: pelo hash, outro produto pode estar usando a mesma
+                try:
+                    product.image_file = save_picture(file)
+                except MediaError as e:
+                    flash(str(e), 'danger')
+                    return render_template('inventory/product_form.html', suppliers=suppliers, categories=categories, product=product)
         
         # Nota Sênior: Não alteramos a 'quantity' aqui! 
         # Estoque só se mexe via Movimentação (Entrada/Saída). Isso garante rastreabilidade.
         
         try:
+            apply_change(before, product_state(product))
             db.session.commit() # Apenas salvamos o objeto que já existia
             flash(f'Produto "{product.name}" atualizado com sucesso!', 'success')
             return redirect(url_for('inventory.index'))
@@ -244,11 +349,30 @@ def edit_product(id):
 
 @inventory_bp.route('/product/<int:id>')
 @login_required
+@read_replica
+@listing('product', 'category', 'supplier', 'movement', 'movement_archive', 'user')
 def product_details(id):
     product = Product.query.get_or_404(id)
     
-    # Buscamos as movimentações APENAS deste produto, ordenadas pela data
-    movements = Movement.query.filter_by(product_id=id).order_by(Movement.date.desc()).all()
+    # Buscamos as movimentações APENAS deste produto, das mais recentes para as
+    # mais antigas, uma página por vez (produtos com anos de histórico)
+    def history_page(source):
+        return keyset_paginate(
+            db.session.query(source).filter(source.product_id == id).options(joinedload(source.user)),
+            [source.date, source.id],
+            current_app.config['MOVEMENTS_PER_PAGE'],
+            after=request.args.get('after'), before=request.args.get('before'),
+            descending=True
+        )
+
+    movements = history_page(Movement)
+    # Movimentações antigas ficam no arquivo (app/archive.py): só consultamos
+    # lá quando a tabela quente acabou ou o cursor já está no período arquivado
+    boundary = archived_until()
+    if boundary is not None:
+        cursor = decode_cursor(request.args.get('after') or request.args.get('before'), 2)
+        if not movements.has_next or (cursor and isinstance(cursor[0], datetime) and cursor[0] <= boundary):
+            movements = history_page(history_entity(product_id=id))
     
     return render_template('inventory/product_details.html', product=product, movements=movements)
 
@@ -258,9 +382,14 @@ def product_details(id):
 
 @inventory_bp.route('/suppliers')
 @login_required
+@read_replica
+@listing('supplier', 'product')
 def suppliers_list():
-    suppliers = Supplier.query.all()
-    return render_template('inventory/suppliers_list.html', suppliers=suppliers)
+    suppliers = reference_data.suppliers()
+    # Quantos produtos cada fornecedor tem, num único GROUP BY (em cache)
+    # (s.products|length carregava todos os produtos de cada fornecedor)
+    product_counts = reference_data.product_counts()
+    return render_template('inventory/suppliers_list.html', suppliers=suppliers, product_counts=product_counts)
 
 @inventory_bp.route('/suppliers/new', methods=['GET', 'POST'])
 @login_required
@@ -283,17 +412,11 @@ def add_supplier():
         if 'logo' in request.files:
             file = request.files['logo']
             if file and file.filename != '':
-                filename = secure_filename(file.filename)
-                
-                # Define pasta
-                upload_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'suppliers')
-                
-                # Cria pasta se não existir
-                if not os.path.exists(upload_folder):
-                    os.makedirs(upload_folder)
-                
-                # Salva
-                file.save(os.path.join(upload_folder, filename))
+                try:
+                    filename = save_picture(file)
+                except MediaError as e:
+                    flash(str(e), 'danger')
+                    return render_template('inventory/edit_supplier.html', supplier=None)
 
         # 3. Adiciona o nome do arquivo ao dicionário de dados
         data['logo'] = filename
@@ -336,20 +459,12 @@ def edit_supplier(id):
             
             # Verifica se o arquivo existe e tem nome
             if file and file.filename != '':
-                filename = secure_filename(file.filename)
-                
-                # Define pasta: app/static/uploads/suppliers
-                upload_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'suppliers')
-                
-                # Cria a pasta se não existir
-                if not os.path.exists(upload_folder):
-                    os.makedirs(upload_folder)
-                
-                # Salva o arquivo fisicamente
-                file.save(os.path.join(upload_folder, filename))
-                
-                # Salva o NOME do arquivo no banco
-                supplier.logo = filename
+                # Salva a CHAVE do arquivo (hash do conteúdo) no banco
+                try:
+                    supplier.logo = save_picture(file)
+                except MediaError as e:
+                    flash(str(e), 'danger')
+                    return render_template('inventory/edit_supplier.html', supplier=supplier)
         # ----------------------------------
 
         try:
@@ -367,12 +482,14 @@ def edit_supplier(id):
 @admin_required # Segurança: Só admin pode arquivar
 def delete_product(id):
     product = Product.query.get_or_404(id)
+    before = product_state(product)
     
     # A MÁGICA DO SOFT DELETE ✨
     # Em vez de db.session.delete(product), fazemos isso:
     product.active = False
     
     try:
+        apply_change(before, None) # Produto arquivado sai dos KPIs
         db.session.commit()
         flash(f'Produto "{product.name}" foi arquivado com sucesso.', 'success')
     except:
@@ -382,22 +499,89 @@ def delete_product(id):
     return redirect(url_for('inventory.index'))
 
 
-# Adicione nos imports no topo:
-from app.models import PurchaseOrder, PurchaseOrderItem # <--- IMPORTANTE
-
 # --- ROTAS DE COMPRAS / RECEBIMENTO (ADMIN) ---
 
 @inventory_bp.route('/orders')
 @login_required
+@read_replica
+@listing('purchase_order', 'supplier')
 def orders_list():
     # Lista todos os pedidos (Pendentes primeiro)
-    orders = PurchaseOrder.query.order_by(PurchaseOrder.status.desc(), PurchaseOrder.created_at.desc()).all()
+    # Vai sem .all(): só roda quando a tabela não vem do cache de fragmentos
+    orders = PurchaseOrder.query.options(joinedload(PurchaseOrder.supplier)).order_by(PurchaseOrder.status.desc(), PurchaseOrder.created_at.desc())
     return render_template('inventory/orders_list.html', orders=orders)
 
+@inventory_bp.route('/orders/status')
+@login_required
+def orders_status():
+    """
+    Contador de pendentes + versão, em JSON (substitui o reload da página).
+    Long-poll opcional: /orders/status?since=<versão>&wait=20 segura a resposta
+    até algo mudar. Só com STREAMING_WORKERS e abaixo de STREAM_MAX_CONNECTIONS;
+    senão responde na hora com longpoll=false e o navegador volta ao intervalo.
+    """
+    since = request.args.get('since')
+    wait = min(request.args.get('wait', 0, type=int), current_app.config['PENDING_LONGPOLL_MAX'])
+
+    release = stream_slot() if since and wait > 0 and longpoll_enabled() else None
+    if release is not None:
+        try:
+            pending, version = wait_for_change(since, wait)
+        finally:
+            release()
+    else:
+        pending, version = pending_status()
+
+    return jsonify(pending=pending, version=version, changed=version != since, longpoll=release is not None)
+
+@inventory_bp.route('/events/stream')
+@login_required
+def events_stream():
+    """
+    Server-Sent Events: empurra pedidos criados/finalizados/excluídos e
+    produtos que cruzaram o estoque mínimo. Telas paradas (painéis do
+    depósito) não geram mais requisições periódicas.
+
+    Desligado (ver sse_enabled) responde 204 e, no limite de conexões, 503: nos
+    dois casos o EventSource não reconecta e a tela passa a consultar
+    /orders/status.
+    """
+    if not sse_enabled():
+        return Response(status=204)
+    release = stream_slot()
+    if release is None:
+        return Response(status=503, headers={'Retry-After': '60'})
+    subscription = get_bus().subscribe()
+    heartbeat = current_app.config['EVENT_STREAM_HEARTBEAT']
+    max_seconds = current_app.config['EVENT_STREAM_MAX_SECONDS']
+
+    # A conexão fica aberta por minutos: devolve a conexão do banco ao pool já
+    db.session.close()
+
+    def generate():
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield 'retry: 5000\n\n'
+            while time.monotonic() < deadline:
+                message = subscription.get(timeout=heartbeat)
+                if message is None:
+                    yield ': ping\n\n' # comentário SSE, mantém proxies abertos
+                    continue
+                event_type = json.loads(message)['type']
+                yield f'event: {event_type}\ndata: {message}\n\n'
+        finally:
+            subscription.close()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Libera a vaga mesmo se o cliente cair antes do gerador começar
+    response.call_on_close(release)
+    return response
+
 @inventory_bp.route('/orders/new', methods=['GET', 'POST'])
 @login_required
 def new_order():
-    suppliers = Supplier.query.all()
+    suppliers = reference_data.suppliers()
     
     if request.method == 'POST':
         supplier_id = request.form.get('supplier_id')
@@ -424,13 +608,73 @@ def new_order():
             created_by_id=current_user.id
         )
         
-        db.session.add(order)
-        db.session.commit()
+        try:
+            db.session.add(order)
+            db.session.commit()
+        except IntegrityError:
+            # Dois cliques/abas ao mesmo tempo: o índice único barra a duplicata
+            db.session.rollback()
+            flash(f'ERRO CRÍTICO: A Nota Fiscal "{invoice_number}" já está cadastrada para este fornecedor!', 'danger')
+            return render_template('inventory/order_form.html', suppliers=suppliers)
+        notify_order_change('order_created', order.id)
         
         return redirect(url_for('inventory.order_details', id=order.id))
         
     return render_template('inventory/order_form.html', suppliers=suppliers)
 
+# --- SUGESTÃO DE COMPRA (RASCUNHOS GERADOS PELO CONSUMO) ---
+
+@inventory_bp.route('/orders/suggestions')
+@login_required
+@admin_required
+def order_suggestions():
+    """Resumo por fornecedor do que está abaixo do ponto de pedido (ver app/replenishment.py)."""
+    grouped = by_supplier(suggestions())
+    names = supplier_names(grouped)
+    rows = sorted(({'supplier_id': sid, 'name': names.get(sid, ''), 'items': len(items),
+                    'units': sum(item.suggested for item in items)} for sid, items in grouped.items()),
+                  key=lambda row: row['name'])
+    return render_template('inventory/order_suggestions.html', rows=rows)
+
+@inventory_bp.route('/orders/suggestions/drafts', methods=['POST'])
+@login_required
+@admin_required
+def create_order_drafts():
+    supplier_id = request.form.get('supplier_id', type=int)
+    orders = create_drafts(suggestions(supplier_id=supplier_id), current_user.id)
+    db.session.commit()
+    if not orders:
+        flash('Nenhum produto abaixo do ponto de pedido.', 'info')
+    else:
+        flash(f'{len(orders)} rascunho(s) de pedido criado(s). Revise e libere com o número da nota.', 'success')
+    return redirect(url_for('inventory.orders_list'))
+
+@inventory_bp.route('/orders/<int:id>/release', methods=['POST'])
+@login_required
+@admin_required
+def release_order(id):
+    """Rascunho -> pendente: o pedido foi enviado e a nota já tem número."""
+    order = PurchaseOrder.query.get_or_404(id)
+    invoice_number = (request.form.get('invoice_number') or '').strip()
+    if order.status != 'draft':
+        flash('Este pedido não é um rascunho.', 'warning')
+        return redirect(url_for('inventory.order_details', id=id))
+    if not invoice_number or not order.items:
+        flash('Informe o número da nota e mantenha ao menos um item no pedido.', 'danger')
+        return redirect(url_for('inventory.order_details', id=id))
+
+    order.invoice_number = invoice_number
+    order.status = 'pending'
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        flash(f'ERRO CRÍTICO: A Nota Fiscal "{invoice_number}" já está cadastrada para este fornecedor!', 'danger')
+        return redirect(url_for('inventory.order_details', id=id))
+    notify_order_change('order_created', order.id)
+    flash(f'Pedido liberado para conferência com a nota {invoice_number}.', 'success')
+    return redirect(url_for('inventory.order_details', id=id))
+
 # --- NOVA ROTA: LIMPEZA INTELIGENTE ---
 @inventory_bp.route('/orders/<int:id>/smart_exit')
 @login_required
@@ -445,6 +689,7 @@ def smart_exit(id):
     if not order.items and order.status == 'pending':
         db.session.delete(order)
         db.session.commit()
+        notify_order_change('order_deleted', id)
         flash('Recebimento cancelado pois estava vazio.', 'info')
     else:
         flash('Recebimento salvo e liberado para conferência.', 'success')
@@ -454,13 +699,21 @@ def smart_exit(id):
 @inventory_bp.route('/orders/<int:id>', methods=['GET', 'POST'])
 @login_required
 def order_details(id):
-    order = PurchaseOrder.query.get_or_404(id)
-    products = Product.query.filter_by(active=True, supplier_id=order.supplier_id).all()
+    order = PurchaseOrder.query\
+        .options(joinedload(PurchaseOrder.supplier),
+                 selectinload(PurchaseOrder.items).joinedload(PurchaseOrderItem.product))\
+        .filter_by(id=id).first_or_404()
     
     # Lógica para ADICIONAR ITEM na lista de espera
     if request.method == 'POST':
-        product_id = request.form.get('product_id')
+        product_id = request.form.get('product_id', type=int)
         quantity = int(request.form.get('quantity'))
+
+        # O autocomplete já filtra pelo fornecedor, mas o id vem do navegador
+        product = db.session.get(Product, product_id) if product_id else None
+        if product is None or not product.active or product.supplier_id != order.supplier_id:
+            flash('Selecione um produto ativo deste fornecedor.', 'danger')
+            return redirect(url_for('inventory.order_details', id=id))
         
         # Verifica se já não adicionou esse item antes
         exists = PurchaseOrderItem.query.filter_by(purchase_order_id=order.id, product_id=product_id).first()
@@ -480,7 +733,7 @@ def order_details(id):
         flash('Item adicionado à lista de espera.', 'success')
         return redirect(url_for('inventory.order_details', id=id))
 
-    return render_template('inventory/order_details.html', order=order, products=products)
+    return render_template('inventory/order_details.html', order=order)
 
 
 @inventory_bp.route('/orders/<int:id>/delete', methods=['POST'])
@@ -488,11 +741,12 @@ def order_details(id):
 def delete_order(id):
     order = PurchaseOrder.query.get_or_404(id)
     
-    # Só permite excluir se estiver Pendente (segurança)
-    if order.status == 'pending':
+    # Só permite excluir se estiver Pendente ou em Rascunho (segurança)
+    if order.status in ('pending', 'draft'):
         try:
             db.session.delete(order)
             db.session.commit()
+            notify_order_change('order_deleted', id)
             flash('Recebimento excluído com sucesso.', 'success')
         except Exception as e:
             db.session.rollback()
@@ -507,49 +761,65 @@ def delete_order(id):
 @inventory_bp.route('/orders/<int:id>/receive', methods=['GET', 'POST'])
 @login_required
 def receive_check(id):
-    order = PurchaseOrder.query.get_or_404(id)
+    # Itens e produtos vêm numa tacada só (evita 1 query por linha da nota)
+    order = PurchaseOrder.query\
+        .options(joinedload(PurchaseOrder.supplier),
+                 selectinload(PurchaseOrder.items).joinedload(PurchaseOrderItem.product))\
+        .filter_by(id=id).first_or_404()
     
     # Se já foi finalizado, não deixa mexer mais
     if order.status == 'completed':
         flash('Este recebimento já foi concluído.', 'info')
         return redirect(url_for('inventory.orders_list'))
+    # Rascunho ainda não foi enviado ao fornecedor: nada a conferir
+    if order.status == 'draft':
+        flash('Libere o rascunho com o número da nota antes de conferir.', 'warning')
+        return redirect(url_for('inventory.order_details', id=order.id))
 
     if request.method == 'POST':
         # AQUI ACONTECE A MÁGICA DA ENTRADA NO ESTOQUE
+        # 'partial' = caminhão grande, conferido em etapas: soma o que foi
+        # contado agora e mantém o pedido pendente para a próxima etapa.
+        finalize = request.form.get('action') != 'partial'
+        started = time.perf_counter()
         
         try:
-            # 1. Processar cada item da lista
+            # 1. Processar cada item da lista (só em memória, sem ir ao banco)
+            counts = {}
             for item in order.items:
                 # Pega o valor que o funcionário digitou no input "received_ID"
-                qty_received = int(request.form.get(f'received_{item.id}', 0))
-                
-                # Atualiza o item do pedido com o que realmente chegou
-                item.quantity_received = qty_received
-                
-                # 2. Atualizar o ESTOQUE DO PRODUTO (Soma ao saldo atual)
-                product = Product.query.get(item.product_id)
-                product.quantity += qty_received
+                qty_received = int(request.form.get(f'received_{item.id}') or 0)
+                if qty_received == 0:
+                    continue
                 
-                # Opcional: Criar um registro histórico na tabela Movement também
-                # para ficar registrado no extrato do produto
-                movement = Movement(
-                    type='IN',
-                    quantity=qty_received,
-                    product_id=product.id,
-                    user_id=current_user.id,
-                    # date=datetime.now() # Já é automático
-                )
-                db.session.add(movement)
+                # Atualiza o item do pedido com o que realmente chegou (acumulado)
+                item.quantity_received = (item.quantity_received or 0) + qty_received
+                counts[item.product_id] = counts.get(item.product_id, 0) + qty_received
+
+            # 2. Atualizar o ESTOQUE e o extrato (Movement) de todos os produtos
+            # com um UPDATE e um INSERT em massa (ver app/ledger.py)
+            receive_stock(counts, current_user.id)
 
             # 3. Finalizar o Pedido
-            order.status = 'completed'
+            if finalize:
+                order.status = 'completed'
             db.session.commit()
+            if finalize:
+                notify_order_change('order_completed', order.id)
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            current_app.logger.info('Recebimento %s: %d itens, %d produtos em %.1f ms',
+                                    order.id, len(order.items), len(counts), elapsed_ms)
             
-            flash(f'Recebimento da Nota {order.invoice_number} concluído! Estoque atualizado.', 'success')
-            return redirect(url_for('inventory.orders_list'))
+            if finalize:
+                flash(f'Recebimento da Nota {order.invoice_number} concluído! Estoque atualizado.', 'success')
+                return redirect(url_for('inventory.orders_list'))
+
+            flash(f'Conferência parcial salva: {sum(counts.values())} unidades lançadas no estoque.', 'success')
+            return redirect(url_for('inventory.receive_check', id=order.id))
             
         except Exception as e:
             db.session.rollback()
             flash(f'Erro ao processar recebimento: {str(e)}', 'danger')
 
-    return render_template('inventory/receive_check.html', order=order)
\ No newline at end of file
+    return render_template('inventory/receive_check.html', order=order)
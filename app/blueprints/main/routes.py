@@ -1,45 +1,71 @@
-from flask import render_template, Response
-from flask_login import login_required
-from app.models import Product, Supplier, Movement, Category
+import os
+
+from flask import render_template, Response, request, abort, stream_with_context, redirect, url_for, flash, jsonify, send_from_directory
+from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
+from app.models import Product, Job
 from . import main_bp
 from app.extensions import db
-import csv
-import io
+from app.stock_stats import load_summary
+from app.exports import parse_columns, iter_csv, gzip_chunks
+from app.analytics import published_analytics, request_analytics
+from app.decorators import admin_required
+from app.db_routing import read_replica
+from app.http_cache import conditional
+from app.importer import IMPORTERS
+from app.jobs import enqueue, job_folder, job_status
+
 
+def _analytics():
+    """Resultado do dia ou None ("calculando"): o cálculo nunca roda no worker web."""
+    analytics = published_analytics()
+    if analytics is None:
+        # Um INSERT ... ON CONFLICT DO NOTHING no primário: visitas simultâneas
+        # (ou lendo uma réplica atrasada) não criam um segundo job
+        request_analytics(current_user.id)
+        db.session.commit()
+    return analytics
 
 @main_bp.route('/')
 @login_required
+@read_replica
+# Indicadores por SKU: um resultado por dia (o dia entra no ETag) que aparece quando o job termina
+@conditional('product', 'category', 'stock_summary', vary=lambda: (published_analytics() is not None,))
 def report():
-    products = Product.query.all()
-    
-    # 1. KPIs Gerais
-    total_items = len(products)
-    total_cost = sum(p.cost * p.quantity for p in products)
-    total_revenue_potential = sum(p.price * p.quantity for p in products)
-    low_stock_products = [p for p in products if p.quantity <= p.min_level]
+    # 1. KPIs Gerais: lidos da tabela de agregados (poucas linhas),
+    # mantida incrementalmente pelas rotas de estoque (ver app/stock_stats.py)
+    summary = load_summary()
 
-    # 2. DADOS DO GRÁFICO (AGORA POR CATEGORIA 🏷️)
-    # Fazemos uma query agrupada: Nome da Categoria + Soma do Custo do Estoque
-    category_data = db.session.query(
-        Category.name, 
-        db.func.sum(Product.quantity * Product.cost)
-    ).join(Product).group_by(Category.name).all()
+    total_items = summary['product_count']
+    total_cost = summary['total_cost']
+    total_revenue_potential = summary['total_revenue']
+
+    # Só os produtos em alerta saem do banco, não o catálogo inteiro
+    low_stock_products = Product.query\
+        .filter(Product.active.is_(True), Product.quantity <= Product.min_level)\
+        .order_by(Product.quantity).all()
 
-    # Prepara as listas para o Chart.js
+    # 2. DADOS DO GRÁFICO (AGORA POR CATEGORIA 🏷️)
+    # Prepara as listas para o Chart.js (produtos sem categoria ficam de fora)
     chart_labels = []
     chart_data = []
 
-    for name, value in category_data:
-        chart_labels.append(name) # Ex: 'Eletrônicos'
-        chart_data.append(float(value)) # Ex: 15000.00
+    for row in summary['categories']:
+        if row['category_id'] is None:
+            continue
+        chart_labels.append(row['name']) # Ex: 'Eletrônicos'
+        chart_data.append(float(row['total_cost'])) # Ex: 15000.00
         
     # Se não tiver dados (banco vazio), evita erro no gráfico
     if not chart_data:
         chart_labels = ["Sem dados"]
         chart_data = [0]
 
+    # 3. Indicadores por SKU (ABC, giro, cobertura), calculados pelo 'flask worker'
+    analytics = _analytics()
+
     return render_template('main/report.html', 
-                         products=products,
+                         analytics=analytics,
                          total_items=total_items,
                          total_cost=total_cost,
                          total_revenue_potential=total_revenue_potential,
@@ -50,30 +76,115 @@ def report():
 # --- ROTA EXTRA: Exportar para Excel (CSV) ---
 @main_bp.route('/export/csv')
 @login_required
+@read_replica
 def export_csv():
-    products = Product.query.all()
-    
-    # Cria um arquivo na memória (não salva no disco)
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Cabeçalho
-    writer.writerow(['ID', 'SKU', 'Nome', 'Fornecedor', 'Custo (R$)', 'Venda (R$)', 'Estoque Atual'])
-    
-    # Linhas
-    for p in products:
-        writer.writerow([p.id, p.sku, p.name, p.supplier.name, p.cost, p.price, p.quantity])
-        
-    # Prepara a resposta para download
-    output.seek(0)
+    # Colunas opcionais: /reports/export/csv?columns=sku,name,quantity
+    try:
+        columns = parse_columns(request.args.get('columns', ''))
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    # O CSV é gerado em pedaços direto do cursor (memória constante)
+    chunks = iter_csv(columns)
+    filename = 'estoque_completo.csv'
+    headers = {}
+
+    # gzip opcional: ?gzip=1
+    if request.args.get('gzip') == '1':
+        chunks = gzip_chunks(chunks)
+        # A codificação depende do Accept-Encoding: caches não podem misturar as duas
+        headers['Vary'] = 'Accept-Encoding'
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            # O navegador descomprime sozinho, o download continua .csv
+            headers['Content-Encoding'] = 'gzip'
+        else:
+            filename += '.gz'
+
+    headers['Content-Disposition'] = f'attachment;filename={filename}'
     return Response(
-        output, 
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment;filename=estoque_completo.csv"}
+        stream_with_context(chunks),
+        mimetype="text/csv" if filename.endswith('.csv') else "application/gzip",
+        headers=headers
     )
 
-# Vamos criar também uma rota para Dashboard (futuro)
+# Dashboard de giro e consumo (mesmos indicadores do relatório, em detalhe)
 @main_bp.route('/dashboard')
 @login_required
+@read_replica
 def dashboard():
-    return render_template('main/dashboard.html')
\ No newline at end of file
+    return render_template('main/dashboard.html', analytics=_analytics())
+
+
+# --- TAREFAS EM SEGUNDO PLANO (executadas pelo 'flask worker', ver app/jobs.py) ---
+
+def _visible_job(id):
+    job = Job.query.get_or_404(id)
+    if current_user.role != 'admin' and job.created_by_id != current_user.id:
+        abort(404)
+    return job
+
+def _queued(job):
+    """202 + status em JSON para clientes de API; redireciona para a lista no navegador."""
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job_status(job)), 202, {'Location': url_for('main.job_detail', id=job.id)}
+    flash('Tarefa enfileirada. O arquivo fica disponível aqui quando terminar.', 'info')
+    return redirect(url_for('main.jobs_list'))
+
+@main_bp.route('/jobs')
+@login_required
+def jobs_list():
+    query = Job.query
+    if current_user.role != 'admin':
+        query = query.filter_by(created_by_id=current_user.id)
+    jobs = query.order_by(Job.id.desc()).limit(30).all()
+    active = any(job.status in ('queued', 'running') for job in jobs)
+    return render_template('main/jobs.html', jobs=jobs, active=active, import_kinds=list(IMPORTERS))
+
+@main_bp.route('/jobs/<int:id>')
+@login_required
+def job_detail(id):
+    return jsonify(job_status(_visible_job(id)))
+
+@main_bp.route('/jobs/<int:id>/download')
+@login_required
+def job_download(id):
+    job = _visible_job(id)
+    if job.status != 'done' or not job.result_file:
+        abort(404)
+    return send_from_directory(job_folder(job.id), job.result_file, as_attachment=True)
+
+@main_bp.route('/jobs/export', methods=['POST'])
+@login_required
+def job_export():
+    try:
+        columns = parse_columns(request.form.get('columns', ''))
+    except ValueError as e:
+        abort(400, description=str(e))
+    job = enqueue('export_csv', {'columns': columns, 'gzip': request.form.get('gzip') == '1'}, current_user.id)
+    db.session.commit()
+    return _queued(job)
+
+@main_bp.route('/jobs/analytics', methods=['POST'])
+@login_required
+@admin_required
+def job_analytics():
+    job = enqueue('analytics', {}, current_user.id)
+    db.session.commit()
+    return _queued(job)
+
+@main_bp.route('/jobs/import', methods=['POST'])
+@login_required
+@admin_required
+def job_import():
+    kind = request.form.get('kind')
+    file = request.files.get('file')
+    if kind not in IMPORTERS or not file or not file.filename:
+        flash('Escolha o tipo de importação e o arquivo (CSV ou JSONL).', 'danger')
+        return redirect(url_for('main.jobs_list'))
+    filename = secure_filename(file.filename) or 'importacao.csv' # a extensão define CSV ou JSONL
+    job = enqueue('import', {'kind': kind, 'filename': filename, 'user_id': current_user.id}, current_user.id)
+    # O arquivo vai para a pasta do job antes do commit: o worker nunca vê o job sem ele
+    os.makedirs(job_folder(job.id), exist_ok=True)
+    file.save(os.path.join(job_folder(job.id), filename))
+    db.session.commit()
+    return _queued(job)
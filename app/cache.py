@@ -0,0 +1,186 @@
+"""
+Caches da aplicação.
+
+TTLCache: dicionário do processo com expiração por tempo (TTL), para valores
+pequenos e muito lidos (contadores). Cada worker do gunicorn tem o seu; a
+invalidação explícita (delete) vale para o processo atual e o TTL limita por
+quanto tempo os outros podem ficar atrasados.
+
+VersionedCache: cache com namespaces versionados (dados de referência, ver
+app/reference_data.py). Invalidar um namespace é só incrementar a versão dele;
+as chaves antigas deixam de ser lidas e saem por LRU/TTL. Backends:
+    - LRUBackend:   memória do processo, limitado a 'maxsize' chaves.
+    - RedisBackend: servidor compartilhado (Redis ou compatível), todos os
+                    workers veem a mesma versão. Ativado com CACHE_URL=redis://...
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Dicionário thread-safe onde cada chave expira após 'ttl' segundos."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_or_set(self, key, loader, ttl):
+        """Retorna o valor em cache ou chama loader() e guarda o resultado."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+
+class LRUBackend:
+    """Memória do processo: TTL por chave e no máximo 'maxsize' chaves (LRU)."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._versions = {} # fora do LRU: versão despejada faria chaves antigas voltarem a valer
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def version(self, namespace):
+        return self._versions.get(namespace, 0)
+
+    def incr(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            return self._versions[namespace]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Servidor compartilhado entre workers/nós. Requer o pacote 'redis'."""
+
+    def __init__(self, url, prefix='stockmaster:cache:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_URL aponta para Redis, mas o pacote 'redis' não está instalado.")
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key, default=None):
+        raw = self._client.get(self._prefix + key)
+        return default if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self._prefix + key, pickle.dumps(value), ex=int(ttl) if ttl else None)
+
+    def version(self, namespace):
+        raw = self._client.get(self._prefix + 'v:' + namespace)
+        return int(raw) if raw else 0
+
+    def incr(self, namespace):
+        # Versões ficam num contador sem expiração (INCR é atômico no servidor)
+        return self._client.incr(self._prefix + 'v:' + namespace)
+
+    def clear(self):
+        for key in self._client.scan_iter(self._prefix + '*'):
+            self._client.delete(key)
+
+
+class VersionedCache:
+    """
+    get_or_set por namespace versionado, contando acertos e falhas.
+
+        cache.get_or_set('suppliers', 'all', carregar_fornecedores)
+        cache.bump('suppliers')   # depois de gravar um fornecedor
+    """
+
+    def __init__(self, backend, ttl, on_lookup=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = {}
+        self.misses = {}
+        self._on_lookup = on_lookup # callback(namespace, 'hit'|'miss') para as métricas
+        self._lock = threading.Lock()
+
+    def version(self, namespace):
+        return self.backend.version(namespace)
+
+    def bump(self, namespace):
+        return self.backend.incr(namespace)
+
+    def _count(self, namespace, result):
+        with self._lock:
+            counter = self.hits if result == 'hit' else self.misses
+            counter[namespace] = counter.get(namespace, 0) + 1
+        if self._on_lookup:
+            self._on_lookup(namespace, result)
+
+    def _key(self, namespace, name):
+        return f'{namespace}:v{self.version(namespace)}:{name}'
+
+    def get(self, namespace, name, default=None):
+        missing = object()
+        value = self.backend.get(self._key(namespace, name), missing)
+        self._count(namespace, 'miss' if value is missing else 'hit')
+        return default if value is missing else value
+
+    def set(self, namespace, name, value, ttl=None):
+        self.backend.set(self._key(namespace, name), value, ttl or self.ttl)
+
+    def get_or_set(self, namespace, name, loader, ttl=None):
+        missing = object()
+        value = self.get(namespace, name, missing)
+        if value is missing:
+            value = loader()
+            self.set(namespace, name, value, ttl)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {ns: {'hits': self.hits.get(ns, 0), 'misses': self.misses.get(ns, 0)}
+                    for ns in set(self.hits) | set(self.misses)}
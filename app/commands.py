@@ -1,7 +1,18 @@
+import time
+
 import click
 from flask.cli import with_appcontext
 from app.extensions import db  # <--- Importação correta para sua estrutura
 from app.models import User    # Certifique-se que o model User existe aqui
+from app.importer import DEFAULT_CHUNK_SIZE, IMPORTERS, read_records
+from app.stock_stats import rebuild_stock_summary, verify_stock_summary
+from app.search import reindex
+from app.snapshots import SnapshotError, last_snapshot_at, reconcile, take_snapshot
+from app.archive import DEFAULT_BATCH_SIZE, archive_movements, retention_cutoff
+from app.replenishment import create_drafts, suggestions, update_demand
+from app.media import drain, migrate_legacy
+from app.jobs import run_worker, supervise
+from app import user_cache
 
 def register_commands(app):
     @app.cli.command("create-admin")
@@ -22,8 +33,194 @@ def register_commands(app):
             new_admin.set_password(password)
             
             db.session.add(new_admin)
+            user_cache.invalidate()
             db.session.commit()
             click.echo(f"[+] Sucesso: Administrador '{username}' criado com sucesso!")
         except Exception as e:
             db.session.rollback()
-            click.echo(f"[-] Erro crítico ao salvar no banco: {e}")
\ No newline at end of file
+            click.echo(f"[-] Erro crítico ao salvar no banco: {e}")
+
+    @app.cli.command("rebuild-stats")
+    @with_appcontext
+    def rebuild_stats():
+        """Reconstrói os agregados de estoque do relatório (StockSummary)."""
+        try:
+            categories = rebuild_stock_summary()
+            db.session.commit()
+            click.echo(f"[+] Sucesso: Agregados reconstruídos ({categories} categorias).")
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"[-] Erro crítico ao reconstruir agregados: {e}")
+
+    @app.cli.command("check-stats")
+    @with_appcontext
+    def check_stats():
+        """Compara os agregados mantidos com uma varredura completa dos produtos."""
+        problems = verify_stock_summary()
+        if not problems:
+            click.echo("[+] Agregados consistentes com a varredura completa.")
+            return
+
+        for p in problems:
+            click.echo(f"[-] Categoria {p['category_id']}: {p['field']} = {p['stored']} (esperado {p['expected']})")
+        click.echo("[!] Rode 'flask rebuild-stats' para corrigir.")
+        raise SystemExit(1)
+
+    @app.cli.command("search-reindex")
+    @with_appcontext
+    def search_reindex():
+        """Cria/reconstrói o índice de busca de produtos (FTS5 ou pg_trgm)."""
+        try:
+            backend = reindex()
+            click.echo(f"[+] Sucesso: Índice de busca '{backend}' reconstruído.")
+        except Exception as e:
+            click.echo(f"[-] Erro crítico ao reconstruir o índice de busca: {e}")
+
+    @app.cli.command("import")
+    @click.argument("kind", type=click.Choice(list(IMPORTERS)))
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(['csv', 'jsonl']), help="Padrão: pela extensão do arquivo.")
+    @click.option("--chunk-size", default=DEFAULT_CHUNK_SIZE, show_default=True, help="Linhas por lote/commit.")
+    @click.option("--user", "username", help="Responsável pelas movimentações ('stock' e saldo de abertura de 'products'). Padrão: primeiro admin.")
+    @click.option("--no-copy", is_flag=True, help="PostgreSQL: usa INSERT em vez de COPY.")
+    @with_appcontext
+    def import_data(kind, path, fmt, chunk_size, username, no_copy):
+        """Importa categorias, fornecedores, produtos ou saldos de um CSV/JSONL (upsert, sem apagar nada)."""
+        user = User.query.filter_by(username=username).first() if username \
+            else User.query.filter_by(role='admin').order_by(User.id).first()
+        if kind == 'stock' and user is None:
+            click.echo("[-] Erro: informe um usuário válido com --user.")
+            raise SystemExit(1)
+
+        started = time.perf_counter()
+
+        def progress(result):
+            elapsed = time.perf_counter() - started
+            click.echo(f"    {result.processed} linhas ({result.processed / elapsed:,.0f}/s), {result.skipped} ignoradas")
+
+        try:
+            result = IMPORTERS[kind](read_records(path, fmt), chunk_size=chunk_size, progress=progress,
+                                     user_id=user.id if user else None, copy=not no_copy)
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"[-] Erro crítico na importação (lotes anteriores já gravados): {e}")
+            raise SystemExit(1)
+
+        for line, message in result.errors:
+            click.echo(f"[!] Linha {line}: {message}")
+        if result.skipped > len(result.errors):
+            click.echo(f"[!] ... e mais {result.skipped - len(result.errors)} linhas com erro.")
+        click.echo(f"[+] Sucesso: {result.processed} {kind} importados em {time.perf_counter() - started:.1f}s "
+                   f"({result.skipped} linhas ignoradas).")
+
+    @app.cli.command("snapshot-stock")
+    @click.option("--at", "at", type=click.DateTime(), help="Instante da foto (padrão: meia-noite de hoje).")
+    @with_appcontext
+    def snapshot_stock(at):
+        """Grava a foto diária dos saldos (rodar pelo cron logo depois da meia-noite)."""
+        started = time.perf_counter()
+        try:
+            written = take_snapshot(at)
+            db.session.commit()
+        except SnapshotError as e:
+            db.session.rollback()
+            click.echo(f"[-] Erro: {e}")
+            raise SystemExit(1)
+        click.echo(f"[+] Sucesso: {written} produtos com foto nova em {time.perf_counter() - started:.1f}s.")
+
+    @app.cli.command("reconcile-stock")
+    @click.option("--limit", default=50, show_default=True, help="Quantos produtos listar.")
+    @with_appcontext
+    def reconcile_stock(limit):
+        """Compara o saldo de cada produto com o extrato de movimentações (última foto + diferença)."""
+        problems = reconcile()
+        if not problems:
+            click.echo("[+] Saldos consistentes com o extrato de movimentações.")
+            return
+
+        for p in problems[:limit]:
+            click.echo(f"[-] {p.sku} ({p.name}): saldo {p.quantity}, extrato {p.ledger} (diferença {p.quantity - p.ledger:+d})")
+        if len(problems) > limit:
+            click.echo(f"[!] ... e mais {len(problems) - limit} produtos.")
+        raise SystemExit(1)
+
+    @app.cli.command("archive-movements")
+    @click.option("--days", type=int, help="Mantém na tabela quente só os últimos N dias (padrão: MOVEMENT_RETENTION_DAYS).")
+    @click.option("--batch-size", default=DEFAULT_BATCH_SIZE, show_default=True, help="Linhas por lote/commit.")
+    @with_appcontext
+    def archive_movements_command(days, batch_size):
+        """Move movimentações antigas para o arquivo (partições mensais no PostgreSQL)."""
+        cutoff = retention_cutoff(days)
+        started = time.perf_counter()
+        try:
+            # Uma foto no corte mantém o saldo atual e a reconciliação só na tabela quente
+            last = last_snapshot_at()
+            if last is None or last < cutoff:
+                take_snapshot(cutoff)
+                db.session.commit()
+            moved = archive_movements(cutoff, batch_size,
+                                      progress=lambda n: click.echo(f"    {n} movimentações arquivadas"))
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"[-] Erro crítico no arquivamento (lotes anteriores já gravados): {e}")
+            raise SystemExit(1)
+        click.echo(f"[+] Sucesso: {moved} movimentações anteriores a {cutoff:%Y-%m-%d} arquivadas "
+                   f"em {time.perf_counter() - started:.1f}s.")
+
+    @app.cli.command("replenish")
+    @click.option("--user", "username", help="Responsável pelos rascunhos de pedido. Padrão: primeiro admin.")
+    @click.option("--no-drafts", is_flag=True, help="Só atualiza o consumo médio e lista as sugestões.")
+    @with_appcontext
+    def replenish(username, no_drafts):
+        """Atualiza o consumo médio e gera rascunhos de pedido de compra (rodar pelo cron, à noite)."""
+        user = User.query.filter_by(username=username).first() if username \
+            else User.query.filter_by(role='admin').order_by(User.id).first()
+        if user is None and not no_drafts:
+            click.echo("[-] Erro: informe um usuário válido com --user.")
+            raise SystemExit(1)
+
+        started = time.perf_counter()
+        try:
+            updated = update_demand()
+            db.session.commit()
+            items = suggestions()
+            orders = {} if no_drafts else create_drafts(items, user.id)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"[-] Erro crítico na reposição: {e}")
+            raise SystemExit(1)
+        click.echo(f"[+] Sucesso: consumo de {updated} produtos atualizado, {len(items)} sugestões de compra, "
+                   f"{len(orders)} rascunhos de pedido criados em {time.perf_counter() - started:.1f}s.")
+
+    @app.cli.command("media-migrate")
+    @with_appcontext
+    def media_migrate():
+        """Passa as imagens antigas de static/uploads para o armazenamento por conteúdo (com miniaturas)."""
+        started = time.perf_counter()
+        try:
+            updated, missing = migrate_legacy()
+            db.session.commit()
+            drain()
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"[-] Erro crítico na migração das imagens: {e}")
+            raise SystemExit(1)
+        for name in missing:
+            click.echo(f"[!] Arquivo não encontrado ou inválido: {name}")
+        click.echo(f"[+] Sucesso: {updated} registros apontando para imagens por conteúdo "
+                   f"em {time.perf_counter() - started:.1f}s.")
+
+    @app.cli.command("worker")
+    @click.option("--processes", type=int, help="Processos executando tarefas (padrão: WORKER_PROCESSES).")
+    @click.option("--once", is_flag=True, help="Executa o que estiver na fila, neste processo, e sai.")
+    @with_appcontext
+    def worker(processes, once):
+        """Executa as tarefas em segundo plano (exportações, importações, indicadores)."""
+        if once:
+            processed = run_worker(once=True)
+            click.echo(f"[+] Sucesso: {processed} tarefas executadas.")
+            return
+        processes = processes or app.config['WORKER_PROCESSES']
+        click.echo(f"[+] Iniciando {processes} processos de worker (Ctrl+C para parar).")
+        supervise(processes, echo=click.echo)
@@ -0,0 +1,78 @@
+"""
+Leituras na réplica, escritas no primário (SQLALCHEMY_BINDS['replica']).
+
+Sem DATABASE_REPLICA_URL nada muda: tudo vai para o banco principal. Com a
+réplica configurada, db.session escolhe o engine por statement:
+
+    - INSERT/UPDATE/DELETE, flush do ORM e SQL que não seja SELECT vão sempre
+      para o primário (e marcam a requisição como "escreveu");
+    - SELECT vai para a réplica só nas rotas marcadas com @read_replica
+      (relatório, exportação, extrato do produto, listagens) ou dentro de
+      reading_from_replica() (tarefas do worker);
+    - read-your-writes: depois de uma requisição que escreveu, o navegador
+      fica DB_REPLICA_PIN_SECONDS lendo do primário (marca na sessão do
+      Flask), tempo para a réplica alcançar. Na própria requisição, depois da
+      primeira escrita, as leituras também voltam para o primário.
+
+A réplica atrasa alguns segundos: rota que lê e depois grava com base no que
+leu (lançamento, conferência) não deve ser marcada.
+"""
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA = 'replica'
+PIN_KEY = '_db_pinned_until'
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_app_context():
+            return primary
+        if self._flushing or isinstance(clause, UpdateBase):
+            g._db_wrote = True
+            return primary
+        if getattr(clause, 'is_select', False) and _replica_allowed():
+            replica = self._db.engines.get(REPLICA)
+            if replica is not None:
+                return replica
+        return primary
+
+
+def _replica_allowed():
+    if not g.get('_db_read_only') or g.get('_db_wrote'):
+        return False
+    return not (has_request_context() and session.get(PIN_KEY, 0) > time.time())
+
+
+def read_replica(view):
+    """Rota só de leitura: os SELECTs podem ir para a réplica."""
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        g._db_read_only = True
+        return view(*args, **kwargs)
+    return decorated
+
+
+@contextmanager
+def reading_from_replica():
+    """Fora de requisição (worker, CLI): os SELECTs do bloco podem ir para a réplica."""
+    previous = g.get('_db_read_only')
+    g._db_read_only = True
+    try:
+        yield
+    finally:
+        g._db_read_only = previous
+
+
+def init_app(app):
+    @app.after_request
+    def _pin_to_primary(response):
+        if g.get('_db_wrote') and REPLICA in app.config.get('SQLALCHEMY_BINDS', {}):
+            session[PIN_KEY] = time.time() + current_app.config['DB_REPLICA_PIN_SECONDS']
+        return response
@@ -1,11 +1,12 @@
 from functools import wraps
 from flask import abort
-from flask_login import current_user
+from app import user_cache
 
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or current_user.role != 'admin':
+        # Confere no banco quando o cache de usuários é por worker (ver app/user_cache.py)
+        if not user_cache.confirm_admin():
             abort(403) # Proibido
         return f(*args, **kwargs)
     return decorated_function
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+Barramento de eventos do estoque (alimenta o SSE das telas de recebimento).
+
+As rotas publicam eventos curtos ("order_created", "order_completed",
+"stock_low"...) e o endpoint /events/stream empurra esses eventos para os
+navegadores conectados, no lugar do reload periódico das páginas.
+
+Backends:
+    - MemoryBackend: filas em memória do processo (um único nó/worker).
+    - RedisBackend:  pub/sub de um servidor Redis (ou compatível), para vários
+                     workers/nós. Ativado com EVENT_BUS_URL=redis://...
+                     Requer o pacote 'redis'.
+
+Os eventos publicados dentro de uma transação só saem depois do commit
+(publish_after_commit), para ninguém ser avisado de algo que foi desfeito.
+
+Conexões longas (SSE e o long-poll de /orders/status) só com workers
+assíncronos (STREAMING_WORKERS) e no máximo STREAM_MAX_CONNECTIONS por
+processo (stream_slot). O SSE precisa ainda que todos os workers vejam os
+mesmos eventos: barramento Redis, ou um worker só.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+
+class MemorySubscription:
+    def __init__(self, backend):
+        self._backend = backend
+        self._queue = queue.Queue(maxsize=1000)
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            pass # cliente lento: descarta em vez de travar quem publica
+
+    def get(self, timeout):
+        """Próxima mensagem (texto JSON) ou None se o tempo acabar."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._backend.unsubscribe(self)
+
+
+class MemoryBackend:
+    """Entrega para os assinantes do próprio processo."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def subscribe(self):
+        subscription = MemorySubscription(self)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+
+class RedisSubscription:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    def get(self, timeout):
+        message = self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            return None
+        data = message['data']
+        return data.decode('utf-8') if isinstance(data, bytes) else data
+
+    def close(self):
+        self._pubsub.close()
+
+
+class RedisBackend:
+    """Pub/sub num servidor Redis: todos os workers recebem todos os eventos."""
+
+    def __init__(self, url, channel):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("EVENT_BUS_URL aponta para Redis, mas o pacote 'redis' não está instalado.")
+        self._client = redis.Redis.from_url(url)
+        self._channel = channel
+
+    def publish(self, message):
+        self._client.publish(self._channel, message)
+
+    def subscribe(self):
+        pubsub = self._client.pubsub()
+        pubsub.subscribe(self._channel)
+        return RedisSubscription(pubsub)
+
+
+class EventBus:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def publish(self, event_type, **data):
+        message = json.dumps({'type': event_type, 'data': data, 'ts': time.time()})
+        try:
+            self.backend.publish(message)
+        except Exception:
+            # Evento é aviso, não dado: falha no barramento não derruba a rota
+            logger.exception('Falha ao publicar evento %s', event_type)
+
+    def subscribe(self):
+        return self.backend.subscribe()
+
+
+def init_app(app):
+    url = app.config.get('EVENT_BUS_URL')
+    if url:
+        backend = RedisBackend(url, app.config['EVENT_BUS_CHANNEL'])
+    else:
+        backend = MemoryBackend()
+    app.extensions['event_bus'] = EventBus(backend)
+    app.extensions['stream_slots'] = threading.BoundedSemaphore(app.config['STREAM_MAX_CONNECTIONS'])
+    app.add_template_global(sse_enabled)
+
+
+def get_bus():
+    return current_app.extensions['event_bus']
+
+
+def longpoll_enabled():
+    """Segurar a requisição só com workers assíncronos (worker síncrono ficaria preso)."""
+    return current_app.config['STREAMING_WORKERS']
+
+
+def sse_enabled():
+    """SSE: workers assíncronos e um barramento que todos os workers enxergam."""
+    if not longpoll_enabled():
+        return False
+    single_worker = int(os.environ.get('WEB_CONCURRENCY', 1)) <= 1
+    return bool(current_app.config.get('EVENT_BUS_URL')) or single_worker
+
+
+def stream_slot():
+    """
+    Reserva uma das STREAM_MAX_CONNECTIONS conexões longas do processo.
+    Retorna a função que a libera (chamar uma vez) ou None se está no limite.
+    """
+    slots = current_app.extensions['stream_slots']
+    if not slots.acquire(blocking=False):
+        return None
+    released = threading.Event()
+
+    def release():
+        if not released.is_set():
+            released.set()
+            slots.release()
+    return release
+
+
+def publish_after_commit(event_type, **data):
+    """Agenda o evento para depois do commit da sessão atual."""
+    pending = db.session.info.setdefault('pending_events', [])
+    pending.append((get_bus(), event_type, data))
+
+
+@event.listens_for(Session, 'after_commit')
+def _flush_events(session):
+    for bus, event_type, data in session.info.pop('pending_events', []):
+        bus.publish(event_type, **data)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_events(session):
+    session.info.pop('pending_events', None)
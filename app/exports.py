@@ -0,0 +1,86 @@
+"""
+Exportação do estoque em CSV (streaming).
+
+O arquivo nunca é montado inteiro na memória: as linhas saem do banco em lotes
+(yield_per = cursor do lado do servidor no PostgreSQL), já com o nome do
+fornecedor resolvido no JOIN, e viram pedaços de texto que o Flask envia
+conforme são gerados. O consumo de memória fica constante, seja qual for o
+tamanho do catálogo.
+"""
+import csv
+import io
+import zlib
+
+from sqlalchemy import select
+
+from app.extensions import db
+from app.models import Product, Supplier
+
+# Colunas disponíveis: chave da URL -> (cabeçalho, coluna SQL)
+EXPORT_COLUMNS = {
+    'id': ('ID', Product.id),
+    'sku': ('SKU', Product.sku),
+    'name': ('Nome', Product.name),
+    'supplier': ('Fornecedor', Supplier.name),
+    'cost': ('Custo (R$)', Product.cost),
+    'price': ('Venda (R$)', Product.price),
+    'quantity': ('Estoque Atual', Product.quantity),
+}
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def parse_columns(raw):
+    """
+    Converte 'sku,name,quantity' em lista de chaves válidas.
+    Vazio = todas as colunas. Levanta ValueError se vier coluna desconhecida.
+    """
+    if not raw:
+        return list(EXPORT_COLUMNS)
+
+    columns = [c.strip() for c in raw.split(',') if c.strip()]
+    unknown = [c for c in columns if c not in EXPORT_COLUMNS]
+    if unknown or not columns:
+        raise ValueError(f"Colunas inválidas: {', '.join(unknown) or raw}")
+    return columns
+
+
+def iter_product_rows(columns, batch_size=DEFAULT_BATCH_SIZE):
+    """Gera as linhas (tuplas) em lotes, sem carregar objetos ORM."""
+    stmt = select(*[EXPORT_COLUMNS[c][1] for c in columns])\
+        .select_from(Product)\
+        .outerjoin(Supplier, Product.supplier_id == Supplier.id)\
+        .order_by(Product.id)
+
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield from partition
+
+
+def iter_csv(columns, batch_size=DEFAULT_BATCH_SIZE):
+    """Gera o CSV em pedaços de texto (um por lote de linhas)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow([EXPORT_COLUMNS[c][0] for c in columns])
+
+    count = 0
+    for row in iter_product_rows(columns, batch_size):
+        writer.writerow(row)
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """Comprime um gerador de texto em gzip, pedaço a pedaço."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # 31 = cabeçalho gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
+from app.db_routing import RoutingSession
 
-db = SQLAlchemy()
+# Sessão que manda SELECTs das rotas de leitura para a réplica, se houver (ver app/db_routing.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login' # Define para onde redirecionar se não logado
@@ -0,0 +1,191 @@
+"""
+Respostas condicionais (ETag) das listagens e do relatório, e fragmentos de
+template em cache.
+
+A tela de pedidos recarrega sozinha quando algum pedido muda, e as outras
+listagens ficam abertas nos terminais do depósito sendo atualizadas à mão.
+Cada recarga montava a página inteira, mesmo sem nada novo no banco. Aqui:
+
+    - cada tabela tem um contador de versão no backend do cache de dados de
+      referência (namespace 'table:<nome>'), fora do banco: nenhuma escrita a
+      mais por commit nem linha disputada. Toda gravação pela sessão (flush
+      do ORM ou INSERT/UPDATE/DELETE via db.session.execute) marca a tabela,
+      e o contador sobe DEPOIS do commit. Rollback descarta a marcação. SQL
+      textual chama mark_written();
+    - @conditional('product', 'category', ...) monta o ETag com as versões
+      dessas tabelas, a URL, o usuário, o dia e os templates do deploy. Se o
+      If-None-Match bate, a resposta é 304 sem rodar a view e sem ir ao banco
+      (as versões não dependem de réplica nenhuma);
+    - {% call cached_fragment('nome', 'tabela', ...) %} guarda o HTML do bloco
+      no cache de dados de referência pela versão das tabelas. A consulta que
+      alimenta o bloco deve chegar ao template sem ser executada (Query, não
+      lista) para não rodar quando o fragmento vem do cache.
+
+Com CACHE_URL (Redis) os contadores são compartilhados e a invalidação é
+imediata em todos os workers. Sem ele (LRU, memória de cada processo) um
+worker não vê o que outro gravou: as versões ganham uma janela de tempo
+(HTTP_CACHE_LOCAL_WINDOW, ligada quando WEB_CONCURRENCY > 1) e a tela fica,
+no máximo, esse tempo atrasada. Com mais de um worker, use Redis.
+"""
+import hashlib
+import logging
+import os
+import time
+from datetime import date
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request, session
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.cache import LRUBackend
+from app.extensions import db
+from app.reference_data import get_cache
+
+CHANGES_KEY = 'changed_tables'
+VERSION_PREFIX = 'table:'
+
+logger = logging.getLogger(__name__)
+
+
+def init_app(app):
+    app.extensions['http_cache_build'] = _template_stamp(app.template_folder)
+    app.add_template_global(cached_fragment)
+
+    @app.before_request
+    def _forget_versions():
+        g.pop('_change_versions', None)
+
+
+def _template_stamp(folder):
+    """Muda quando algum template muda: ETag de antes do deploy não vale para o HTML novo."""
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f'{os.path.relpath(root, folder)}/{name}:{stat.st_mtime_ns}:{stat.st_size}'.encode())
+    return digest.hexdigest()[:12]
+
+
+# --- VERSÕES POR TABELA ---
+
+def mark_written(*tables):
+    """Marca tabelas gravadas por SQL textual (a sessão não vê o que o statement faz)."""
+    db.session.info.setdefault(CHANGES_KEY, set()).update(tables)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flush(session, flush_context):
+    changed = {obj.__table__.name for obj in list(session.new) + list(session.deleted)}
+    changed.update(obj.__table__.name for obj in session.dirty
+                   if session.is_modified(obj, include_collections=False))
+    if changed:
+        session.info.setdefault(CHANGES_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_dml(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        name = getattr(getattr(state.statement, 'table', None), 'name', None)
+        if name:
+            state.session.info.setdefault(CHANGES_KEY, set()).add(name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_versions(session):
+    changed = session.info.pop(CHANGES_KEY, None)
+    if changed and has_app_context():
+        try:
+            bump(changed)
+        except Exception:
+            # O commit já valeu (ex.: Redis fora do ar): no pior caso as telas dessas
+            # tabelas ficam em 304 até a próxima gravação nelas
+            logger.exception('Falha ao incrementar as versões de %s', sorted(changed))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(CHANGES_KEY, None)
+
+
+def bump(tables):
+    """Incrementa as versões de 'tables' no backend do cache (INCR atômico no Redis)."""
+    cache = get_cache()
+    for name in sorted(tables):
+        cache.bump(VERSION_PREFIX + name)
+
+
+def versions(tables):
+    """{tabela: versão}, lidos uma vez por requisição. Tabela nunca gravada = 0."""
+    known = g.setdefault('_change_versions', {})
+    cache = get_cache()
+    for name in tables:
+        if name not in known:
+            known[name] = cache.version(VERSION_PREFIX + name)
+    return {name: known[name] for name in tables}
+
+
+def _version_tag(tables):
+    tag = ','.join(f'{name}:{version}' for name, version in sorted(versions(tables).items()))
+    window = current_app.config['HTTP_CACHE_LOCAL_WINDOW']
+    if window and isinstance(get_cache().backend, LRUBackend):
+        # Contador só deste processo: a janela limita o atraso em relação aos outros workers
+        tag += f'@{int(time.time() // window)}'
+    return tag
+
+
+# --- RESPOSTAS CONDICIONAIS ---
+
+def make_etag(tables, extra=()):
+    parts = [current_app.extensions['http_cache_build'], request.full_path, date.today().isoformat(),
+             _version_tag(tables), *extra]
+    if current_user.is_authenticated:
+        parts += [current_user.id, current_user.username, current_user.role]
+    return hashlib.sha1('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+def conditional(*tables, vary=None):
+    """
+    GET com ETag pelas versões de 'tables'. 'vary' (opcional) devolve o que
+    mais a página mostra e não está nessas tabelas (ex.: contador em cache).
+    Página com mensagem flash pendente é sempre montada (a mensagem é consumida).
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            etag = make_etag(tables, vary() if vary else ())
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            # Depende do usuário logado; o navegador guarda, mas sempre pergunta
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return decorated
+    return decorator
+
+
+# --- FRAGMENTOS DE TEMPLATE ---
+
+def cached_fragment(name, *tables, caller, **key):
+    """
+    {% call cached_fragment('orders_rows', 'purchase_order', 'supplier', role=current_user.role) %}
+        ...
+    {% endcall %}
+    O que o bloco mostra e não vem de 'tables' (papel do usuário, filtros) vai em 'key'.
+    """
+    extra = ','.join(f'{k}={v}' for k, v in sorted(key.items()))
+    cache_key = f"{name}:{current_app.extensions['http_cache_build']}:{_version_tag(tables)}:{extra}"
+    html = get_cache().get_or_set('fragments', cache_key, lambda: str(caller()),
+                                  ttl=current_app.config['FRAGMENT_CACHE_TTL'])
+    return Markup(html)
@@ -0,0 +1,421 @@
+"""
+Importação em massa do catálogo (comando 'flask import').
+
+Substitui o laço do seed_db.py (um objeto ORM por vez, um SELECT de
+existência por linha, commits intercalados e drop_all no começo):
+
+    - o arquivo (CSV com cabeçalho ou JSONL, um objeto por linha) é lido em
+      streaming, linha a linha, e processado em lotes de 'chunk_size';
+    - cada lote vira UM statement executemany de upsert:
+          INSERT ... ON CONFLICT (sku) DO UPDATE SET ...   (SQLite/PostgreSQL)
+      ou, no PostgreSQL com psycopg2, COPY para uma tabela temporária seguido
+      de INSERT ... SELECT ... ON CONFLICT;
+    - categorias e fornecedores citados pelos produtos são resolvidos por um
+      dicionário em memória (tabelas pequenas) e criados se não existirem;
+    - commit por lote: nada é apagado, e rodar o mesmo arquivo de novo só
+      atualiza (idempotente).
+
+Tipos de arquivo (colunas):
+    categories: name
+    suppliers:  name, cnpj (chave), contact_name, email, phone, address, city, state
+    products:   sku (chave), name, cost, price, min_level, quantity, category, supplier, supplier_cnpj
+                (quantity só vale para SKU novo e entra como saldo de abertura pelo razão,
+                com Movement IN; saldo de produto existente só muda pelo 'stock')
+    stock:      sku, quantity  -> saldo de abertura/inventário: soma a diferença
+                ao saldo pelo razão (app/ledger.py) e grava o Movement, para o
+                extrato bater mesmo com movimentações no meio da importação.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import bindparam, insert, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app import product_lookup
+from app.models import Category, Movement, Product, Supplier
+from app.http_cache import mark_written
+from app.ledger import InsufficientStock, ProductNotFound, change_stock
+from app.reference_data import mark_changed
+from app.stock_stats import apply_changes, rebuild_stock_summary
+
+DEFAULT_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 20
+
+SUPPLIER_FIELDS = ('name', 'cnpj', 'contact_name', 'email', 'phone', 'address', 'city', 'state')
+PRODUCT_FIELDS = ('sku', 'name', 'cost', 'price', 'min_level', 'quantity', 'category_id', 'supplier_id')
+# Defaults do model aplicados à mão: o COPY não passa pelo ORM (image_file não tem server_default)
+PRODUCT_DEFAULTS = {'cost': 0.0, 'price': 0.0, 'min_level': 5, 'quantity': 0, 'category_id': None,
+                    'image_file': 'default.jpg'}
+
+
+class ImportResult:
+    def __init__(self, kind):
+        self.kind = kind
+        self.processed = 0
+        self.skipped = 0
+        self.errors = [] # (número da linha, mensagem), só as primeiras
+
+    def error(self, line_number, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, message))
+
+
+# --- LEITURA EM STREAMING ---
+
+def read_records(path, fmt=None):
+    """Gera (número da linha, dict) de um CSV com cabeçalho ou de um JSONL."""
+    fmt = fmt or ('jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson') else 'csv')
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(f), start=2):
+                yield number, {k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+            return
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+
+
+def _chunks(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _number(value, kind):
+    """'2,50', '2.50' e '1.234,50' são aceitos; vazio vira None. Levanta ValueError."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str) and ',' in value:
+        if '.' in value and value.rfind(',') > value.rfind('.'):
+            value = value.replace('.', '').replace(',', '.') # 1.234,50 (formato brasileiro)
+        elif '.' in value:
+            value = value.replace(',', '')                   # 1,234.50
+        else:
+            value = value.replace(',', '.')                  # 2,50
+    return kind(float(value)) if kind is int else kind(value)
+
+
+# --- UPSERT POR LOTE ---
+
+def upsert(model, rows, key, update_columns):
+    """
+    Um executemany de INSERT ... ON CONFLICT (key) DO UPDATE no lote.
+    Bancos sem ON CONFLICT: busca as chaves existentes e separa INSERT/UPDATE.
+    """
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert_fn = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert_fn(model)
+        if update_columns:
+            stmt = stmt.on_conflict_do_update(index_elements=[key],
+                                              set_={c: stmt.excluded[c] for c in update_columns})
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[key])
+        db.session.execute(stmt, rows)
+        return
+
+    key_column = getattr(model, key)
+    existing = set(db.session.scalars(select(key_column).where(key_column.in_([r[key] for r in rows]))))
+    new_rows = [r for r in rows if r[key] not in existing]
+    if new_rows:
+        db.session.execute(insert(model), new_rows)
+    _update_by_key(model, [r for r in rows if r[key] in existing], key, update_columns)
+
+
+def _update_by_key(model, rows, key, columns):
+    """Um executemany de UPDATE ... WHERE key = :chave com as colunas informadas."""
+    if not rows or not columns:
+        return
+    table = model.__table__
+    stmt = update(table).where(table.c[key] == bindparam('_key')).values({c: bindparam(c) for c in columns})
+    db.session.execute(stmt, [{**{c: r[c] for c in columns}, '_key': r[key]} for r in rows])
+
+
+def _copy_upsert_products(rows, update_columns):
+    """
+    PostgreSQL + psycopg2: COPY do lote para uma tabela temporária e um único
+    INSERT ... SELECT ... ON CONFLICT. Retorna False se o driver não suportar.
+    """
+    connection = db.session.connection()
+    raw = connection.connection.dbapi_connection
+    if not hasattr(raw.cursor(), 'copy_expert'):
+        return False
+
+    columns = list(rows[0])
+    # Mesmas colunas de product, sem restrições (o lote é validado no INSERT final)
+    connection.execute(text(
+        'CREATE TEMP TABLE IF NOT EXISTS import_product ON COMMIT DELETE ROWS AS SELECT * FROM product WITH NO DATA'))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if row[c] is None else row[c] for c in columns])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert(f"COPY import_product ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    assignments = ', '.join(f'{c} = EXCLUDED.{c}' for c in update_columns) or None
+    conflict = f'DO UPDATE SET {assignments}' if assignments else 'DO NOTHING'
+    connection.execute(text(
+        f"INSERT INTO product ({', '.join(columns)}) SELECT {', '.join(columns)} FROM import_product "
+        f"ON CONFLICT (sku) {conflict}"))
+    connection.execute(text('TRUNCATE import_product'))
+    mark_written('product')
+    return True
+
+
+# --- IMPORTADORES ---
+
+def import_categories(records, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, **options):
+    result = ImportResult('categories')
+    for batch in _chunks(records, chunk_size):
+        rows = {}
+        for number, record in batch:
+            name = (record or {}).get('name')
+            if not name:
+                result.error(number, "Coluna 'name' vazia.")
+                continue
+            rows[name] = {'name': name}
+        upsert(Category, list(rows.values()), 'name', [])
+        mark_changed('categories')
+        db.session.commit()
+        result.processed += len(rows)
+        if progress:
+            progress(result)
+    return result
+
+
+def import_suppliers(records, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, **options):
+    result = ImportResult('suppliers')
+    for batch in _chunks(records, chunk_size):
+        groups = {}
+        for number, record in batch:
+            record = record or {}
+            if not record.get('cnpj') or not record.get('name'):
+                result.error(number, "Colunas 'cnpj' e 'name' são obrigatórias.")
+                continue
+            row = {f: record[f] for f in SUPPLIER_FIELDS if record.get(f) not in (None, '')}
+            # Lote agrupado pelo conjunto de colunas: coluna ausente não apaga dado existente
+            groups.setdefault(frozenset(row), {})[row['cnpj']] = row
+        for columns, rows in groups.items():
+            upsert(Supplier, list(rows.values()), 'cnpj', [c for c in columns if c != 'cnpj'])
+            result.processed += len(rows)
+        mark_changed('suppliers')
+        db.session.commit()
+        if progress:
+            progress(result)
+    return result
+
+
+class _Lookup:
+    """Categorias e fornecedores em memória; cria os que faltarem."""
+
+    def __init__(self):
+        self.categories = dict(db.session.execute(select(Category.name, Category.id)).all())
+        self.suppliers_by_cnpj = {}
+        self.suppliers_by_name = {}
+        for supplier_id, name, cnpj in db.session.execute(select(Supplier.id, Supplier.name, Supplier.cnpj)):
+            self.suppliers_by_name.setdefault(name, supplier_id)
+            if cnpj:
+                self.suppliers_by_cnpj[cnpj] = supplier_id
+
+    def category_id(self, name):
+        if not name:
+            return None
+        if name not in self.categories:
+            self.categories[name] = db.session.execute(
+                insert(Category).values(name=name).returning(Category.id)).scalar()
+        return self.categories[name]
+
+    def supplier_id(self, name, cnpj):
+        if cnpj and cnpj in self.suppliers_by_cnpj:
+            return self.suppliers_by_cnpj[cnpj]
+        if not cnpj and name in self.suppliers_by_name:
+            return self.suppliers_by_name[name]
+        if not name:
+            return None
+        supplier_id = db.session.execute(
+            insert(Supplier).values(name=name, cnpj=cnpj or None).returning(Supplier.id)).scalar()
+        self.suppliers_by_name.setdefault(name, supplier_id)
+        if cnpj:
+            self.suppliers_by_cnpj[cnpj] = supplier_id
+        return supplier_id
+
+
+def _product_row(record, lookup):
+    """Converte um registro do arquivo numa linha de product. Levanta ValueError."""
+    sku = str(record.get('sku') or '').strip()
+    if not sku:
+        raise ValueError("Coluna 'sku' vazia.")
+    row = {'sku': sku}
+    if record.get('name'):
+        row['name'] = str(record['name']).strip()
+    for field, kind in (('cost', float), ('price', float), ('min_level', int), ('quantity', int)):
+        try:
+            value = _number(record.get(field), kind)
+        except (ValueError, TypeError):
+            raise ValueError(f"Valor inválido em '{field}': {record.get(field)!r}")
+        if value is not None:
+            row[field] = value
+    if record.get('category'):
+        row['category_id'] = lookup.category_id(str(record['category']).strip())
+    if record.get('supplier') or record.get('supplier_cnpj'):
+        cnpj = str(record.get('supplier_cnpj') or '').strip()
+        row['supplier_id'] = lookup.supplier_id(str(record.get('supplier') or '').strip(), cnpj)
+        if row['supplier_id'] is None:
+            # Sem nome não dá para criar o fornecedor (supplier_id é NOT NULL)
+            raise ValueError(f"CNPJ de fornecedor '{cnpj}' não cadastrado e sem coluna 'supplier'.")
+    return row
+
+
+def _apply_balances(counts, user_id, result):
+    """
+    Leva cada SKU de {sku: (número da linha, saldo)} ao saldo informado: soma a
+    diferença pelo razão e grava um Movement por SKU alterado. Retorna quantos
+    SKUs ficaram com o saldo pedido. Não faz commit.
+    """
+    if not counts:
+        return 0
+    current = {sku: (product_id, quantity or 0) for product_id, sku, quantity in db.session.execute(
+        select(Product.id, Product.sku, Product.quantity).where(Product.sku.in_(list(counts))))}
+    applied, changes, movements = 0, [], []
+    now = datetime.now()
+    for sku, (number, quantity) in counts.items():
+        if sku not in current:
+            result.error(number, f"SKU '{sku}' não cadastrado.")
+            continue
+        product_id, before = current[sku]
+        if quantity == before:
+            applied += 1
+            continue
+        # Diferença pelo razão (UPDATE relativo): movimentação lançada entre a
+        # leitura e aqui não é sobrescrita e o Movement bate com o saldo
+        try:
+            change = change_stock(product_id, quantity - before)
+        except (ProductNotFound, InsufficientStock) as e:
+            result.error(number, f"SKU '{sku}': {e}")
+            continue
+        applied += 1
+        changes.append(change)
+        movements.append({'type': 'IN' if quantity > before else 'OUT', 'quantity': abs(quantity - before),
+                          'product_id': product_id, 'user_id': user_id, 'date': now})
+
+    if movements:
+        db.session.execute(insert(Movement), movements)
+        apply_changes(changes)
+    return applied
+
+
+def import_products(records, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, user_id=None, **options):
+    """
+    Upsert por SKU. SKU novo precisa de name e supplier; SKU existente só tem
+    atualizadas as colunas presentes no arquivo (quantity nunca é sobrescrita).
+    A quantity de SKU novo é gravada como saldo de abertura (Movement IN de user_id).
+    """
+    result = ImportResult('products')
+    lookup = _Lookup()
+    use_copy = db.engine.dialect.name == 'postgresql' and options.get('copy', True)
+
+    for batch in _chunks(records, chunk_size):
+        rows = {}
+        for number, record in batch:
+            try:
+                if not isinstance(record, dict):
+                    raise ValueError('Linha não é um objeto JSON.')
+                row = _product_row(record, lookup)
+            except ValueError as e:
+                result.error(number, str(e))
+                continue
+            rows[row['sku']] = (number, row) # SKU repetido no lote: vale a última linha
+
+        # SKU novo: INSERT com todas as colunas (precisa de name e supplier).
+        # SKU existente: UPDATE só das colunas que vieram, agrupado por conjunto de colunas.
+        existing = set(db.session.scalars(select(Product.sku).where(Product.sku.in_(list(rows)))))
+        new_rows, updates, openings = [], {}, {}
+        for sku, (number, row) in rows.items():
+            if sku in existing:
+                columns = tuple(c for c in PRODUCT_FIELDS if c in row and c not in ('sku', 'quantity'))
+                updates.setdefault(columns, []).append(row)
+            elif not row.get('name') or not row.get('supplier_id'):
+                result.error(number, f"SKU novo '{sku}' sem 'name' ou 'supplier'.")
+            elif row.get('quantity', 0) < 0 or (row.get('quantity') and user_id is None):
+                result.error(number, f"SKU novo '{sku}': saldo de abertura precisa de quantity >= 0 e de um usuário (--user).")
+            else:
+                # Nasce com saldo zero; o saldo de abertura entra pelo razão logo abaixo
+                if row.get('quantity'):
+                    openings[sku] = (number, row['quantity'])
+                new_rows.append({**PRODUCT_DEFAULTS, **row, 'quantity': 0})
+
+        if new_rows:
+            # ON CONFLICT cobre outro processo criando o mesmo SKU no meio do caminho
+            insert_update = [c for c in PRODUCT_FIELDS if c not in ('sku', 'quantity')]
+            if not (use_copy and _copy_upsert_products(new_rows, insert_update)):
+                upsert(Product, new_rows, 'sku', insert_update)
+        for columns, group in updates.items():
+            _update_by_key(Product, group, 'sku', list(columns))
+        result.processed += len(new_rows) + sum(len(group) for group in updates.values())
+        # Mesmo caminho do 'stock': o extrato (e o reconcile-stock) bate com o saldo
+        _apply_balances(openings, user_id, result)
+        mark_changed('products', 'categories', 'suppliers') # categorias/fornecedores podem ter sido criados
+
+        db.session.commit()
+        if progress:
+            progress(result)
+
+    # Os KPIs do relatório são recalculados uma vez no fim (uma varredura)
+    rebuild_stock_summary()
+    db.session.commit()
+    # Nomes alterados por UPDATE direto: o autocomplete reconstrói o índice
+    product_lookup.invalidate()
+    return result
+
+
+def import_stock(records, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, user_id=None, **options):
+    """Saldo de abertura/inventário: quantity do arquivo vira o saldo do SKU."""
+    if user_id is None:
+        raise ValueError("Importação de saldo precisa de um usuário responsável (--user).")
+    result = ImportResult('stock')
+
+    for batch in _chunks(records, chunk_size):
+        counts = {}
+        for number, record in batch:
+            record = record if isinstance(record, dict) else {}
+            try:
+                quantity = _number(record.get('quantity'), int)
+            except (ValueError, TypeError):
+                quantity = None
+            if not record.get('sku') or quantity is None or quantity < 0:
+                result.error(number, "Informe 'sku' e 'quantity' (inteiro >= 0).")
+                continue
+            counts[str(record['sku']).strip()] = (number, quantity)
+
+        result.processed += _apply_balances(counts, user_id, result)
+        db.session.commit()
+        if progress:
+            progress(result)
+
+    return result
+
+
+IMPORTERS = {
+    'categories': import_categories,
+    'suppliers': import_suppliers,
+    'products': import_products,
+    'stock': import_stock,
+}
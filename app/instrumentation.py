@@ -0,0 +1,274 @@
+"""
+Instrumentação das requisições: contagem de queries, métricas e log de SQL lento.
+
+1. Contagem de queries (sempre ligada, caça aos N+1)
+   Cada SQL executado durante uma requisição é contado (e cronometrado) pelos
+   eventos do engine do SQLAlchemy. O resultado sai em todo response:
+
+       X-Query-Count: 4
+       X-Query-Time:  1.83    (ms somados no banco)
+
+   Com SQL_DEBUG_PANEL ligado (padrão: modo debug), as páginas HTML ganham um
+   painel no rodapé com cada statement executado, na ordem.
+
+   Política de carregamento: os relacionamentos em app/models.py continuam
+   lazy=True; cada rota de listagem declara o que o template vai tocar com
+   joinedload (muitos-para-um: order.supplier, p.category) ou selectinload
+   (coleções: order.items). Os testes em tests.py falham se uma tela passar do
+   seu orçamento de queries ou se o número crescer com a quantidade de linhas.
+
+2. Métricas (METRICS_ENABLED=1)
+   Por endpoint: histograma de latência, total de queries e de tempo no banco,
+   tempo de renderização de templates e blocos de memória Python alocados
+   (sys.getallocatedblocks, sem o custo do tracemalloc). Tudo em contadores
+   do próprio processo, expostos em texto Prometheus em /metrics (protegido por
+   METRICS_TOKEN, se definido). Com vários workers, cada um expõe os seus.
+
+3. Log de SQL lento (SLOW_QUERY_MS=<ms>)
+   Statements acima do limite viram uma linha JSON no logger
+   'app.instrumentation.slow' com parâmetros, duração e a rota de origem.
+
+O custo por requisição é alguns perf_counter() e somas num dicionário; nada
+é feito por query além de duas chamadas de relógio.
+"""
+import json
+import logging
+import sys
+import threading
+import time
+
+from flask import Response, abort, g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from markupsafe import escape
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_log = logging.getLogger(__name__ + '.slow')
+
+PANEL_TEMPLATE = (
+    '<div id="sql-debug-panel" style="position:fixed;bottom:0;right:0;z-index:9999;max-width:60%;'
+    'max-height:40%;overflow:auto;background:#212529;color:#f8f9fa;font:12px monospace;padding:8px;opacity:.92">'
+    '<strong>{count} queries · {elapsed:.2f} ms</strong><ol style="margin:4px 0 0;padding-left:20px">{rows}</ol></div>'
+)
+
+# Limites (em segundos) do histograma de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Limites (em blocos) do histograma de memória alocada por requisição
+ALLOCATION_BUCKETS = (100, 1000, 10000, 100000, 1000000)
+
+SLOW_PARAMS_LIMIT = 5 # executemany: só as primeiras linhas de parâmetros vão pro log
+
+
+def _stats():
+    """Contadores da requisição atual (None fora de requisição)."""
+    if not has_request_context():
+        return None
+    return g.get('_sql_stats')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _stats() is not None:
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _stats()
+    if stats is None:
+        return
+    started = conn.info.get('_query_started')
+    elapsed = (time.perf_counter() - started.pop()) * 1000 if started else 0.0
+    stats['count'] += 1
+    stats['time'] += elapsed
+    if stats['statements'] is not None:
+        stats['statements'].append((statement, elapsed))
+    if stats['slow_ms'] and elapsed >= stats['slow_ms']:
+        _log_slow_query(statement, parameters, executemany, elapsed)
+
+
+def _log_slow_query(statement, parameters, executemany, elapsed):
+    if executemany:
+        params = {'rows': len(parameters), 'first': list(parameters[:SLOW_PARAMS_LIMIT])}
+    else:
+        params = parameters
+    slow_log.warning(json.dumps({
+        'event': 'slow_query',
+        'duration_ms': round(elapsed, 2),
+        'statement': statement,
+        'parameters': params,
+        'endpoint': request.endpoint,
+        'method': request.method,
+        'path': request.path,
+    }, default=str, ensure_ascii=False))
+
+
+def query_stats():
+    """(quantidade, ms) de SQL da requisição atual."""
+    stats = _stats()
+    if stats is None:
+        return 0, 0.0
+    return stats['count'], stats['time']
+
+
+def _render_panel(stats):
+    rows = ''.join(f'<li>{escape(sql)} <em>({ms:.2f} ms)</em></li>' for sql, ms in stats['statements'])
+    return PANEL_TEMPLATE.format(count=stats['count'], elapsed=stats['time'], rows=rows)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels) + '}'
+
+
+class MetricsRegistry:
+    """Contadores e histogramas do processo, no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}        # nome -> (tipo, ajuda, buckets)
+        self._counters = {}    # (nome, labels) -> valor
+        self._histograms = {}  # (nome, labels) -> [contagens por bucket, soma, total]
+
+    def counter(self, name, help_text):
+        self._meta[name] = ('counter', help_text, None)
+
+    def histogram(self, name, help_text, buckets):
+        self._meta[name] = ('histogram', help_text, buckets)
+
+    def inc(self, name, labels, value=1.0):
+        """'labels' é uma tupla de pares (nome, valor), sempre na mesma ordem."""
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name, labels, value):
+        buckets = self._meta[name][2]
+        key = (name, labels)
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: [list(e[0]), e[1], e[2]] for key, e in self._histograms.items()}
+
+        lines = []
+        for name, (kind, help_text, buckets) in self._meta.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            for (metric, labels), (counts, total, observed) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(buckets, counts):
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {count}')
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {observed}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+                lines.append(f'{name}_count{_format_labels(labels)} {observed}')
+        return '\n'.join(lines) + '\n'
+
+
+def create_registry():
+    registry = MetricsRegistry()
+    registry.histogram('http_request_duration_seconds', 'Latência das requisições por endpoint.', LATENCY_BUCKETS)
+    registry.counter('http_request_sql_queries_total', 'Statements SQL executados, por endpoint.')
+    registry.counter('http_request_sql_seconds_total', 'Tempo gasto no banco, por endpoint.')
+    registry.counter('http_request_template_seconds_total', 'Tempo de renderização de templates, por endpoint.')
+    registry.histogram('http_request_allocated_blocks', 'Blocos de memória Python alocados (líquido) por requisição.',
+                       ALLOCATION_BUCKETS)
+    return registry
+
+
+def get_registry(app):
+    return app.extensions.get('metrics')
+
+
+def init_app(app):
+    panel = app.config.get('SQL_DEBUG_PANEL')
+    if panel is None:
+        panel = app.debug
+    slow_ms = app.config.get('SLOW_QUERY_MS')
+    registry = create_registry() if app.config.get('METRICS_ENABLED') else None
+
+    @app.before_request
+    def _start_counting():
+        g._sql_stats = {'count': 0, 'time': 0.0, 'statements': [] if panel else None, 'slow_ms': slow_ms}
+        if registry is not None:
+            g._request_started = time.perf_counter()
+            g._template_time = 0.0
+            g._allocated_blocks = sys.getallocatedblocks()
+
+    @app.after_request
+    def _report_queries(response):
+        stats = _stats()
+        if stats is None:
+            return response
+        response.headers['X-Query-Count'] = str(stats['count'])
+        response.headers['X-Query-Time'] = f"{stats['time']:.2f}"
+
+        if registry is not None and request.endpoint != 'metrics':
+            _record_request(registry, stats, response)
+
+        # Painel só em páginas HTML completas (não em streams nem JSON)
+        if panel and response.mimetype == 'text/html' and not response.is_streamed:
+            html = response.get_data(as_text=True)
+            if '</body>' in html:
+                response.set_data(html.replace('</body>', _render_panel(stats) + '</body>', 1))
+        return response
+
+    if registry is None:
+        return
+
+    app.extensions['metrics'] = registry
+
+    def _template_started(sender, template, context, **extra):
+        if has_request_context():
+            g._template_started = time.perf_counter()
+
+    def _template_finished(sender, template, context, **extra):
+        started = g.pop('_template_started', None) if has_request_context() else None
+        if started is not None:
+            g._template_time = g.get('_template_time', 0.0) + time.perf_counter() - started
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_finished, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _record_request(registry, stats, response):
+    started = g.get('_request_started')
+    if started is None:
+        return
+    endpoint = request.endpoint or 'not_found'
+    registry.observe('http_request_duration_seconds',
+                     (('endpoint', endpoint), ('method', request.method), ('status', response.status_code)),
+                     time.perf_counter() - started)
+    labels = (('endpoint', endpoint),)
+    registry.inc('http_request_sql_queries_total', labels, stats['count'])
+    registry.inc('http_request_sql_seconds_total', labels, stats['time'] / 1000)
+    registry.inc('http_request_template_seconds_total', labels, g.get('_template_time', 0.0))
+    registry.observe('http_request_allocated_blocks', labels,
+                     max(sys.getallocatedblocks() - g._allocated_blocks, 0))
@@ -0,0 +1,376 @@
+"""
+Tarefas pesadas fora dos workers web: fila no banco + 'flask worker'.
+
+Exportação do estoque, importação de planilhas e o cálculo dos indicadores
+rodavam dentro da requisição, segurando um worker do gunicorn por minutos.
+Aqui a web só enfileira (uma linha em Job) e responde; quem executa é o
+'flask worker', um processo supervisor com N processos filhos:
+
+    - cada filho pega o próximo 'queued' com um UPDATE condicional
+      (status = 'queued' no WHERE): dois filhos nunca levam o mesmo job;
+    - durante a execução uma thread atualiza heartbeat_at (e o handler
+      informa o progresso) por uma conexão própria, visível na hora para
+      GET /reports/jobs/<id>;
+    - filho que morre (OOM, kill, deploy) é trocado pelo supervisor e o job
+      dele volta para a fila na hora; job cujo heartbeat parou há mais de
+      JOB_STALE_SECONDS (máquina que caiu) também volta. Até JOB_MAX_ATTEMPTS
+      tentativas. Erro do próprio handler (arquivo inválido etc.) não repete;
+    - o fim da tarefa só é gravado se o job ainda é da mesma tentativa: um
+      worker "zumbi" não sobrescreve o resultado de quem o substituiu;
+    - o arquivo de resultado vai para JOBS_FOLDER/<id>/ (escrito num
+      temporário e renomeado: repetir a tarefa é seguro) e sai por
+      GET /reports/jobs/<id>/download. Jobs terminados há mais de
+      JOB_RESULT_DAYS são apagados pelo próprio worker.
+
+Novas tarefas: uma função handler(ctx, **params) registrada com @job('nome').
+"""
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError
+
+from app.db_routing import reading_from_replica
+from app.extensions import db
+from app.models import ACTIVE_UNIQUE_WHERE, Job, UNIQUE_KINDS
+
+HANDLERS = {}
+ACTIVE_STATUSES = ('queued', 'running')
+PRUNE_INTERVAL = 3600 # segundos entre limpezas de jobs antigos
+
+logger = logging.getLogger(__name__)
+
+
+def job(kind):
+    """Registra 'handler(ctx, **params)' como a tarefa 'kind'. Retorna o nome do arquivo de resultado (ou None)."""
+    def register(handler):
+        HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def job_folder(job_id):
+    return os.path.join(current_app.config['JOBS_FOLDER'], str(job_id))
+
+
+def enqueue(kind, params=None, user_id=None):
+    """Cria o job na fila (sem commit) e retorna o objeto, já com id."""
+    if kind not in HANDLERS:
+        raise ValueError(f'Tarefa desconhecida: {kind}')
+    new_job = Job(kind=kind, params=json.dumps(params or {}), created_by_id=user_id)
+    db.session.add(new_job)
+    db.session.flush()
+    return new_job
+
+
+def enqueue_unique(kind, params=None, user_id=None):
+    """
+    Como enqueue, mas para tarefas com no máximo um job ativo (UNIQUE_KINDS):
+    o índice único parcial uq_job_active_kind decide, e quem chega depois não
+    insere nada (INSERT ... ON CONFLICT DO NOTHING, sem SELECT antes que
+    possa ler uma réplica atrasada). Retorna o id criado ou None. Sem commit.
+    """
+    if kind not in UNIQUE_KINDS:
+        raise ValueError(f'Tarefa sem job único: {kind}')
+    values = {'kind': kind, 'params': json.dumps(params or {}), 'created_by_id': user_id}
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert_fn = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert_fn(Job).values(values)\
+            .on_conflict_do_nothing(index_elements=[Job.kind], index_where=ACTIVE_UNIQUE_WHERE)\
+            .returning(Job.id)
+        return db.session.execute(stmt).scalar()
+
+    active = db.session.scalar(select(Job.id).where(Job.kind == kind, Job.status.in_(ACTIVE_STATUSES)).limit(1))
+    return None if active is not None else enqueue(kind, params, user_id).id
+
+
+def job_status(row):
+    """Dicionário público do job (JSON de /reports/jobs/<id>)."""
+    return {
+        'id': row.id, 'kind': row.kind, 'status': row.status, 'progress': row.progress,
+        'message': row.message, 'attempts': row.attempts,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'finished_at': row.finished_at.isoformat() if row.finished_at else None,
+        'has_result': row.status == 'done' and row.result_file is not None,
+    }
+
+
+# --- EXECUÇÃO ---
+
+class JobContext:
+    """O que o handler recebe: pasta de resultado e o canal de progresso."""
+
+    def __init__(self, job_id, worker, attempt, folder):
+        self.job_id = job_id
+        self.folder = folder
+        self.message = None
+        self._owner = (Job.id == job_id) & (Job.worker == worker) & (Job.attempts == attempt)
+        self._engine = db.engine
+
+    def path(self, filename):
+        return os.path.join(self.folder, filename)
+
+    @contextmanager
+    def open(self, filename, mode='wb'):
+        """Arquivo de resultado escrito num temporário e renomeado no fim (tentativa repetida não corrompe)."""
+        os.makedirs(self.folder, exist_ok=True)
+        tmp = self.path(f'.{filename}.{os.getpid()}.tmp')
+        try:
+            with open(tmp, mode) as out:
+                yield out
+            os.replace(tmp, self.path(filename))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def touch(self, **values):
+        """Grava progresso/heartbeat por uma conexão própria (fora da transação do handler)."""
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(update(Job).where(self._owner, Job.status == 'running')
+                             .values(heartbeat_at=datetime.now(), **values))
+        except OperationalError:
+            # SQLite ocupado por uma leitura longa do próprio handler: fica para a próxima
+            logger.warning('Job %s: heartbeat adiado (banco ocupado)', self.job_id)
+
+    def progress(self, count, message=None):
+        if message is not None:
+            self.message = message[:255]
+        self.touch(progress=count, message=self.message)
+
+
+def _worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def requeue_stale(stale_seconds=None, worker=None):
+    """
+    Devolve à fila os jobs 'running' sem heartbeat há 'stale_seconds' (ou os
+    do 'worker' informado, que morreu). Quem esgotou as tentativas vira
+    'failed'. Retorna quantos voltaram para a fila.
+    """
+    config = current_app.config
+    if worker is not None:
+        condition = Job.worker == worker
+    else:
+        limit = datetime.now() - timedelta(seconds=stale_seconds or config['JOB_STALE_SECONDS'])
+        condition = Job.heartbeat_at < limit
+    running = (Job.status == 'running') & condition
+    requeued = db.session.execute(
+        update(Job).where(running, Job.attempts < config['JOB_MAX_ATTEMPTS'])
+        .values(status='queued', worker=None, message='Reenfileirado: o worker parou de responder.')
+    ).rowcount
+    db.session.execute(
+        update(Job).where(running).values(status='failed', finished_at=datetime.now(),
+                                          message='Abandonado: o worker parou em todas as tentativas.'))
+    db.session.commit()
+    return requeued
+
+
+def claim(worker):
+    """Reserva o próximo job da fila para 'worker' (None = fila vazia)."""
+    while True:
+        job_id = db.session.execute(
+            select(Job.id).where(Job.status == 'queued').order_by(Job.id).limit(1)).scalar()
+        if job_id is None:
+            db.session.commit()
+            return None
+        now = datetime.now()
+        claimed = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', worker=worker, attempts=Job.attempts + 1,
+                    started_at=now, heartbeat_at=now)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+        # Outro processo levou antes: tenta o próximo
+
+
+def _finish(ctx, **values):
+    values['finished_at'] = datetime.now()
+    with ctx._engine.begin() as conn:
+        return conn.execute(update(Job).where(ctx._owner, Job.status == 'running').values(**values)).rowcount
+
+
+def execute(row, worker):
+    """Roda um job já reservado por 'worker' e grava o resultado."""
+    config = current_app.config
+    ctx = JobContext(row.id, worker, row.attempts, job_folder(row.id))
+    kind, params = row.kind, json.loads(row.params or '{}')
+    db.session.commit() # o handler começa com a sessão limpa
+
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(config['JOB_HEARTBEAT_SECONDS']):
+            ctx.touch()
+
+    heartbeat = threading.Thread(target=beat, name=f'job-{row.id}-heartbeat', daemon=True)
+    heartbeat.start()
+    started = time.perf_counter()
+    failure = None
+    try:
+        handler = HANDLERS.get(kind)
+        if handler is None:
+            raise ValueError(f'Tarefa desconhecida: {kind}')
+        result_file = handler(ctx, **params)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('Job %s (%s) falhou', ctx.job_id, kind)
+        failure = str(e)[:255] or type(e).__name__
+    finally:
+        # Heartbeat parado antes de gravar o fim: um touch atrasado não disputa
+        # o banco com o _finish
+        stop.set()
+        heartbeat.join()
+
+    if failure is not None:
+        _finish(ctx, status='failed', message=failure)
+        return False
+    written = _finish(ctx, status='done', result_file=result_file, message=ctx.message)
+    logger.info('Job %s (%s) concluído em %.1fs', ctx.job_id, kind, time.perf_counter() - started)
+    return bool(written)
+
+
+def prune(days=None):
+    """Apaga jobs terminados há mais de 'days' dias (padrão: JOB_RESULT_DAYS) e seus arquivos."""
+    days = current_app.config['JOB_RESULT_DAYS'] if days is None else days
+    limit = datetime.now() - timedelta(days=days)
+    old = (Job.status.not_in(ACTIVE_STATUSES)) & (Job.finished_at < limit)
+    ids = db.session.scalars(select(Job.id).where(old)).all()
+    for job_id in ids:
+        shutil.rmtree(job_folder(job_id), ignore_errors=True)
+    if ids:
+        db.session.execute(Job.__table__.delete().where(Job.__table__.c.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
+
+
+def run_worker(once=False, should_stop=None):
+    """Laço de um processo de worker: recupera órfãos, pega o próximo job e executa."""
+    worker = _worker_name()
+    poll = current_app.config['JOB_POLL_SECONDS']
+    last_prune = 0.0
+    processed = 0
+    while not (should_stop and should_stop()):
+        if time.monotonic() - last_prune > PRUNE_INTERVAL:
+            prune()
+            last_prune = time.monotonic()
+        requeue_stale()
+        row = claim(worker)
+        if row is None:
+            if once:
+                return processed
+            time.sleep(poll)
+            continue
+        execute(row, worker)
+        processed += 1
+    return processed
+
+
+def _child_main():
+    # Processo novo (spawn): app e conexões próprias, nada herdado do supervisor
+    from app import create_app
+    app = create_app()
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C vai para o grupo todo: quem para os filhos é o supervisor
+    with app.app_context():
+        run_worker(should_stop=stopping.is_set)
+
+
+def supervise(processes, echo=print):
+    """
+    Mantém 'processes' filhos rodando run_worker(). Filho que morre tem o job
+    devolvido à fila na hora e é substituído. SIGTERM/SIGINT param todos
+    depois do job em andamento.
+    """
+    context = multiprocessing.get_context('spawn')
+    hostname = socket.gethostname()
+    stopping = threading.Event()
+
+    def stop(*args):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    def start():
+        child = context.Process(target=_child_main, name='stock-worker')
+        child.start()
+        echo(f"    worker {child.pid} iniciado")
+        return child
+
+    children = [start() for _ in range(processes)]
+    try:
+        while not stopping.wait(1):
+            for i, child in enumerate(children):
+                if child.is_alive():
+                    continue
+                requeued = requeue_stale(worker=f'{hostname}:{child.pid}')
+                echo(f"[!] worker {child.pid} terminou (código {child.exitcode}); {requeued} job(s) de volta à fila")
+                children[i] = start()
+    finally:
+        for child in children:
+            if child.is_alive():
+                child.terminate() # SIGTERM: o filho termina o job atual e sai
+        for child in children:
+            child.join()
+
+
+# --- TAREFAS ---
+
+@job('export_csv')
+def export_csv_job(ctx, columns, gzip=False):
+    """Exportação do estoque (mesmo CSV de /reports/export/csv) para arquivo."""
+    from app.exports import DEFAULT_BATCH_SIZE, gzip_chunks, iter_csv
+    filename = 'estoque_completo.csv' + ('.gz' if gzip else '')
+    chunks = iter_csv(columns)
+    if gzip:
+        chunks = gzip_chunks(chunks)
+    with ctx.open(filename) as out, reading_from_replica():
+        for number, chunk in enumerate(chunks):
+            out.write(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+            if number and number % 50 == 0:
+                ctx.progress(number * DEFAULT_BATCH_SIZE)
+    return filename
+
+
+@job('import')
+def import_job(ctx, kind, filename, fmt=None, user_id=None):
+    """Importação de planilha enviada pela web (mesmos importadores do 'flask import'; upsert, pode repetir)."""
+    from app.importer import IMPORTERS, read_records
+    result = IMPORTERS[kind](read_records(ctx.path(filename), fmt), user_id=user_id,
+                             progress=lambda r: ctx.progress(r.processed, f'{r.skipped} linhas ignoradas'))
+    ctx.message = f'{result.processed} {kind} importados, {result.skipped} linhas ignoradas.'
+    if not result.errors:
+        return None
+    with ctx.open('erros.txt') as out:
+        for line, message in result.errors:
+            out.write(f'Linha {line}: {message}\n'.encode('utf-8'))
+    return 'erros.txt'
+
+
+@job('analytics')
+def analytics_job(ctx, day=None):
+    """Indicadores do dia (ABC, giro, cobertura): aquece o cache e deixa o JSON para download."""
+    from app.analytics import inventory_analytics
+    with reading_from_replica():
+        data = inventory_analytics(date.fromisoformat(day) if day else None)
+    with ctx.open('indicadores.json') as out:
+        out.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+    return 'indicadores.json'
@@ -0,0 +1,296 @@
+"""
+Razão de estoque (ledger): toda alteração de saldo passa por aqui.
+
+O saldo nunca é lido no Python para depois ser gravado (ler-modificar-gravar
+permitia que dois OUT simultâneos, em workers diferentes, passassem na mesma
+checagem e vendessem o que não existe). Em vez disso usamos um UPDATE
+condicional:
+
+    UPDATE product SET quantity = quantity - :q
+     WHERE id = :id AND quantity >= :q
+
+O banco garante a atomicidade: no PostgreSQL a linha fica travada só durante
+o UPDATE e o WHERE é reavaliado após a trava; no SQLite a escrita é serial.
+Se nenhuma linha for afetada, o saldo era insuficiente.
+
+Também concentra o lançamento em lote da API de coletores: o lote inteiro é
+validado com UMA busca de produtos e gravado com um UPDATE condicional por
+produto e um INSERT em massa de Movement, tudo na mesma transação.
+"""
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import case, insert, or_, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.events import publish_after_commit
+from app.extensions import db
+from app.models import Movement, Product
+from app.stock_stats import ProductState, apply_changes
+
+MOVEMENT_TYPES = ('IN', 'OUT')
+
+
+class ProductNotFound(LookupError):
+    """Produto inexistente ou arquivado."""
+
+    def __init__(self, product_id):
+        super().__init__(f'Produto {product_id} não encontrado.')
+        self.product_id = product_id
+
+
+class InsufficientStock(Exception):
+    """O saldo atual não cobre a saída pedida."""
+
+    def __init__(self, product_id, available):
+        super().__init__(f'Saldo insuficiente! Estoque atual: {available}')
+        self.product_id = product_id
+        self.available = available
+
+
+def notify_level_change(product_id, before, after):
+    """Avisa (após o commit) quando o saldo cruza o estoque mínimo."""
+    if before.quantity > before.min_level >= after.quantity:
+        publish_after_commit('stock_low', product_id=product_id, quantity=after.quantity, min_level=after.min_level)
+    elif before.quantity <= before.min_level < after.quantity:
+        publish_after_commit('stock_ok', product_id=product_id, quantity=after.quantity, min_level=after.min_level)
+
+
+def change_stock(product_id, delta, required=None):
+    """
+    Soma 'delta' ao saldo do produto de forma atômica.
+
+    'required' é o saldo mínimo exigido antes da alteração (padrão: -delta para
+    saídas, nenhum para entradas). Retorna (estado_antes, estado_depois) para os
+    KPIs. Levanta ProductNotFound ou InsufficientStock sem alterar nada.
+    Não faz commit.
+    """
+    if required is None:
+        required = -delta if delta < 0 else None
+
+    stmt = update(Product)\
+        .where(Product.id == product_id, Product.active.is_(True))\
+        .values(quantity=Product.quantity + delta)\
+        .returning(Product.quantity, Product.category_id, Product.cost, Product.price, Product.min_level)
+    if required:
+        stmt = stmt.where(Product.quantity >= required)
+
+    row = db.session.execute(stmt, execution_options={'synchronize_session': False}).first()
+    if row is None:
+        available = db.session.query(Product.quantity)\
+            .filter(Product.id == product_id, Product.active.is_(True)).scalar()
+        if available is None:
+            raise ProductNotFound(product_id)
+        raise InsufficientStock(product_id, available)
+
+    # Mantém o objeto da sessão (se carregado) com o saldo novo
+    loaded = db.session.identity_map.get(db.session.identity_key(Product, product_id))
+    if loaded is not None:
+        set_committed_value(loaded, 'quantity', row.quantity)
+
+    after = ProductState(category_id=row.category_id, quantity=row.quantity, cost=row.cost or 0.0,
+                         price=row.price or 0.0, min_level=row.min_level if row.min_level is not None else 5)
+    before = after._replace(quantity=row.quantity - delta)
+    notify_level_change(product_id, before, after)
+    return before, after
+
+
+def record_movement(product_id, mov_type, quantity, user_id):
+    """
+    Lança UMA movimentação: altera o saldo atomicamente, grava o Movement e
+    atualiza os KPIs. Retorna o Movement criado. Não faz commit.
+    """
+    if mov_type not in MOVEMENT_TYPES:
+        raise ValueError("Tipo inválido (use 'IN' ou 'OUT').")
+    if quantity <= 0:
+        raise ValueError('Quantidade deve ser maior que zero.')
+
+    before, after = change_stock(product_id, quantity if mov_type == 'IN' else -quantity)
+    apply_changes([(before, after)])
+
+    movement = Movement(type=mov_type, quantity=quantity, product_id=product_id, user_id=user_id)
+    db.session.add(movement)
+    return movement
+
+
+
+def receive_stock(counts, user_id):
+    """
+    Entrada em massa (conferência de recebimento).
+
+    'counts' é {product_id: quantidade}. Todas as somas saem em UM UPDATE
+    (quantity = quantity + CASE id ...) e todos os Movement em UM INSERT,
+    em vez de um SELECT + UPDATE + INSERT por linha da nota.
+    Não faz commit.
+    """
+    counts = {product_id: qty for product_id, qty in counts.items() if qty}
+    if not counts:
+        return 0
+    if any(qty < 0 for qty in counts.values()):
+        raise ValueError('Quantidade recebida não pode ser negativa.')
+
+    stmt = update(Product)\
+        .where(Product.id.in_(counts))\
+        .values(quantity=Product.quantity + case(counts, value=Product.id, else_=0))\
+        .returning(Product.id, Product.quantity, Product.category_id, Product.cost,
+                   Product.price, Product.min_level, Product.active)
+    rows = db.session.execute(stmt, execution_options={'synchronize_session': False}).all()
+    if len(rows) != len(counts):
+        missing = set(counts) - {row.id for row in rows}
+        raise ProductNotFound(min(missing))
+
+    changes = []
+    for row in rows:
+        loaded = db.session.identity_map.get(db.session.identity_key(Product, row.id))
+        if loaded is not None:
+            set_committed_value(loaded, 'quantity', row.quantity)
+        if row.active is False:
+            continue # arquivado não entra nos KPIs
+        after = ProductState(category_id=row.category_id, quantity=row.quantity, cost=row.cost or 0.0,
+                             price=row.price or 0.0, min_level=row.min_level if row.min_level is not None else 5)
+        before = after._replace(quantity=row.quantity - counts[row.id])
+        notify_level_change(row.id, before, after)
+        changes.append((before, after))
+
+    now = datetime.now()
+    db.session.execute(insert(Movement), [
+        {'type': 'IN', 'quantity': qty, 'product_id': product_id, 'user_id': user_id, 'date': now}
+        for product_id, qty in counts.items()
+    ])
+
+    apply_changes(changes)
+    return len(counts)
+
+def _parse_line(raw):
+    """Valida o formato de uma linha. Retorna (dados, erro)."""
+    if not isinstance(raw, dict):
+        return None, 'Linha deve ser um objeto JSON.'
+
+    mov_type = str(raw.get('type', '')).upper()
+    if mov_type not in MOVEMENT_TYPES:
+        return None, "Tipo inválido (use 'IN' ou 'OUT')."
+
+    try:
+        quantity = int(raw.get('quantity'))
+    except (ValueError, TypeError):
+        return None, 'Quantidade inválida.'
+    if quantity <= 0:
+        return None, 'Quantidade deve ser maior que zero.'
+
+    product_id = raw.get('product_id')
+    sku = raw.get('sku')
+    if product_id is None and not sku:
+        return None, "Informe 'product_id' ou 'sku'."
+    try:
+        product_id = int(product_id) if product_id is not None else None
+    except (ValueError, TypeError):
+        return None, 'product_id inválido.'
+
+    return {'type': mov_type, 'quantity': quantity, 'product_id': product_id, 'sku': sku}, None
+
+
+def _fetch_products(lines):
+    """Uma única query para todos os produtos citados no lote (por id ou SKU)."""
+    ids = {line['product_id'] for line in lines if line['product_id'] is not None}
+    skus = {line['sku'] for line in lines if line['product_id'] is None}
+
+    conditions = []
+    if ids:
+        conditions.append(Product.id.in_(ids))
+    if skus:
+        conditions.append(Product.sku.in_(skus))
+    if not conditions:
+        return {}, {}
+
+    products = Product.query.filter(Product.active.is_(True), or_(*conditions)).all()
+    return {p.id: p for p in products}, {p.sku: p for p in products}
+
+
+def post_movements(raw_lines, user_id, atomic=True):
+    """
+    Valida e lança um lote de movimentações.
+
+    atomic=True  -> tudo ou nada: qualquer linha inválida cancela o lote.
+    atomic=False -> linhas válidas são lançadas, as inválidas voltam com erro.
+
+    Retorna (aplicadas, resultados), onde resultados tem um item por linha.
+    Não faz commit: quem chama decide (a rota faz um único commit).
+    """
+    results = []
+    parsed = []
+    for index, raw in enumerate(raw_lines):
+        line, error = _parse_line(raw)
+        results.append({'line': index, 'ok': error is None, 'error': error})
+        parsed.append(line)
+
+    by_id, by_sku = _fetch_products([line for line in parsed if line])
+
+    # Simula os saldos na ordem das linhas (um OUT pode depender de um IN anterior).
+    # Guardamos por produto: variação líquida e o menor ponto atingido no caminho,
+    # que vira o saldo mínimo exigido no UPDATE condicional.
+    balances = OrderedDict()
+    plan = OrderedDict()
+    accepted = []
+    for index, line in enumerate(parsed):
+        if line is None:
+            continue
+        product = by_id.get(line['product_id']) if line['product_id'] is not None else by_sku.get(line['sku'])
+        if product is None:
+            results[index].update(ok=False, error='Produto não encontrado.')
+            continue
+
+        balance = balances.get(product.id, product.quantity or 0)
+        if line['type'] == 'OUT':
+            if balance < line['quantity']:
+                results[index].update(ok=False, error=f'Saldo insuficiente! Estoque atual: {balance}')
+                continue
+            balance -= line['quantity']
+        else:
+            balance += line['quantity']
+
+        balances[product.id] = balance
+        net, lowest = plan.get(product.id, (0, 0))
+        net += line['quantity'] if line['type'] == 'IN' else -line['quantity']
+        plan[product.id] = (net, min(lowest, net))
+        results[index].update(product_id=product.id, balance=balance)
+        accepted.append((index, product, line))
+
+    failed = any(not r['ok'] for r in results)
+    if not accepted or (atomic and failed):
+        return 0, results
+
+    # 1. Saldos: um UPDATE condicional por produto (não por linha).
+    # Se outro worker consumiu o estoque entre a leitura e a gravação, o UPDATE
+    # não afeta a linha e o produto é recusado (ou o lote inteiro, se atômico).
+    changes = []
+    refused = set()
+    for product_id, (net, lowest) in plan.items():
+        try:
+            changes.append(change_stock(product_id, net, required=-lowest))
+        except (InsufficientStock, ProductNotFound):
+            if atomic:
+                raise
+            refused.add(product_id)
+
+    if refused:
+        for index, product, line in accepted:
+            if product.id in refused:
+                results[index].update(ok=False, error='Saldo alterado por outra operação. Tente novamente.')
+                results[index].pop('balance', None)
+        accepted = [entry for entry in accepted if entry[1].id not in refused]
+
+    if not accepted:
+        return 0, results
+
+    # 2. Histórico: um INSERT em massa
+    now = datetime.now()
+    db.session.execute(insert(Movement), [
+        {'type': line['type'], 'quantity': line['quantity'], 'product_id': product.id,
+         'user_id': user_id, 'date': now}
+        for _, product, line in accepted
+    ])
+
+    # 3. KPIs do relatório
+    apply_changes(changes)
+
+    return len(accepted), results
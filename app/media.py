@@ -0,0 +1,207 @@
+"""
+Imagens enviadas (fotos de produto, logos de fornecedor) guardadas pelo conteúdo.
+
+Antes cada upload ia para static/uploads do jeito que chegou (até
+MAX_CONTENT_LENGTH): as listagens baixavam o original inteiro para mostrar um
+quadradinho de 40px, a mesma foto enviada duas vezes ocupava o dobro e logos
+com o mesmo nome de arquivo se sobrescreviam. Aqui:
+
+    - store(arquivo) grava o original em MEDIA_FOLDER/ab/<sha256>.<ext>. O
+      nome é o hash do conteúdo: envio repetido não ocupa espaço de novo e
+      nada é sobrescrito. A chave '<sha256>.<ext>' é o que vai para o banco;
+    - as variantes (WebP reduzidos, MEDIA_VARIANTS) são geradas fora da
+      requisição, num pool de threads por processo (o Pillow solta o GIL
+      durante decodificação e redimensionamento);
+    - /media/<chave> e /media/<variante>/<chave> respondem com Cache-Control
+      immutable de um ano: o conteúdo de uma URL nunca muda. Variante ainda
+      na fila sai como o original, sem cache longo;
+    - media_url(chave, 'thumb') nos templates. Chaves antigas (nome do arquivo
+      em static/uploads) continuam servidas de lá até 'flask media-migrate'.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort, current_app, send_from_directory, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import select, update
+
+from app.extensions import db
+from app.models import Product, Supplier
+from app.reference_data import mark_changed
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}\.[a-z]+$')
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+READ_SIZE = 64 * 1024
+ONE_YEAR = 365 * 24 * 3600
+WEBP_QUALITY = 80
+
+logger = logging.getLogger(__name__)
+
+
+class MediaError(Exception):
+    pass
+
+
+def _new_pool(app):
+    # As threads só nascem no primeiro submit: seguro criar antes do fork do gunicorn
+    return ThreadPoolExecutor(max_workers=app.config['MEDIA_WORKERS'], thread_name_prefix='media')
+
+
+def init_app(app):
+    app.extensions['media_pool'] = _new_pool(app)
+    app.add_url_rule('/media/<key>', 'media', serve, defaults={'variant': None})
+    app.add_url_rule('/media/<variant>/<key>', 'media', serve)
+    app.add_template_global(media_url)
+
+
+def is_key(value):
+    return bool(value) and KEY_PATTERN.match(value) is not None
+
+
+def _relative(name):
+    return f'{name[:2]}/{name}'
+
+
+def _variant_name(key, variant):
+    return f'{key.split(".")[0]}_{variant}.webp'
+
+
+def store(file):
+    """
+    Grava o upload (FileStorage ou arquivo binário aberto) pelo hash do
+    conteúdo e agenda as variantes. Retorna a chave. Levanta MediaError se
+    não for uma imagem suportada.
+    """
+    folder = current_app.config['MEDIA_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    stream = getattr(file, 'stream', file)
+    digest = hashlib.sha256()
+    # Copia em blocos para um temporário na mesma pasta (o os.replace final é atômico)
+    with tempfile.NamedTemporaryFile(dir=folder, suffix='.upload', delete=False) as tmp:
+        for chunk in iter(lambda: stream.read(READ_SIZE), b''):
+            digest.update(chunk)
+            tmp.write(chunk)
+
+    try:
+        with Image.open(tmp.name) as image:
+            image_format = image.format
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        os.remove(tmp.name)
+        raise MediaError('O arquivo enviado não é uma imagem válida.')
+    if image_format not in FORMATS:
+        os.remove(tmp.name)
+        raise MediaError(f'Formato de imagem não suportado: {image_format}.')
+
+    key = f'{digest.hexdigest()}.{FORMATS[image_format]}'
+    path = os.path.join(folder, _relative(key))
+    if os.path.exists(path):
+        os.remove(tmp.name) # mesmo conteúdo já guardado
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp.name, path)
+    generate_variants_async(key)
+    return key
+
+
+def generate_variants(folder, key, variants):
+    """Gera as variantes que faltam de 'key' (idempotente). Não usa o contexto da app."""
+    pending = {name: size for name, size in variants.items()
+               if not os.path.exists(os.path.join(folder, _relative(_variant_name(key, name))))}
+    if not pending:
+        return
+    with Image.open(os.path.join(folder, _relative(key))) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        for name, size in pending.items():
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+            target = os.path.join(folder, _relative(_variant_name(key, name)))
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.webp')
+            with os.fdopen(fd, 'wb') as out:
+                variant.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+            os.replace(tmp, target)
+
+
+def _generate_logged(folder, key, variants):
+    try:
+        generate_variants(folder, key, variants)
+    except Exception:
+        logger.exception('Falha ao gerar as variantes de %s', key)
+        raise
+
+
+def generate_variants_async(key):
+    """Agenda a geração das variantes no pool do processo. Retorna o Future."""
+    config = current_app.config
+    return current_app.extensions['media_pool'].submit(
+        _generate_logged, config['MEDIA_FOLDER'], key, dict(config['MEDIA_VARIANTS']))
+
+
+def drain():
+    """Espera todas as variantes agendadas neste processo (comandos CLI, testes)."""
+    app = current_app._get_current_object()
+    app.extensions['media_pool'].shutdown(wait=True)
+    app.extensions['media_pool'] = _new_pool(app)
+
+
+def serve(key, variant):
+    config = current_app.config
+    if not is_key(key) or (variant is not None and variant not in config['MEDIA_VARIANTS']):
+        abort(404)
+    folder = config['MEDIA_FOLDER']
+    name = key if variant is None else _variant_name(key, variant)
+    if not os.path.exists(os.path.join(folder, _relative(name))):
+        if variant is None or not os.path.exists(os.path.join(folder, _relative(key))):
+            abort(404)
+        # Variante ainda na fila (ou criada depois do upload): entrega o original por ora
+        generate_variants_async(key)
+        return send_from_directory(folder, _relative(key), max_age=0)
+
+    response = send_from_directory(folder, _relative(name), max_age=ONE_YEAR)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def media_url(key, variant=None, legacy_folder='uploads'):
+    """URL da imagem (ou da variante). Chaves antigas apontam para static/<legacy_folder>/."""
+    if not key:
+        return None
+    if not is_key(key):
+        return url_for('static', filename=f'{legacy_folder}/{key}')
+    if variant is None:
+        return url_for('media', key=key)
+    return url_for('media', variant=variant, key=key)
+
+
+def migrate_legacy():
+    """
+    Passa as imagens antigas (nome do arquivo em static/uploads) para o
+    armazenamento por conteúdo e troca as chaves no banco. Não faz commit.
+    Retorna (registros atualizados, arquivos não encontrados).
+    """
+    updated, missing = 0, []
+    for model, column, folder in ((Product, Product.image_file, 'uploads'),
+                                  (Supplier, Supplier.logo, 'uploads/suppliers')):
+        names = db.session.scalars(select(column).where(column.is_not(None)).distinct()).all()
+        for name in names:
+            if is_key(name) or name == 'default.jpg':
+                continue
+            path = os.path.join(current_app.static_folder, folder, name)
+            if not os.path.isfile(path):
+                missing.append(f'{folder}/{name}')
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    key = store(f)
+            except MediaError:
+                missing.append(f'{folder}/{name}')
+                continue
+            updated += db.session.execute(update(model).where(column == name).values({column.key: key})).rowcount
+    mark_changed('products', 'suppliers') # image_file e logo mudaram por UPDATE direto
+    return updated, missing
@@ -1,12 +1,8 @@
-from app.extensions import db, login_manager
+from app.extensions import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
-
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
@@ -65,6 +61,13 @@ class Product(db.Model):
     # Relacionamento com Itens de Pedido (Novo)
     order_items = db.relationship('PurchaseOrderItem', backref='product', lazy=True)
 
+    # Índices dos caminhos quentes (listagem de ativos por nome, produtos por fornecedor).
+    # (active, name, id) serve a paginação por chave da tela de estoque.
+    __table_args__ = (
+        db.Index('ix_product_active_name', 'active', 'name', 'id'),
+        db.Index('ix_product_supplier_id', 'supplier_id', 'active'),
+    )
+
 class Movement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(10), nullable=False) 
@@ -76,6 +79,38 @@ class Movement(db.Model):
 
     user = db.relationship('User', backref='movements')
 
+    # Abas "Hoje/Histórico" (por usuário) e extrato do produto, sempre por data
+    __table_args__ = (
+        db.Index('ix_movement_user_date', 'user_id', 'date'),
+        db.Index('ix_movement_product_date', 'product_id', 'date'),
+    )
+
+
+class MovementArchive(db.Model):
+    """
+    Movimentações antigas, tiradas da tabela quente pelo 'flask archive-movements'
+    (mesmas colunas e mesmo id). No PostgreSQL é particionada por mês (RANGE em
+    date, partições criadas sob demanda); no SQLite é uma tabela comum.
+    As telas de histórico só consultam aqui quando precisam (ver app/archive.py).
+    """
+    __tablename__ = 'movement_archive'
+
+    # A chave de partição precisa fazer parte da PK no PostgreSQL
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    date = db.Column(db.DateTime, primary_key=True)
+    type = db.Column(db.String(10), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_movement_archive_product_date', 'product_id', 'date'),
+        db.Index('ix_movement_archive_user_date', 'user_id', 'date'),
+        db.Index('ix_movement_archive_date', 'date'),
+        {'postgresql_partition_by': 'RANGE (date)'},
+    )
+
 
 # --- NOVAS TABELAS PARA CONFERÊNCIA DE RECEBIMENTO ---
 
@@ -105,6 +140,13 @@ class PurchaseOrder(db.Model):
     # Itens deste pedido
     items = db.relationship('PurchaseOrderItem', backref='order', lazy=True, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Contador de pendentes (menu) e listagem
+        db.Index('ix_purchase_order_status', 'status'),
+        # Trava de duplicidade: a mesma NF não entra duas vezes para o mesmo fornecedor
+        db.Index('uq_purchase_order_supplier_invoice', 'supplier_id', 'invoice_number', unique=True),
+    )
+
 class PurchaseOrderItem(db.Model):
     """
     Representa cada linha do pedido.
@@ -120,4 +162,108 @@ class PurchaseOrderItem(db.Model):
     quantity_received = db.Column(db.Integer, default=0)      # Quanto o funcionário contou no caminhão
     
     # Custo unitário nesta nota específica (pode variar da tabela de produtos)
-    unit_cost = db.Column(db.Float, default=0.0)
\ No newline at end of file
+    unit_cost = db.Column(db.Float, default=0.0)
+
+    # Itens de um pedido (order.items) e checagem "item já adicionado?"
+    __table_args__ = (
+        db.Index('ix_purchase_order_item_order_product', 'purchase_order_id', 'product_id'),
+    )
+
+# --- FOTOS DIÁRIAS DO SALDO (HISTÓRICO) ---
+
+class StockSnapshot(db.Model):
+    """
+    Saldo de um produto num instante, pela soma do extrato (Movement) com
+    date < taken_at. Gerado em lote (flask snapshot-stock) só para os produtos
+    que movimentaram desde a foto anterior: o saldo em qualquer data é a foto
+    mais próxima antes dela + as movimentações seguintes (ver app/snapshots.py).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        # "Última foto do produto até X" e a unicidade de uma foto por rodada
+        db.Index('uq_stock_snapshot_product_taken', 'product_id', 'taken_at', unique=True),
+        db.Index('ix_stock_snapshot_taken_at', 'taken_at'),
+    )
+
+# --- DEMANDA POR PRODUTO (SUGESTÃO DE COMPRA) ---
+
+class ProductDemand(db.Model):
+    """
+    Consumo diário (saídas) de um produto como média móvel exponencial,
+    atualizada em lote só com as movimentações novas (ver app/replenishment.py).
+    Os valores valem para os dias ANTERIORES a 'as_of'; dias sem saída depois
+    disso são aplicados na leitura (decaimento).
+    """
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    daily_mean = db.Column(db.Float, nullable=False, default=0.0)   # média móvel das saídas/dia
+    daily_square = db.Column(db.Float, nullable=False, default=0.0) # média móvel de (saídas/dia)²
+    as_of = db.Column(db.Date, nullable=False)
+
+# --- AGREGADOS DE ESTOQUE (KPIs DO RELATÓRIO) ---
+
+class StockSummary(db.Model):
+    """
+    Totais de estoque por categoria, mantidos incrementalmente.
+    Uma linha por categoria (category_id NULL = produtos sem categoria).
+    Os totais globais são a soma dessas poucas linhas.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
+
+    product_count = db.Column(db.Integer, default=0, nullable=False)
+    total_quantity = db.Column(db.Integer, default=0, nullable=False)
+    total_cost = db.Column(db.Float, default=0.0, nullable=False)      # soma de quantity * cost
+    total_revenue = db.Column(db.Float, default=0.0, nullable=False)   # soma de quantity * price
+    low_stock_count = db.Column(db.Integer, default=0, nullable=False) # quantity <= min_level
+
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    category = db.relationship('Category')
+
+    __table_args__ = (
+        # Único por categoria, inclusive NULL: coalesce(category_id, 0) garante uma só
+        # linha "sem categoria" (ids de categoria começam em 1)
+        db.Index('uq_stock_summary_category_key', db.func.coalesce(category_id, 0), unique=True),
+    )
+
+# --- TAREFAS EM SEGUNDO PLANO (EXPORTAÇÕES, IMPORTAÇÕES, RELATÓRIOS) ---
+
+# Tarefas com no máximo um job na fila/rodando (ver enqueue_unique em app/jobs.py)
+UNIQUE_KINDS = ('analytics',)
+ACTIVE_UNIQUE_WHERE = db.text("kind IN ('analytics') AND status IN ('queued', 'running')")
+
+class Job(db.Model):
+    """
+    Tarefa pesada enfileirada pela web e executada pelo 'flask worker'
+    (ver app/jobs.py). O resultado, se houver, é um arquivo em JOBS_FOLDER.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')          # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued, running, done, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)         # linhas/itens processados
+    message = db.Column(db.String(255))
+    result_file = db.Column(db.String(255))                             # nome dentro da pasta do job
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(64))                                   # host:pid de quem executa
+
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    created_by = db.relationship('User')
+
+    __table_args__ = (
+        # Fila (próximo 'queued' por id) e varredura de 'running' sem heartbeat
+        db.Index('ix_job_status_id', 'status', 'id'),
+        db.Index('ix_job_created_by_id', 'created_by_id', 'id'),
+        # Um job ativo por tarefa única: duas requisições ao mesmo tempo não enfileiram dois
+        db.Index('uq_job_active_kind', 'kind', unique=True,
+                 sqlite_where=ACTIVE_UNIQUE_WHERE, postgresql_where=ACTIVE_UNIQUE_WHERE),
+    )
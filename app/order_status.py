@@ -0,0 +1,80 @@
+"""
+Contador de recebimentos pendentes (menu, alertas e telas de conferência).
+
+Antes cada render do blueprint de estoque fazia um COUNT em purchase_order.
+Agora o contador e uma "versão" (que muda sempre que algum pedido é criado,
+finalizado ou excluído) ficam num cache com TTL curto, invalidado pelas rotas
+que mexem em pedidos. Os navegadores recebem os avisos por SSE (/events/stream)
+ou consultam só /orders/status em JSON, e recarregam a página apenas quando a
+versão muda.
+"""
+import time
+
+from flask import current_app
+from sqlalchemy import case, func
+
+from app.cache import TTLCache
+from app.events import get_bus
+from app.extensions import db
+from app.models import PurchaseOrder
+
+CACHE_KEY = 'pending_orders'
+
+
+def _cache():
+    # Um cache por aplicação (cada worker/teste tem o seu)
+    return current_app.extensions.setdefault('order_status_cache', TTLCache())
+
+
+def _load_status():
+    """
+    Uma única query agregada: total pendente + marcas para a versão. O total de
+    pedidos entra na versão: excluir um pedido que não é o mais novo não muda
+    max(id) nem a última alteração.
+    """
+    pending, total, last_id, last_change = db.session.query(
+        func.count(case((PurchaseOrder.status == 'pending', 1))),
+        func.count(PurchaseOrder.id),
+        func.max(PurchaseOrder.id),
+        func.max(func.coalesce(PurchaseOrder.updated_at, PurchaseOrder.created_at)),
+    ).one()
+
+    stamp = int(last_change.timestamp()) if hasattr(last_change, 'timestamp') else last_change
+    return pending, f'{pending}-{total}-{last_id or 0}-{stamp or 0}'
+
+
+def pending_status():
+    """Retorna (quantidade_pendente, versão), usando o cache."""
+    ttl = current_app.config['PENDING_STATUS_TTL']
+    return _cache().get_or_set(CACHE_KEY, _load_status, ttl)
+
+
+def invalidate_pending_status():
+    """Chamado pelas rotas depois de criar/finalizar/excluir um pedido."""
+    _cache().delete(CACHE_KEY)
+
+
+def notify_order_change(event_type, order_id):
+    """
+    Chamado pelas rotas DEPOIS do commit de um pedido: invalida o contador e
+    avisa as telas conectadas via SSE ('order_created', 'order_completed'...).
+    """
+    invalidate_pending_status()
+    get_bus().publish(event_type, order_id=order_id)
+
+
+def wait_for_change(since, timeout):
+    """
+    Long-poll: espera até a versão ser diferente de 'since' ou o tempo acabar.
+    Cada volta lê do cache, então N clientes esperando geram no máximo uma
+    query por TTL neste processo. Só com workers assíncronos (ver
+    longpoll_enabled em app/events.py): num worker síncrono o sleep o prende.
+    """
+    interval = current_app.config['PENDING_POLL_INTERVAL']
+    deadline = time.monotonic() + timeout
+    status = pending_status()
+    while status[1] == since and time.monotonic() < deadline:
+        db.session.close() # a conexão do banco volta ao pool durante a espera
+        time.sleep(interval)
+        status = pending_status()
+    return status
@@ -0,0 +1,187 @@
+"""
+Paginação por chave (keyset / "seek").
+
+query.paginate() faz COUNT(*) + LIMIT/OFFSET: a página 5000 obriga o banco a
+ler e descartar 50 mil linhas antes de devolver 10. Aqui cada página começa
+exatamente depois da última linha da anterior:
+
+    WHERE (name, id) > (:ultimo_nome, :ultimo_id) ORDER BY name, id LIMIT 11
+
+O custo é o mesmo em qualquer página (uma busca no índice). A posição viaja na
+URL como um cursor opaco (JSON em base64), e o total é opcional e aproximado.
+"""
+import base64
+import hashlib
+import json
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import func, select, tuple_
+
+from app.extensions import db
+from app.reference_data import get_cache
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if '$dt' in value:
+            return datetime.fromisoformat(value['$dt'])
+        if '$d' in value:
+            return date.fromisoformat(value['$d'])
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Cursor inválido/adulterado vira None (= primeira página), nunca erro 500."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != size:
+            return None
+        return [_decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """Página de resultados com cursores para a próxima e a anterior."""
+
+    def __init__(self, items, next_cursor, prev_cursor, total=None, total_is_exact=True):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_is_exact = total_is_exact
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def total_label(self):
+        """'123', '10000+' (contagem limitada) ou '~123' (estimativa do planner)."""
+        if self.total is None:
+            return '-'
+        if self.total_is_exact:
+            return str(self.total)
+        return f'~{self.total}' if self.total_is_exact is None else f'{self.total}+'
+
+
+def _explain_rows(compiled):
+    """Estimativa do planner do PostgreSQL para a query já compilada."""
+    # Direto no driver, com os parâmetros separados: text() reinterpretaria ':abc'
+    # de uma busca como parâmetro (e o literal_binds embutia o termo no SQL)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    connection = db.session.connection(bind_arguments={'clause': compiled.statement})
+    plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled.string}', params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _count_key(compiled):
+    raw = compiled.string + repr(sorted(compiled.params.items(), key=lambda item: item[0]))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def approximate_count(query, cap, refresh=True):
+    """
+    Total sem varrer tudo: no PostgreSQL usa a estimativa do planner (EXPLAIN);
+    nos demais conta até 'cap' linhas. Retorna (total, exato?) — exato=None
+    indica estimativa e False indica que o limite foi atingido.
+
+    O resultado fica em cache por filtro (PAGINATION_COUNT_TTL): refresh=True
+    (primeira página) recalcula; as páginas seguintes reaproveitam a contagem.
+    """
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    cache = get_cache()
+    key = _count_key(compiled)
+    if not refresh:
+        cached = cache.get('page_counts', key)
+        if cached is not None:
+            return cached
+
+    if db.engine.dialect.name == 'postgresql':
+        result = _explain_rows(compiled), None
+    else:
+        limited = query.order_by(None).limit(cap + 1).subquery()
+        count = db.session.execute(select(func.count()).select_from(limited)).scalar()
+        result = (cap, False) if count > cap else (count, True)
+
+    cache.set('page_counts', key, result, ttl=current_app.config['PAGINATION_COUNT_TTL'])
+    return result
+
+
+def keyset_paginate(query, keys, per_page, after=None, before=None, descending=False, count_cap=None):
+    """
+    Pagina 'query' pela tupla de colunas 'keys' (a última deve ser única, ex.: id).
+
+    after/before: cursores vindos da URL (próxima/anterior).
+    descending:   ordem decrescente (ex.: histórico mais recente primeiro).
+    count_cap:    se informado, calcula o total aproximado (ver approximate_count).
+    """
+    size = len(keys)
+    after_values = decode_cursor(after, size)
+    before_values = decode_cursor(before, size) if after_values is None else None
+    backwards = before_values is not None
+
+    base = query
+    # As chaves vão junto no SELECT para montar os cursores sem outra query
+    labeled = [key.label(f'_page_key_{i}') for i, key in enumerate(keys)]
+    query = query.add_columns(*labeled)
+
+    if after_values is not None:
+        cond = tuple_(*keys) < tuple_(*after_values) if descending else tuple_(*keys) > tuple_(*after_values)
+        query = query.filter(cond)
+    elif backwards:
+        cond = tuple_(*keys) > tuple_(*before_values) if descending else tuple_(*keys) < tuple_(*before_values)
+        query = query.filter(cond)
+
+    # Voltando uma página, lemos na ordem inversa e desviramos depois
+    reverse = descending != backwards
+    query = query.order_by(*[key.desc() if reverse else key.asc() for key in keys])
+    rows = query.limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    first_keys = list(rows[0][1:]) if rows else None
+    last_keys = list(rows[-1][1:]) if rows else None
+
+    if backwards:
+        next_cursor = encode_cursor(last_keys) if rows else None
+        prev_cursor = encode_cursor(first_keys) if more else None
+    else:
+        next_cursor = encode_cursor(last_keys) if more else None
+        prev_cursor = encode_cursor(first_keys) if (after_values is not None and rows) else None
+
+    total, exact = (None, True)
+    if count_cap is not None:
+        first_page = after_values is None and not backwards
+        total, exact = approximate_count(base, count_cap, refresh=first_page)
+
+    return KeysetPage(items, next_cursor, prev_cursor, total=total, total_is_exact=exact)
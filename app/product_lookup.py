@@ -0,0 +1,306 @@
+"""
+Busca de produtos por prefixo (autocomplete dos formulários).
+
+Os formulários de movimentação e de itens do pedido mandavam TODOS os produtos
+ativos num <select>. Agora o campo consulta /api/products/lookup?q=... e
+recebe só os primeiros N produtos cujo SKU ou nome começa com o texto digitado.
+
+A busca por prefixo roda em memória, em dois arrays ordenados (SKU e nome,
+normalizados sem acento e em minúsculas) com bisect: O(log n) para achar o
+começo da faixa e só N itens lidos. Os dados "quentes" (saldo, ativo) vêm do
+banco, pela chave primária, só para os candidatos encontrados.
+
+Atualização incremental:
+    - gravações de Product pelo ORM (nome, SKU, fornecedor, ativo) são
+      aplicadas no índice do processo logo após o commit;
+    - produtos criados por outros workers ou por SQL direto (importação) são
+      detectados pelo max(id) e carregados a cada consulta (busca no índice da PK);
+    - renomeações feitas em outros processos aparecem na reconstrução
+      completa, a cada PRODUCT_LOOKUP_TTL segundos. Só a primeira construção
+      segura a requisição (uma por processo, as demais esperam por ela); as
+      seguintes rodam numa thread e o índice antigo atende enquanto isso.
+
+Cada worker guarda a sua cópia (~320 bytes por produto ativo, o dobro durante
+a reconstrução); ver PRODUCT_LOOKUP_INDEX no config.py.
+"""
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import Product
+
+MAX_LIMIT = 50
+SCAN_LIMIT = 5000 # com filtro de fornecedor, quantas entradas no máximo percorrer antes de ir ao banco
+
+
+def normalize(text):
+    """'Café Pilão' -> 'cafe pilao' (sem acento, minúsculo, espaços simples)."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.lower().split())
+
+
+class SortedKeys:
+    """Array ordenado de (chave, id): faixa de prefixo via bisect."""
+
+    def __init__(self, pairs=()):
+        pairs = sorted(pairs)
+        self.keys = [key for key, _ in pairs]
+        self.ids = array('q', (product_id for _, product_id in pairs))
+
+    def add(self, key, product_id):
+        position = bisect_left(self.keys, key)
+        # Mesma chave para vários produtos: mantém a ordem por id
+        while position < len(self.keys) and self.keys[position] == key and self.ids[position] < product_id:
+            position += 1
+        self.keys.insert(position, key)
+        self.ids.insert(position, product_id)
+
+    def remove(self, key, product_id):
+        position = bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position] == key:
+            if self.ids[position] == product_id:
+                del self.keys[position]
+                del self.ids[position]
+                return
+            position += 1
+
+    def prefix(self, prefix):
+        """Gera os ids cujas chaves começam com 'prefix', em ordem de chave."""
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and self.keys[position].startswith(prefix):
+            yield self.ids[position]
+            position += 1
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock() # uma reconstrução por vez
+        self.products = {} # id -> (chave do sku, chave do nome, supplier_id)
+        self.by_sku = SortedKeys()
+        self.by_name = SortedKeys()
+        self.max_id = 0
+        self.ready = False
+        self.built_at = 0.0
+        self.pending = set() # ids gravados desde a última consulta
+        self._touched = None # ids recarregados durante uma reconstrução
+
+    def rebuild(self):
+        with self._lock:
+            self._touched = set()
+        rows = db.session.execute(
+            select(Product.id, Product.sku, Product.name, Product.supplier_id).where(Product.active.is_(True))
+        ).all()
+        products = {row.id: (normalize(row.sku), normalize(row.name), row.supplier_id) for row in rows}
+        by_sku = SortedKeys((entry[0], pid) for pid, entry in products.items())
+        by_name = SortedKeys((entry[1], pid) for pid, entry in products.items())
+        max_id = db.session.execute(select(func.max(Product.id))).scalar() or 0
+        with self._lock:
+            self.products, self.by_sku, self.by_name = products, by_sku, by_name
+            self.max_id = max_id
+            self.built_at = time.monotonic()
+            self.ready = True
+            # Gravações aplicadas no índice antigo depois da leitura acima: reaplica
+            self.pending.update(self._touched)
+            self._touched = None
+
+    def ensure_built(self):
+        """Primeira construção: só uma requisição varre o catálogo, as outras esperam."""
+        with self._rebuild_lock:
+            if not self.ready:
+                self.rebuild()
+
+    def rebuild_in_background(self, app):
+        """Reconstrução periódica numa thread; não faz nada se já há uma em andamento."""
+        if not self._rebuild_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                with app.app_context():
+                    self.rebuild()
+            except Exception:
+                app.logger.exception('Falha ao reconstruir o índice de produtos')
+                self.built_at = time.monotonic() # tenta de novo só no próximo TTL
+            finally:
+                self._rebuild_lock.release()
+
+        threading.Thread(target=run, name='product-lookup-rebuild', daemon=True).start()
+
+    def _discard(self, product_id):
+        entry = self.products.pop(product_id, None)
+        if entry:
+            self.by_sku.remove(entry[0], product_id)
+            self.by_name.remove(entry[1], product_id)
+
+    def refresh(self, product_ids):
+        """Recarrega só estes produtos do banco (criados, editados ou arquivados)."""
+        if not product_ids:
+            return
+        rows = db.session.execute(
+            select(Product.id, Product.sku, Product.name, Product.supplier_id, Product.active)
+            .where(Product.id.in_(list(product_ids)))
+        ).all()
+        found = {row.id: row for row in rows}
+        with self._lock:
+            if self._touched is not None:
+                self._touched.update(product_ids)
+            for product_id in product_ids:
+                self._discard(product_id)
+                row = found.get(product_id)
+                if row is None or not row.active:
+                    continue
+                entry = (normalize(row.sku), normalize(row.name), row.supplier_id)
+                self.products[product_id] = entry
+                self.by_sku.add(entry[0], product_id)
+                self.by_name.add(entry[1], product_id)
+                self.max_id = max(self.max_id, product_id)
+
+    def catch_up(self):
+        """Carrega produtos com id acima do último visto (outros workers, SQL direto)."""
+        max_id = db.session.execute(select(func.max(Product.id))).scalar() or 0
+        if max_id > self.max_id:
+            new_ids = db.session.scalars(select(Product.id).where(Product.id > self.max_id)).all()
+            self.refresh(new_ids)
+            self.max_id = max_id
+
+    def search(self, term, limit, supplier_id=None):
+        """
+        Ids dos produtos com SKU ou nome começando por 'term': primeiro os de
+        SKU, depois os de nome. None = filtro de fornecedor raro demais para
+        o índice (quem chama vai ao banco).
+        """
+        prefix = normalize(term)
+        if not prefix:
+            return []
+        found = []
+        seen = set()
+        scanned = 0
+        with self._lock:
+            for keys in (self.by_sku, self.by_name):
+                for product_id in keys.prefix(prefix):
+                    scanned += 1
+                    if scanned > SCAN_LIMIT:
+                        return None
+                    if product_id in seen:
+                        continue
+                    if supplier_id is not None and self.products[product_id][2] != supplier_id:
+                        continue
+                    seen.add(product_id)
+                    found.append(product_id)
+                    if len(found) >= limit:
+                        return found
+        return found
+
+
+_create_lock = threading.Lock()
+
+
+def get_index():
+    """Índice do processo, construído na primeira consulta e renovado a cada TTL."""
+    app = current_app._get_current_object()
+    index = app.extensions.get('product_lookup')
+    if index is None:
+        with _create_lock:
+            index = app.extensions.setdefault('product_lookup', PrefixIndex())
+    if not index.ready:
+        index.ensure_built()
+    elif time.monotonic() - index.built_at > app.config['PRODUCT_LOOKUP_TTL']:
+        index.rebuild_in_background(app)
+
+    if index.pending:
+        with index._lock:
+            product_ids, index.pending = index.pending, set()
+        index.refresh(product_ids)
+    index.catch_up()
+    return index
+
+
+def invalidate():
+    """Reconstrução na próxima consulta (gravações em SQL direto, como a importação)."""
+    index = current_app.extensions.get('product_lookup')
+    if index is not None:
+        index.built_at = 0.0
+
+
+def _lookup_in_database(term, limit, supplier_id):
+    """
+    Sem o índice em memória (PRODUCT_LOOKUP_INDEX=False ou filtro de fornecedor
+    além do SCAN_LIMIT): prefixo direto no banco, sem diferenciar maiúsculas.
+    Acentos continuam contando aqui ('acucar' não acha 'Açúcar'): dobrar
+    acentos no banco depende de extensão (unaccent) que não assumimos.
+    """
+    prefix = term.lower()
+    query = Product.query.filter(Product.active.is_(True),
+                                 func.lower(Product.sku).startswith(prefix, autoescape=True)
+                                 | func.lower(Product.name).startswith(prefix, autoescape=True))
+    if supplier_id is not None:
+        query = query.filter(Product.supplier_id == supplier_id)
+    return query.order_by(Product.name).limit(limit).all()
+
+
+def lookup_products(term, limit=20, supplier_id=None):
+    """Até 'limit' produtos ATIVOS para o autocomplete, com saldo atual."""
+    limit = max(1, min(limit, MAX_LIMIT))
+    term = (term or '').strip()
+    if not term:
+        return []
+
+    ids = None
+    if current_app.config['PRODUCT_LOOKUP_INDEX']:
+        ids = get_index().search(term, limit, supplier_id)
+    if ids is None:
+        return _lookup_in_database(term, limit, supplier_id)
+    if not ids:
+        return []
+
+    # Saldo e status vêm sempre do banco (busca pela PK)
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(ids), Product.active.is_(True))}
+    return [products[product_id] for product_id in ids if product_id in products]
+
+
+# --- ATUALIZAÇÃO INCREMENTAL APÓS O COMMIT ---
+
+INDEXED_FIELDS = ('sku', 'name', 'supplier_id', 'active')
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_products(session, flush_context):
+    changed = session.info.setdefault('lookup_changes', set())
+    for obj in session.new:
+        if isinstance(obj, Product):
+            changed.add(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            changed.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Product) and any(db.inspect(obj).attrs[f].history.has_changes() for f in INDEXED_FIELDS):
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_products(session):
+    changed = session.info.pop('lookup_changes', None)
+    if not changed or not has_app_context():
+        return
+    index = current_app.extensions.get('product_lookup')
+    if index is None:
+        return
+    # Produtos novos só têm id depois do flush: guardamos o objeto e lemos o id agora.
+    # Depois do commit a sessão não pode consultar; a releitura fica para a próxima busca.
+    ids = {item.id if isinstance(item, Product) else item for item in changed}
+    with index._lock:
+        index.pending.update(product_id for product_id in ids if product_id is not None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_products(session):
+    session.info.pop('lookup_changes', None)
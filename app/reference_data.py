@@ -0,0 +1,107 @@
+"""
+Dados de referência em cache (fornecedores, categorias, contagem de produtos).
+
+Os formulários (novo/editar produto, novo pedido, lista de fornecedores) liam as tabelas inteiras a cada GET, embora elas quase
+nunca mudem. Aqui as listas ficam num VersionedCache (app/cache.py) como
+tuplas simples (não objetos ORM, que não sobrevivem à sessão):
+
+    - namespaces 'suppliers', 'categories' e 'products';
+    - qualquer gravação nessas tabelas pelo ORM marca o namespace na sessão
+      (after_flush) e a versão é incrementada DEPOIS do commit; rollback
+      descarta a marcação;
+    - caminhos em SQL direto (importação) chamam mark_changed().
+
+A escolha de produto nos formulários não passa por aqui: é o autocomplete de
+app/product_lookup.py, que lê o saldo sempre do banco.
+
+Com o backend LRU cada worker tem seu cache e o TTL (REFERENCE_CACHE_TTL)
+limita o atraso dos outros; com CACHE_URL=redis://... a versão é única.
+"""
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app.cache import LRUBackend, RedisBackend, VersionedCache
+from app.extensions import db
+from app.models import Category, Product, Supplier
+
+SupplierRow = namedtuple('SupplierRow', [c.name for c in Supplier.__table__.columns])
+CategoryRow = namedtuple('CategoryRow', [c.name for c in Category.__table__.columns])
+
+NAMESPACES = {Supplier: 'suppliers', Category: 'categories', Product: 'products'}
+
+
+def init_app(app):
+    url = app.config.get('CACHE_URL')
+    backend = RedisBackend(url) if url else LRUBackend(app.config['REFERENCE_CACHE_SIZE'])
+
+    def count_lookup(namespace, result):
+        registry = app.extensions.get('metrics')
+        if registry is not None:
+            registry.inc('reference_cache_lookups_total', (('namespace', namespace), ('result', result)))
+
+    app.extensions['reference_cache'] = VersionedCache(backend, app.config['REFERENCE_CACHE_TTL'], count_lookup)
+    registry = app.extensions.get('metrics')
+    if registry is not None:
+        registry.counter('reference_cache_lookups_total', 'Consultas ao cache de dados de referência (hit/miss).')
+
+
+def get_cache():
+    return current_app.extensions['reference_cache']
+
+
+def _rows(model, row_type):
+    columns = [getattr(model, field) for field in row_type._fields]
+    return [row_type(*row) for row in db.session.query(*columns).order_by(model.name)]
+
+
+def suppliers():
+    """Todos os fornecedores, por nome."""
+    return get_cache().get_or_set('suppliers', 'all', lambda: _rows(Supplier, SupplierRow))
+
+
+def categories():
+    """Todas as categorias, por nome."""
+    return get_cache().get_or_set('categories', 'all', lambda: _rows(Category, CategoryRow))
+
+
+def product_counts():
+    """Quantidade de produtos (ativos ou não) por fornecedor."""
+    return get_cache().get_or_set('products', 'count_by_supplier', lambda: dict(
+        db.session.query(Product.supplier_id, func.count(Product.id)).group_by(Product.supplier_id).all()))
+
+
+def mark_changed(*namespaces):
+    """Marca namespaces para invalidar depois do commit da sessão atual."""
+    db.session.info.setdefault('reference_changes', set()).update(namespaces)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changed = set()
+    for obj in list(session.new) + list(session.deleted):
+        namespace = NAMESPACES.get(type(obj))
+        if namespace:
+            changed.add(namespace)
+    for obj in session.dirty:
+        namespace = NAMESPACES.get(type(obj))
+        if namespace and session.is_modified(obj, include_collections=False):
+            changed.add(namespace)
+    if changed:
+        session.info.setdefault('reference_changes', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_versions(session):
+    changed = session.info.pop('reference_changes', None)
+    if changed and has_app_context() and 'reference_cache' in current_app.extensions:
+        cache = get_cache()
+        for namespace in changed:
+            cache.bump(namespace)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('reference_changes', None)
@@ -0,0 +1,203 @@
+"""
+Ponto de pedido e sugestão de compra, com rascunhos de PurchaseOrder em lote.
+
+O min_level é fixo e digitado à mão. Aqui o ponto de pedido sai do ritmo de
+saída de cada produto:
+
+    - update_demand(): média móvel exponencial das saídas diárias (e do
+      quadrado, para o desvio) em ProductDemand. Incremental: só lê as
+      movimentações dos dias completos desde a última rodada, agrupadas por
+      (produto, dia) no banco, e grava só os produtos que movimentaram;
+    - suggestions(): para todo o catálogo ativo, em arrays NumPy,
+          ponto de pedido = consumo médio x prazo + z x desvio x raiz(prazo)
+          sugestão = ponto de pedido + consumo do período de revisão
+                     - (saldo + já pedido em rascunhos/pendentes)
+      quando saldo + já pedido <= max(ponto de pedido, min_level).
+      O prazo de entrega é o tempo médio (criação -> conferência) dos pedidos
+      do fornecedor nos últimos 12 meses, ou REORDER_LEAD_TIME_DAYS;
+    - create_drafts(): um PurchaseOrder 'draft' por fornecedor com sugestões,
+      cabeçalhos num executemany com RETURNING e itens em outro. O comprador
+      revisa e libera o rascunho com o número da nota (vira 'pending').
+
+Tudo roda pelo 'flask replenish' (cron noturno) sem ida e volta ao banco por item.
+"""
+import math
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import case, func, insert, select
+
+from app.analytics import align, fetch_columns
+from app.archive import movement_source
+from app.extensions import db
+from app.importer import upsert
+from app.models import Product, ProductDemand, PurchaseOrder, PurchaseOrderItem, Supplier
+
+SPAN_DAYS = 28            # "janela" da média exponencial: alpha = 2 / (span + 1)
+ALPHA = 2.0 / (SPAN_DAYS + 1)
+HISTORY_DAYS = 180        # primeira rodada: histórico lido para aquecer as médias
+LEAD_TIME_HISTORY_DAYS = 365
+OPEN_STATUSES = ('draft', 'pending')
+
+Suggestion = namedtuple('Suggestion', 'product_id supplier_id quantity on_order daily_mean reorder_point suggested')
+
+
+def _days(values, origin):
+    """Datas (array datetime64[D]) -> dias inteiros desde 'origin' (negativos = antes)."""
+    return (values - np.datetime64(origin, 'D')).astype(np.int64)
+
+
+def update_demand(through=None):
+    """
+    Incorpora as saídas dos dias completos até 'through' (exclusivo; padrão:
+    hoje) às médias de ProductDemand. Retorna quantos produtos foram atualizados.
+    """
+    through = through or date.today()
+    last = db.session.execute(select(func.max(ProductDemand.as_of))).scalar()
+    start = last or through - timedelta(days=HISTORY_DAYS)
+    if start >= through:
+        return 0
+
+    start_at = datetime.combine(start, datetime.min.time())
+    end_at = datetime.combine(through, datetime.min.time())
+    source = movement_source(start_at)
+    day = func.date(source.date)
+    product_ids, days, quantities = fetch_columns(
+        select(source.product_id, day, func.sum(source.quantity))
+        .where(source.type == 'OUT', source.date >= start_at, source.date < end_at)
+        .group_by(source.product_id, day),
+        (np.int64, 'datetime64[D]', np.float64))
+    if not len(product_ids):
+        return 0
+
+    # Peso de cada dia no fim da janela: alpha * (1 - alpha)^(dias até 'through' - 1)
+    weights = ALPHA * (1 - ALPHA) ** (-_days(days, through) - 1)
+    ids, index = np.unique(product_ids, return_inverse=True)
+    new_mean = np.bincount(index, weights=weights * quantities, minlength=len(ids))
+    new_square = np.bincount(index, weights=weights * quantities ** 2, minlength=len(ids))
+
+    # Estado anterior desses produtos, decaído até 'through'
+    old_ids, old_mean, old_square, old_as_of = fetch_columns(
+        select(ProductDemand.product_id, ProductDemand.daily_mean, ProductDemand.daily_square, ProductDemand.as_of)
+        .order_by(ProductDemand.product_id),
+        (np.int64, np.float64, np.float64, 'datetime64[D]'))
+    if len(old_ids):
+        decay = (1 - ALPHA) ** -_days(old_as_of, through)
+        new_mean += align(ids, old_ids, old_mean * decay)
+        new_square += align(ids, old_ids, old_square * decay)
+
+    upsert(ProductDemand, [
+        {'product_id': int(pid), 'daily_mean': float(mean), 'daily_square': float(square), 'as_of': through}
+        for pid, mean, square in zip(ids, new_mean, new_square)
+    ], 'product_id', ['daily_mean', 'daily_square', 'as_of'])
+    return len(ids)
+
+
+def supplier_lead_times():
+    """{supplier_id: dias} = média de (conferência - criação) dos pedidos concluídos no último ano."""
+    since = datetime.now() - timedelta(days=LEAD_TIME_HISTORY_DAYS)
+    supplier_ids, created, received = fetch_columns(
+        select(PurchaseOrder.supplier_id, PurchaseOrder.created_at, PurchaseOrder.updated_at)
+        .where(PurchaseOrder.status == 'completed', PurchaseOrder.created_at >= since,
+               PurchaseOrder.updated_at.is_not(None)),
+        (np.int64, 'datetime64[s]', 'datetime64[s]'))
+    if not len(supplier_ids):
+        return {}
+    hours = (received - created).astype(np.float64) / 3600
+    keys, index = np.unique(supplier_ids, return_inverse=True)
+    days = np.bincount(index, weights=np.maximum(hours, 0) / 24) / np.bincount(index)
+    return {int(k): float(d) for k, d in zip(keys, days)}
+
+
+def suggestions(today=None, supplier_id=None):
+    """Sugestões de compra (lista de Suggestion), do catálogo ativo inteiro ou de um fornecedor."""
+    config = current_app.config
+    today = today or date.today()
+
+    query = select(Product.id, Product.supplier_id, func.coalesce(Product.quantity, 0),
+                   func.coalesce(Product.min_level, 5)).where(Product.active.is_(True)).order_by(Product.id)
+    if supplier_id is not None:
+        query = query.where(Product.supplier_id == supplier_id)
+    ids, supplier_ids, quantity, min_level = fetch_columns(query, (np.int64,) * 4)
+    if not len(ids):
+        return []
+
+    demand_ids, mean, square, as_of = fetch_columns(
+        select(ProductDemand.product_id, ProductDemand.daily_mean, ProductDemand.daily_square, ProductDemand.as_of)
+        .order_by(ProductDemand.product_id),
+        (np.int64, np.float64, np.float64, 'datetime64[D]'))
+    if len(demand_ids):
+        # Dias sem saída desde a última rodada puxam as médias para baixo
+        decay = (1 - ALPHA) ** np.maximum(-_days(as_of, today), 0)
+        mean, square = align(ids, demand_ids, mean * decay), align(ids, demand_ids, square * decay)
+    else:
+        mean = square = np.zeros(len(ids))
+    deviation = np.sqrt(np.maximum(square - mean ** 2, 0))
+
+    pending = case((PurchaseOrderItem.quantity_received.is_(None), PurchaseOrderItem.quantity_expected),
+                   else_=PurchaseOrderItem.quantity_expected - PurchaseOrderItem.quantity_received)
+    ordered_ids, ordered = fetch_columns(
+        select(PurchaseOrderItem.product_id, func.sum(pending))
+        .join(PurchaseOrder, PurchaseOrder.id == PurchaseOrderItem.purchase_order_id)
+        .where(PurchaseOrder.status.in_(OPEN_STATUSES)).group_by(PurchaseOrderItem.product_id),
+        (np.int64, np.int64))
+    on_order = np.maximum(align(ids, ordered_ids, ordered), 0)
+
+    lead = np.full(len(ids), float(config['REORDER_LEAD_TIME_DAYS']))
+    lead_times = supplier_lead_times()
+    if lead_times:
+        keys = np.array(sorted(lead_times), dtype=np.int64)
+        pos = np.minimum(np.searchsorted(keys, supplier_ids), len(keys) - 1)
+        found = keys[pos] == supplier_ids
+        lead[found] = np.array([lead_times[k] for k in keys])[pos[found]]
+
+    reorder_point = mean * lead + config['REORDER_SERVICE_Z'] * deviation * np.sqrt(lead)
+    position = quantity + on_order
+    threshold = np.maximum(reorder_point, min_level)
+    target = np.maximum(reorder_point + mean * config['REORDER_REVIEW_DAYS'], min_level)
+    need = np.ceil(target - position)
+    picked = np.flatnonzero((position <= threshold) & (need > 0))
+
+    return [Suggestion(int(ids[i]), int(supplier_ids[i]), int(quantity[i]), int(on_order[i]),
+                       round(float(mean[i]), 2), int(math.ceil(reorder_point[i])), int(need[i]))
+            for i in picked]
+
+
+def by_supplier(items):
+    """{supplier_id: [Suggestion, ...]}"""
+    grouped = {}
+    for item in items:
+        grouped.setdefault(item.supplier_id, []).append(item)
+    return grouped
+
+
+def create_drafts(items, user_id):
+    """
+    Um PurchaseOrder 'draft' por fornecedor com os itens sugeridos, em dois
+    executemany (cabeçalhos com RETURNING, depois os itens). Não faz commit.
+    Retorna {supplier_id: order_id}.
+    """
+    grouped = by_supplier(items)
+    if not grouped:
+        return {}
+    now = datetime.now()
+    rows = db.session.execute(
+        insert(PurchaseOrder).returning(PurchaseOrder.id, PurchaseOrder.supplier_id, sort_by_parameter_order=True),
+        [{'supplier_id': sid, 'invoice_number': None, 'status': 'draft', 'created_at': now,
+          'created_by_id': user_id} for sid in grouped]
+    ).all()
+    orders = {row.supplier_id: row.id for row in rows}
+
+    db.session.execute(insert(PurchaseOrderItem), [
+        {'purchase_order_id': orders[sid], 'product_id': item.product_id,
+         'quantity_expected': item.suggested, 'quantity_received': 0, 'unit_cost': 0.0}
+        for sid, supplier_items in grouped.items() for item in supplier_items
+    ])
+    return orders
+
+
+def supplier_names(supplier_ids):
+    rows = db.session.execute(select(Supplier.id, Supplier.name).where(Supplier.id.in_(list(supplier_ids))))
+    return dict(rows.all())
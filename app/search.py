@@ -0,0 +1,186 @@
+"""
+Busca de produtos (tela de estoque).
+
+O filtro antigo (name LIKE '%q%' OR sku LIKE '%q%') varria a tabela inteira a
+cada busca. Aqui a busca passa por um índice de texto, escolhido pelo banco:
+
+    - SQLite:      tabela virtual FTS5 'product_fts' (conteúdo externo =
+                   tabela product), mantida por triggers em INSERT/UPDATE/DELETE.
+                   Busca por prefixo em cada palavra ("cerv" acha "Cerveja",
+                   "BEB-0" acha "BEB-001"), ordenada por bm25 com peso maior no SKU.
+    - PostgreSQL:  extensão pg_trgm com índices GIN em name e sku, e um índice
+                   lower(sku) text_pattern_ops para prefixo de SKU sem diferenciar
+                   maiúsculas (ILIKE não usa text_pattern_ops; LIKE em lower() usa).
+                   Ordenada por similaridade.
+    - Outros / índice ausente: LIKE, como antes.
+
+Todas as implementações devolvem (query filtrada, expressão de relevância);
+quem chama ordena por (relevância, Product.id) — menor = mais relevante.
+"""
+import re
+
+from flask import current_app
+from sqlalchemy import DDL, case, event, func, literal_column, or_, select, text
+
+from app.extensions import db
+from app.models import Product
+
+FTS_TABLE = 'product_fts'
+
+SQLITE_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, sku, content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, sku) VALUES (new.id, new.name, new.sku);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, sku) VALUES ('delete', old.id, old.name, old.sku);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, sku ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, sku) VALUES ('delete', old.id, old.name, old.sku);
+        INSERT INTO {FTS_TABLE}(rowid, name, sku) VALUES (new.id, new.name, new.sku);
+    END""",
+]
+
+POSTGRES_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_product_name_trgm ON product USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_product_sku_trgm ON product USING gin (sku gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_product_sku_prefix ON product (lower(sku) text_pattern_ops)",
+]
+
+
+class LikeSearch:
+    """Sem índice de texto: LIKE nos dois campos (varredura completa)."""
+    name = 'like'
+
+    def is_available(self, conn):
+        return True
+
+    def setup(self, conn):
+        pass
+
+    def rebuild(self, conn):
+        pass
+
+    def apply(self, query, term):
+        query = query.filter(Product.name.contains(term) | Product.sku.contains(term))
+        # SKU começando pelo termo vem primeiro
+        rank = case((Product.sku.startswith(term), 0), else_=1)
+        return query, rank
+
+
+class SqliteFtsSearch:
+    name = 'fts5'
+
+    def is_available(self, conn):
+        return conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                            {'name': FTS_TABLE}).first() is not None
+
+    def setup(self, conn):
+        for statement in SQLITE_SETUP:
+            conn.execute(text(statement))
+
+    def rebuild(self, conn):
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+    @staticmethod
+    def build_match(term):
+        """'BEB-0 lata' -> '"BEB"* "0"* "lata"*' (todas as palavras, por prefixo)."""
+        tokens = re.findall(r'\w+', term)
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def apply(self, query, term):
+        match = self.build_match(term)
+        if not match:
+            return LikeSearch().apply(query, term)
+
+        # bm25: menor = mais relevante; pesos (name=1, sku=10)
+        hits = select(
+            literal_column('rowid').label('product_id'),
+            func.bm25(literal_column(FTS_TABLE), 1.0, 10.0).label('rank'),
+        ).select_from(text(FTS_TABLE))\
+            .where(text(f'{FTS_TABLE} MATCH :fts_match').bindparams(fts_match=match))\
+            .subquery('fts_hits')
+
+        query = query.join(hits, hits.c.product_id == Product.id)
+        return query, hits.c.rank
+
+
+class PostgresTrigramSearch:
+    name = 'trgm'
+
+    def is_available(self, conn):
+        return conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+
+    def setup(self, conn):
+        for statement in POSTGRES_SETUP:
+            conn.execute(text(statement))
+
+    def rebuild(self, conn):
+        conn.execute(text('REINDEX INDEX ix_product_name_trgm'))
+        conn.execute(text('REINDEX INDEX ix_product_sku_trgm'))
+
+    def apply(self, query, term):
+        pattern = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        # LIKE 'x%' em lower(sku): servido por ix_product_sku_prefix
+        sku_prefix = func.lower(Product.sku).startswith(term.lower(), autoescape=True)
+        query = query.filter(or_(
+            sku_prefix,
+            Product.name.ilike('%' + pattern + '%'), # usa o GIN trigram
+            Product.name.op('%')(term),              # similaridade (erros de digitação)
+        ))
+        similarity = func.greatest(func.similarity(Product.name, term), func.similarity(Product.sku, term))
+        rank = -(similarity + case((sku_prefix, 1.0), else_=0.0))
+        return query, rank
+
+
+BACKENDS = {'like': LikeSearch, 'fts5': SqliteFtsSearch, 'trgm': PostgresTrigramSearch}
+DIALECT_DEFAULTS = {'sqlite': 'fts5', 'postgresql': 'trgm'}
+
+
+def _configured_backend(dialect_name):
+    name = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = DIALECT_DEFAULTS.get(dialect_name, 'like')
+    return BACKENDS[name]()
+
+
+def get_backend():
+    """Backend da aplicação atual (verifica uma vez se o índice existe)."""
+    backend = current_app.extensions.get('product_search')
+    if backend is None:
+        backend = _configured_backend(db.engine.dialect.name)
+        with db.engine.connect() as conn:
+            if not backend.is_available(conn):
+                current_app.logger.warning("Índice de busca '%s' ausente; usando LIKE. Rode 'flask search-reindex'.", backend.name)
+                backend = LikeSearch()
+        current_app.extensions['product_search'] = backend
+    return backend
+
+
+def search_products(query, term):
+    """
+    Aplica a busca a uma query de Product.
+    Retorna (query, relevância); ordene por (relevância, Product.id).
+    """
+    return get_backend().apply(query, term)
+
+
+def reindex():
+    """Cria (se preciso) e reconstrói o índice de busca. Usado pelo CLI."""
+    current_app.extensions.pop('product_search', None)
+    backend = _configured_backend(db.engine.dialect.name)
+    with db.engine.begin() as conn:
+        backend.setup(conn)
+        backend.rebuild(conn)
+    return backend.name
+
+
+# db.create_all() (testes, seed) também cria o índice FTS no SQLite;
+# db.drop_all() apaga a tabela virtual junto com product para não sobrar lixo.
+for _statement in SQLITE_SETUP:
+    event.listen(Product.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(Product.__table__, 'before_drop', DDL(f'DROP TABLE IF EXISTS {FTS_TABLE}').execute_if(dialect='sqlite'))
@@ -0,0 +1,145 @@
+"""
+Saldo histórico: fotos diárias do estoque + extrato desde a foto.
+
+Product.quantity só diz o saldo de AGORA. Para "quanto tinha no dia X" era
+preciso somar todo o extrato (Movement) do produto desde o começo. Aqui:
+
+    - take_snapshot(at) grava, para cada produto que movimentou desde a foto
+      anterior, o saldo em 'at' = foto anterior + movimentações do intervalo.
+      Custo O(movimentações desde a última foto); rodar uma vez por dia
+      (flask snapshot-stock, no cron logo depois da meia-noite);
+    - balance_at / balances_at: foto mais recente até a data + movimentações
+      entre a foto e a data. Produto sem linha numa rodada não movimentou
+      nela, então a foto mais antiga dele continua valendo;
+    - reconcile(): produtos cujo Product.quantity difere do saldo do extrato.
+
+Convenção: o saldo "em X" soma as movimentações com date < X (a foto de
+2026-10-18 00:00 é o fechamento do dia 17). As fotos supõem que ninguém grava
+movimentação com data anterior à última foto (o ledger sempre usa a hora atual).
+Janelas que alcançam movimentações arquivadas leem também o arquivo
+(app/archive.py); as demais só a tabela quente.
+"""
+from collections import namedtuple
+from datetime import datetime, time
+
+from sqlalchemy import case, func, insert, literal, select
+
+from app.archive import movement_source
+from app.extensions import db
+from app.models import Product, StockSnapshot
+
+CHUNK_SIZE = 500 # produtos por consulta de foto anterior (limite de parâmetros do SQLite)
+BALANCE_QUERY_LIMIT = 500 # produtos por chamada de /api/stock/balance
+
+Discrepancy = namedtuple('Discrepancy', 'product_id sku name quantity ledger')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _signed_quantity(source):
+    return func.sum(case((source.type == 'IN', source.quantity), else_=-source.quantity))
+
+
+def last_snapshot_at(before=None):
+    """Instante da última rodada de fotos (até 'before', inclusive)."""
+    query = select(func.max(StockSnapshot.taken_at))
+    if before is not None:
+        query = query.where(StockSnapshot.taken_at <= before)
+    return db.session.execute(query).scalar()
+
+
+def _latest_snapshots(taken_until, product_ids=None):
+    """Subconsulta (product_id, quantity) com a foto mais recente de cada produto até 'taken_until'."""
+    latest = select(StockSnapshot.product_id, func.max(StockSnapshot.taken_at).label('taken_at'))\
+        .where(StockSnapshot.taken_at <= taken_until)
+    if product_ids is not None:
+        latest = latest.where(StockSnapshot.product_id.in_(product_ids))
+    latest = latest.group_by(StockSnapshot.product_id).subquery()
+    return select(StockSnapshot.product_id, StockSnapshot.quantity)\
+        .join(latest, (latest.c.product_id == StockSnapshot.product_id) & (latest.c.taken_at == StockSnapshot.taken_at))\
+        .subquery()
+
+
+def _deltas(start, end, product_ids=None):
+    """Subconsulta (product_id, delta) com o saldo líquido das movimentações em [start, end)."""
+    source = movement_source(start)
+    query = select(source.product_id, _signed_quantity(source).label('delta'))
+    if start is not None:
+        query = query.where(source.date >= start)
+    if end is not None:
+        query = query.where(source.date < end)
+    if product_ids is not None:
+        query = query.where(source.product_id.in_(product_ids))
+    return query.group_by(source.product_id).subquery()
+
+
+def take_snapshot(at=None):
+    """
+    Grava a rodada de fotos em 'at' (padrão: meia-noite de hoje). Retorna
+    quantos produtos ganharam foto. Rodar de novo para o mesmo 'at' não faz nada.
+    """
+    at = at or datetime.combine(datetime.now().date(), time.min)
+    if at > datetime.now():
+        raise SnapshotError('A foto não pode ser no futuro: movimentações ainda podem entrar antes dela.')
+    previous = last_snapshot_at()
+    if previous is not None and at <= previous:
+        if at == previous:
+            return 0
+        raise SnapshotError(f'Já existe foto posterior ({previous:%Y-%m-%d %H:%M}); as fotos só avançam.')
+
+    deltas = db.session.execute(select(_deltas(previous, at))).all()
+    written = 0
+    for start in range(0, len(deltas), CHUNK_SIZE):
+        chunk = deltas[start:start + CHUNK_SIZE]
+        ids = [row.product_id for row in chunk]
+        base = dict(db.session.execute(select(_latest_snapshots(at, ids))).all())
+        db.session.execute(insert(StockSnapshot), [
+            {'product_id': row.product_id, 'taken_at': at, 'quantity': base.get(row.product_id, 0) + row.delta}
+            for row in chunk
+        ])
+        written += len(chunk)
+    return written
+
+
+def balances_at(at=None, product_ids=None):
+    """
+    {product_id: saldo} em 'at' (None = agora) pelo extrato, para os produtos
+    pedidos (None = todos os que têm foto ou movimentação).
+    """
+    snapshot_at = last_snapshot_at(at)
+    balances = {}
+    if snapshot_at is not None:
+        balances.update(db.session.execute(select(_latest_snapshots(snapshot_at, product_ids))).all())
+    for product_id, delta in db.session.execute(select(_deltas(snapshot_at, at, product_ids))).all():
+        balances[product_id] = balances.get(product_id, 0) + delta
+    if product_ids is not None:
+        return {product_id: balances.get(product_id, 0) for product_id in product_ids}
+    return balances
+
+
+def balance_at(product_id, at=None):
+    """Saldo de um produto em 'at' (None = agora) pelo extrato."""
+    return balances_at(at, [product_id])[product_id]
+
+
+def reconcile():
+    """
+    Produtos cujo saldo gravado (Product.quantity) difere do extrato. Uma
+    consulta: última foto + movimentações desde ela, contra cada produto.
+    Causa comum: saldo que não veio de movimentação (quantity de SKU novo
+    na importação, edição direta no banco).
+    """
+    snapshot_at = last_snapshot_at()
+    ledger = literal(0)
+    query = select(Product.id, Product.sku, Product.name, Product.quantity)
+    if snapshot_at is not None:
+        base = _latest_snapshots(snapshot_at)
+        query = query.outerjoin(base, base.c.product_id == Product.id)
+        ledger = func.coalesce(base.c.quantity, 0)
+    deltas = _deltas(snapshot_at, None)
+    ledger = ledger + func.coalesce(deltas.c.delta, 0)
+    query = query.add_columns(ledger.label('ledger')).outerjoin(deltas, deltas.c.product_id == Product.id)\
+        .where(func.coalesce(Product.quantity, 0) != ledger).order_by(Product.id)
+    return [Discrepancy(*row) for row in db.session.execute(query)]
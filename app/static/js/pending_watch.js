@@ -0,0 +1,67 @@
+// Observa o contador de recebimentos pendentes sem recarregar a página inteira.
+// Com SSE (streamUrl, só quando o servidor roda workers assíncronos), escuta
+// /events/stream e só consulta /orders/status quando chega um aviso de
+// pedido. Sem SSE, ou se o servidor recusar o stream (204/503), consulta
+// /orders/status com ?wait=: se o servidor segurou a resposta (longpoll=true)
+// pergunta de novo logo em seguida; senão espera 'interval'. Em todos os
+// casos onChange só é chamado quando a versão muda.
+function watchPendingOrders(options) {
+    let version = options.version;
+    const interval = options.interval || 15000; // espera sem long-poll ou depois de uma falha
+    const wait = options.wait || 20;            // segundos (o servidor limita a PENDING_LONGPOLL_MAX)
+
+    function check(waitSeconds) {
+        let url = options.url + '?since=' + encodeURIComponent(version);
+        if (waitSeconds) {
+            url += '&wait=' + waitSeconds;
+        }
+        return fetch(url, {
+            credentials: 'same-origin',
+            headers: { 'Accept': 'application/json' }
+        })
+            .then(function(response) { return response.ok ? response.json() : null; })
+            .then(function(data) {
+                if (!data) {
+                    throw new Error('status indisponível');
+                }
+                if (data.changed) {
+                    version = data.version;
+                    options.onChange(data);
+                }
+                return data;
+            });
+    }
+
+    function checkOnce() {
+        check().catch(function() { /* rede instável: tenta de novo no próximo aviso */ });
+    }
+
+    if (options.streamUrl && window.EventSource) {
+        const source = new EventSource(options.streamUrl);
+        ['order_created', 'order_completed', 'order_deleted'].forEach(function(name) {
+            source.addEventListener(name, checkOnce);
+        });
+        // Ao reconectar, confere se algo mudou enquanto estava desconectado
+        source.addEventListener('open', checkOnce);
+        // 204 (SSE desligado) ou 503 (limite de conexões): o navegador desiste do stream
+        source.addEventListener('error', function() {
+            if (source.readyState === EventSource.CLOSED) {
+                poll();
+            }
+        });
+        return;
+    }
+
+    function poll() {
+        const started = Date.now();
+        check(wait)
+            .then(function(data) {
+                // Servidor sem long-poll (workers síncronos ou no limite): volta ao intervalo.
+                // Com long-poll, no mínimo 1s entre pedidos (proxy que não segura a conexão)
+                const delay = data.longpoll ? 1000 : interval;
+                setTimeout(poll, Math.max(0, delay - (Date.now() - started)));
+            })
+            .catch(function() { setTimeout(poll, interval); });
+    }
+    poll();
+}
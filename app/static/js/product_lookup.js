@@ -0,0 +1,136 @@
+// Autocomplete de produto: substitui o <select> com o catálogo inteiro.
+// O usuário digita SKU ou começo do nome; depois de uma pausa curta o campo
+// consulta /api/products/lookup e mostra as sugestões numa lista própria
+// (.dropdown-menu, role="listbox"). Não usamos <datalist>: o navegador filtra
+// as opções de novo pelo texto digitado, sem ignorar acentos, e escondia
+// "Açúcar" de quem digitou "acucar" (a API já encontrou). Ao escolher uma
+// sugestão (clique, setas + Enter), o id vai para o campo oculto 'product_id'
+// (é ele que o formulário envia). Editar o texto depois limpa o id, e o
+// 'required' do campo visível impede enviar sem produto.
+function attachProductLookup(options) {
+    const input = document.getElementById(options.input);
+    const hidden = document.getElementById(options.hidden);
+    const list = document.getElementById(options.list);
+    const delay = options.delay || 200;
+    let timer = null;
+    let controller = null;
+    let active = -1; // sugestão destacada pelo teclado
+
+    function label(product) {
+        return product.sku + ' - ' + product.name + (options.showQuantity ? ' (' + product.quantity + ')' : '');
+    }
+
+    function items() {
+        return list.querySelectorAll('[role="option"]');
+    }
+
+    function close() {
+        list.classList.remove('show');
+        input.setAttribute('aria-expanded', 'false');
+        active = -1;
+    }
+
+    function highlight(position) {
+        const options = items();
+        if (!options.length) {
+            return;
+        }
+        active = (position + options.length) % options.length;
+        options.forEach(function(item, i) {
+            item.classList.toggle('active', i === active);
+            item.setAttribute('aria-selected', i === active ? 'true' : 'false');
+        });
+        options[active].scrollIntoView({ block: 'nearest' });
+    }
+
+    function choose(item) {
+        input.value = item.textContent;
+        hidden.value = item.dataset.id;
+        input.setCustomValidity('');
+        close();
+    }
+
+    function render(results) {
+        list.innerHTML = '';
+        active = -1;
+        results.forEach(function(product) {
+            const item = document.createElement('button');
+            item.type = 'button';
+            item.className = 'dropdown-item text-truncate';
+            item.setAttribute('role', 'option');
+            item.dataset.id = product.id;
+            item.textContent = label(product);
+            list.appendChild(item);
+        });
+        if (!results.length) {
+            const empty = document.createElement('span');
+            empty.className = 'dropdown-item-text text-muted small';
+            empty.textContent = 'Nenhum produto encontrado.';
+            list.appendChild(empty);
+        }
+        list.classList.add('show');
+        input.setAttribute('aria-expanded', 'true');
+    }
+
+    function search(term) {
+        if (controller) {
+            controller.abort(); // resposta antiga não sobrescreve a nova
+        }
+        controller = window.AbortController ? new AbortController() : null;
+        let url = options.url + '?q=' + encodeURIComponent(term);
+        if (options.supplierId) {
+            url += '&supplier_id=' + encodeURIComponent(options.supplierId);
+        }
+        fetch(url, {
+            credentials: 'same-origin',
+            headers: { 'Accept': 'application/json' },
+            signal: controller ? controller.signal : undefined
+        })
+            .then(function(response) { return response.ok ? response.json() : { results: [] }; })
+            .then(function(data) { render(data.results); })
+            .catch(function() { /* abortada ou rede instável: a próxima tecla tenta de novo */ });
+    }
+
+    input.setAttribute('role', 'combobox');
+    input.setAttribute('aria-controls', options.list);
+    input.setAttribute('aria-expanded', 'false');
+
+    input.addEventListener('input', function() {
+        const text = input.value;
+        hidden.value = '';
+        input.setCustomValidity(text ? 'Escolha um produto da lista.' : '');
+        clearTimeout(timer);
+        if (text.trim().length >= (options.minLength || 1)) {
+            timer = setTimeout(function() { search(text.trim()); }, delay);
+        } else {
+            close();
+        }
+    });
+
+    input.addEventListener('keydown', function(event) {
+        if (!list.classList.contains('show')) {
+            return;
+        }
+        if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+            event.preventDefault();
+            highlight(active + (event.key === 'ArrowDown' ? 1 : -1));
+        } else if (event.key === 'Enter' && active >= 0) {
+            event.preventDefault(); // escolhe a sugestão em vez de enviar o formulário
+            choose(items()[active]);
+        } else if (event.key === 'Escape') {
+            close();
+        }
+    });
+
+    // mousedown (antes do blur): o clique numa sugestão não fecha a lista antes da hora
+    list.addEventListener('mousedown', function(event) {
+        event.preventDefault();
+    });
+    list.addEventListener('click', function(event) {
+        const item = event.target.closest('[role="option"]');
+        if (item) {
+            choose(item);
+        }
+    });
+    input.addEventListener('blur', close);
+}
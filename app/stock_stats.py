@@ -0,0 +1,199 @@
+"""
+Agregados de estoque (KPIs do relatório /reports).
+
+Em vez de carregar o catálogo inteiro a cada visualização do relatório,
+mantemos a tabela StockSummary (uma linha por categoria) atualizada de forma
+incremental: toda rota que mexe em estoque ou preço captura o "estado" do
+produto antes e depois da alteração e aplica apenas a diferença.
+
+Fluxo típico dentro de uma rota:
+
+    before = product_state(product)
+    product.quantity += 10
+    apply_change(before, product_state(product))
+    db.session.commit()
+"""
+from collections import defaultdict, namedtuple
+from datetime import datetime
+
+from sqlalchemy import case, func, insert, literal_column, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app.models import Category, Product, StockSummary
+
+# Contribuição de um produto ATIVO para os agregados da sua categoria
+ProductState = namedtuple('ProductState', 'category_id quantity cost price min_level')
+
+# Colunas somáveis de StockSummary
+SUMMARY_FIELDS = ('product_count', 'total_quantity', 'total_cost', 'total_revenue', 'low_stock_count')
+
+
+def _to_int(value):
+    # Formulários entregam strings ('' = sem categoria)
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def product_state(product):
+    """Retorna a contribuição atual do produto (None se não existe ou está arquivado)."""
+    # active=None acontece antes do primeiro flush (default do banco ainda não aplicado)
+    if product is None or product.active is False:
+        return None
+    return ProductState(
+        category_id=_to_int(product.category_id),
+        quantity=product.quantity or 0,
+        cost=product.cost or 0.0,
+        price=product.price or 0.0,
+        min_level=product.min_level if product.min_level is not None else 5,
+    )
+
+
+def _contribution(state):
+    return {
+        'product_count': 1,
+        'total_quantity': state.quantity,
+        'total_cost': state.quantity * state.cost,
+        'total_revenue': state.quantity * state.price,
+        'low_stock_count': 1 if state.quantity <= state.min_level else 0,
+    }
+
+
+def _category_key():
+    # Mesma expressão do índice único uq_stock_summary_category_key (NULL = 0). O 0 vai
+    # literal: com parâmetro o ON CONFLICT não reconhece o índice
+    return func.coalesce(StockSummary.category_id, literal_column('0'))
+
+
+def _category_filter(category_id):
+    return _category_key() == (category_id or 0)
+
+
+def _create_row(category_id):
+    """Linha zerada da categoria. Se outro worker a criou ao mesmo tempo, não faz nada."""
+    values = dict(category_id=category_id, product_count=0, total_quantity=0,
+                  total_cost=0.0, total_revenue=0.0, low_stock_count=0)
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert_fn = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert_fn(StockSummary).values(values).on_conflict_do_nothing(index_elements=[_category_key()])
+    else:
+        stmt = insert(StockSummary).values(values)
+    db.session.execute(stmt)
+
+
+def apply_changes(changes):
+    """
+    Aplica uma lista de pares (antes, depois) aos agregados.
+    As diferenças são somadas por categoria e gravadas com UPDATE relativo
+    (coluna = coluna + delta), seguro entre vários workers.
+    Não faz commit: participa da transação da rota.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for before, after in changes:
+        if before == after:
+            continue
+        if before is not None:
+            for field, value in _contribution(before).items():
+                deltas[before.category_id][field] -= value
+        if after is not None:
+            for field, value in _contribution(after).items():
+                deltas[after.category_id][field] += value
+
+    if not deltas:
+        return
+
+    existing = {row[0] for row in db.session.query(StockSummary.category_id).all()}
+    for category_id, delta in deltas.items():
+        values = {getattr(StockSummary, f): getattr(StockSummary, f) + v for f, v in delta.items() if v}
+        if not values:
+            continue
+        if category_id not in existing:
+            _create_row(category_id)
+        values[StockSummary.updated_at] = datetime.now()
+        db.session.execute(
+            update(StockSummary).where(_category_filter(category_id)).values(values),
+            execution_options={'synchronize_session': False},
+        )
+
+
+def apply_change(before, after):
+    """Atalho para um único produto."""
+    apply_changes([(before, after)])
+
+
+def _full_scan():
+    """Calcula os agregados direto da tabela de produtos (uma query agrupada)."""
+    quantity = func.coalesce(Product.quantity, 0)
+    rows = db.session.query(
+        Product.category_id,
+        func.count(Product.id),
+        func.coalesce(func.sum(quantity), 0),
+        func.coalesce(func.sum(quantity * func.coalesce(Product.cost, 0.0)), 0.0),
+        func.coalesce(func.sum(quantity * func.coalesce(Product.price, 0.0)), 0.0),
+        func.coalesce(func.sum(case((quantity <= Product.min_level, 1), else_=0)), 0),
+    ).filter(Product.active.is_(True)).group_by(Product.category_id).all()
+
+    return {
+        row[0]: dict(zip(SUMMARY_FIELDS, (int(row[1]), int(row[2]), float(row[3]), float(row[4]), int(row[5]))))
+        for row in rows
+    }
+
+
+def rebuild_stock_summary():
+    """Reconstrói StockSummary do zero a partir de uma varredura completa. Não faz commit."""
+    scan = _full_scan()
+    StockSummary.query.delete()
+    for category_id, values in scan.items():
+        db.session.add(StockSummary(category_id=category_id, **values))
+    db.session.flush()
+    return len(scan)
+
+
+def verify_stock_summary(tolerance=0.01):
+    """
+    Compara os agregados mantidos com a varredura completa.
+    Retorna a lista de divergências (vazia = consistente).
+    """
+    scan = _full_scan()
+    stored = {row.category_id: row for row in StockSummary.query.all()}
+
+    problems = []
+    for category_id in set(scan) | set(stored):
+        expected = scan.get(category_id, dict.fromkeys(SUMMARY_FIELDS, 0))
+        row = stored.get(category_id)
+        for field in SUMMARY_FIELDS:
+            actual = getattr(row, field) if row is not None else 0
+            if abs((actual or 0) - expected[field]) > tolerance:
+                problems.append({
+                    'category_id': category_id,
+                    'field': field,
+                    'stored': actual,
+                    'expected': expected[field],
+                })
+    return problems
+
+
+def _summary_rows():
+    return db.session.query(StockSummary, Category.name)\
+        .outerjoin(Category, StockSummary.category_id == Category.id)\
+        .order_by(Category.name).all()
+
+
+def load_summary():
+    """
+    Lê os agregados para o relatório: totais globais + linhas por categoria.
+    Só leitura (roda em réplica): a tabela é preenchida pela migração e corrigida
+    com 'flask rebuild-stats'.
+    """
+    rows = _summary_rows()
+    totals = dict.fromkeys(SUMMARY_FIELDS, 0)
+    categories = []
+    for summary, name in rows:
+        for field in SUMMARY_FIELDS:
+            totals[field] += getattr(summary, field) or 0
+        categories.append({'category_id': summary.category_id, 'name': name, 'total_cost': summary.total_cost or 0.0})
+
+    totals['categories'] = categories
+    return totals
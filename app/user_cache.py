@@ -0,0 +1,121 @@
+"""
+Usuário logado sem ida ao banco a cada requisição (user_loader do Flask-Login).
+
+O load_user fazia User.query.get() em toda requisição autenticada, inclusive
+nas que não tocam no banco (long-poll de pendentes, /media, JSON das tarefas).
+As telas só usam id, username e role; aqui:
+
+    - o usuário fica no cache de dados de referência (namespace 'users') como
+      SessionUser, um objeto simples com esses campos (objeto ORM não
+      sobrevive à sessão), por USER_CACHE_TTL segundos;
+    - user_edit/user_delete (e o create-admin) chamam invalidate() antes do
+      commit: a versão do namespace sobe depois do commit;
+    - no login a sessão do Flask guarda um carimbo (HMAC de role + hash da
+      senha). Se o cache devolve carimbo diferente, relê do banco: entrada
+      velha de outro worker vira a nova; se o banco também difere, a função
+      ou a senha mudou depois do login e a sessão deixa de valer.
+
+Com o backend LRU, mudança feita em outro worker chega em até USER_CACHE_TTL.
+Por isso, com mais de um worker use CACHE_URL (Redis); sem ele, as rotas de
+administrador (admin_required) conferem função e carimbo no banco a cada acesso.
+"""
+import hashlib
+import hmac
+import os
+
+from flask import current_app, session
+from flask_login import UserMixin, current_user, user_logged_in
+
+from app.cache import LRUBackend
+from app.extensions import db, login_manager
+from app.models import User
+from app.reference_data import get_cache, mark_changed
+
+NAMESPACE = 'users'
+STAMP_KEY = '_user_stamp'
+
+
+class SessionUser(UserMixin):
+    """O usuário como fica no cache: só o que rotas e templates usam de current_user."""
+
+    def __init__(self, id, username, role, stamp):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.stamp = stamp
+
+    def __repr__(self):
+        return f'<SessionUser {self.id} {self.username} ({self.role})>'
+
+
+def stamp(user):
+    # HMAC com a SECRET_KEY: o cookie de sessão é legível pelo navegador
+    message = f'{user.role}:{user.password_hash}'.encode()
+    return hmac.new(current_app.secret_key.encode(), message, hashlib.sha256).hexdigest()[:16]
+
+
+def _load(user_id):
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    return SessionUser(user.id, user.username, user.role, stamp(user))
+
+
+def load_user(user_id):
+    user_id = int(user_id)
+    cache = get_cache()
+    ttl = current_app.config['USER_CACHE_TTL']
+    cached = cache.get_or_set(NAMESPACE, str(user_id), lambda: _load(user_id), ttl=ttl)
+    expected = session.get(STAMP_KEY)
+    if cached is None or expected is None:
+        if cached is not None:
+            session[STAMP_KEY] = cached.stamp # login pelo cookie "lembrar-me" ou sessão anterior ao carimbo
+        return cached
+    if cached.stamp == expected:
+        return cached
+
+    fresh = _load(user_id)
+    if fresh is None or fresh.stamp != expected:
+        return None # função ou senha mudou depois do login: precisa entrar de novo
+    cache.bump(NAMESPACE) # a entrada deste worker estava velha
+    return fresh
+
+
+def confirm_admin():
+    """
+    current_user é administrador? Com o LRU (cache por worker) confere no banco
+    (uma busca pela PK): rebaixamento feito em outro worker vale na hora, não
+    depois de USER_CACHE_TTL. Com Redis a invalidação já chega a todos.
+    """
+    if not current_user.is_authenticated or current_user.role != 'admin':
+        return False
+    cache = get_cache()
+    if not isinstance(cache.backend, LRUBackend):
+        return True
+    fresh = _load(int(current_user.id))
+    if fresh is not None and fresh.role == 'admin' and fresh.stamp == session.get(STAMP_KEY, fresh.stamp):
+        return True
+    cache.bump(NAMESPACE) # a próxima requisição relê o usuário (e derruba a sessão se o carimbo mudou)
+    return False
+
+
+def invalidate():
+    """Invalida os usuários em cache depois do commit da sessão atual."""
+    mark_changed(NAMESPACE)
+
+
+def refresh_stamp(user):
+    """Recarimba a sessão atual (o próprio usuário trocou a senha ou a função)."""
+    session[STAMP_KEY] = stamp(user)
+
+
+def _stamp_session(sender, user, **extra):
+    session[STAMP_KEY] = getattr(user, 'stamp', None) or stamp(user)
+
+
+def init_app(app):
+    if not app.config['CACHE_URL'] and int(os.environ.get('WEB_CONCURRENCY', 1)) > 1:
+        app.logger.warning('Vários workers sem CACHE_URL: mudança de função/senha leva até '
+                           'USER_CACHE_TTL para valer nas rotas comuns (as de admin conferem no banco).')
+    login_manager.user_loader(load_user)
+    user_logged_in.connect(_stamp_session, app)
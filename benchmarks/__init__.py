@@ -0,0 +1 @@
+"""Benchmarks do Stock Master (rodar com: python -m benchmarks.<script>)."""
@@ -0,0 +1,71 @@
+"""
+Resultados dos benchmarks em JSON comparável.
+
+Formato:
+
+    {"meta": {...},
+     "client": {"index_search": {"requests": 200, "errors": 0, "throughput_rps": 512.3,
+                                 "p50_ms": 1.8, "p99_ms": 4.1, "mean_ms": 1.9}, ...},
+     "load":   {...mesmo formato..., "total": {...}}}
+
+compare() aponta as regressões de um resultado novo contra um baseline salvo.
+"""
+import json
+import math
+import statistics
+
+
+def percentile(values, pct):
+    """Percentil pelo método nearest-rank (valores já em ms)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies_ms, errors, elapsed_s):
+    count = len(latencies_ms)
+    return {
+        'requests': count,
+        'errors': errors,
+        'throughput_rps': round(count / elapsed_s, 2) if elapsed_s else 0.0,
+        'p50_ms': round(percentile(latencies_ms, 50), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+        'mean_ms': round(statistics.fmean(latencies_ms), 3) if latencies_ms else 0.0,
+    }
+
+
+def save(path, result):
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True, default=str)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, tolerance=0.2):
+    """
+    Lista de regressões (texto) do resultado 'current' contra 'baseline'.
+
+    Regressão = p50/p99 mais de 'tolerance' acima do baseline, throughput mais
+    de 'tolerance' abaixo, ou erros onde antes não havia. Cenários que só
+    existem de um dos lados são ignorados.
+    """
+    regressions = []
+    for section in ('client', 'load'):
+        for name, base in baseline.get(section, {}).items():
+            now = current.get(section, {}).get(name)
+            if now is None:
+                continue
+            label = f'{section}.{name}'
+            for key in ('p50_ms', 'p99_ms'):
+                if base[key] and now[key] > base[key] * (1 + tolerance):
+                    regressions.append(f'{label}: {key} {base[key]:.3f} -> {now[key]:.3f}')
+            if base['throughput_rps'] and now['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+                regressions.append(f"{label}: throughput {base['throughput_rps']:.1f} -> {now['throughput_rps']:.1f} req/s")
+            if now['errors'] and not base['errors']:
+                regressions.append(f"{label}: {now['errors']} erros (baseline sem erros)")
+    return regressions
@@ -0,0 +1,113 @@
+"""
+Gerador de armazéns sintéticos para os benchmarks.
+
+Povoa um banco vazio com inserts em massa (executemany em lotes de CHUNK
+linhas, sem ORM). O mesmo rng_seed gera sempre os mesmos dados, então dois
+runs do benchmark (antes/depois de uma mudança) medem exatamente a mesma base.
+
+Escalas prontas (SCALES) vão de 'tiny' (testes) a 'large' (1M produtos,
+50M movimentações, 100k pedidos). Um usuário admin BENCH_USER/BENCH_PASSWORD
+é criado para o driver de rotas fazer login.
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from app.models import Category, Movement, Product, PurchaseOrder, PurchaseOrderItem, Supplier, User
+
+CHUNK = 10000
+
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench123'
+
+# Tamanhos: produtos, movimentações, pedidos, fornecedores, usuários
+SCALES = {
+    'tiny': dict(products=200, movements=2000, orders=50, suppliers=5, users=3),
+    'small': dict(products=20000, movements=300000, orders=5000, suppliers=50, users=20),
+    'medium': dict(products=200000, movements=5000000, orders=20000, suppliers=200, users=50),
+    'large': dict(products=1000000, movements=50000000, orders=100000, suppliers=500, users=100),
+}
+
+CATEGORIES = ['Bebidas', 'Alimentos', 'Eletrônicos', 'Limpeza', 'Higiene', 'Bazar', 'Papelaria', 'Ferramentas']
+NOUNS = ['Cerveja', 'Refrigerante', 'Chocolate', 'Biscoito', 'Sabão', 'Detergente', 'Shampoo', 'Caderno',
+         'Martelo', 'Cabo', 'Carregador', 'Café', 'Arroz', 'Feijão', 'Suco', 'Água']
+VARIANTS = ['Lata 350ml', 'Pet 2L', '1kg', '500g', 'Pacote', 'Caixa', 'Unidade', 'Refil', 'Premium', 'Light']
+
+PENDING_RATIO = 0.02   # pedidos ainda aguardando conferência
+ITEMS_PER_ORDER = 5
+
+
+def _chunks(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= CHUNK:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def product_name(rng, i):
+    return f'{rng.choice(NOUNS)} {rng.choice(VARIANTS)} {i}'
+
+
+def seed(engine, products, movements, orders, suppliers=50, users=20, rng_seed=42, progress=None):
+    """
+    Povoa o banco (tabelas já criadas) com inserts em massa.
+    'progress', se informado, recebe (tabela, linhas inseridas) a cada lote.
+    """
+    rng = random.Random(rng_seed)
+    now = datetime.now()
+    report = progress or (lambda table, count: None)
+
+    def insert_batches(conn, model, rows):
+        total = 0
+        for batch in _chunks(rows):
+            conn.execute(insert(model.__table__), batch)
+            total += len(batch)
+            report(model.__tablename__, total)
+
+    with engine.begin() as conn:
+        # Hash calculado uma vez só (é lento de propósito)
+        password_hash = generate_password_hash(BENCH_PASSWORD)
+        conn.execute(insert(User.__table__), [{'username': BENCH_USER, 'password_hash': password_hash, 'role': 'admin'}] + [
+            {'username': f'user{i}', 'password_hash': password_hash, 'role': 'operator'} for i in range(1, users)])
+        conn.execute(insert(Category.__table__), [{'name': name} for name in CATEGORIES])
+        conn.execute(insert(Supplier.__table__), [
+            {'name': f'Fornecedor {i}', 'cnpj': f'{i:014d}'} for i in range(1, suppliers + 1)])
+
+        insert_batches(conn, Product, ({
+            'name': product_name(rng, i), 'sku': f'SKU-{i:07d}', 'quantity': rng.randint(0, 500),
+            'min_level': 5, 'cost': round(rng.uniform(1, 100), 2), 'price': round(rng.uniform(2, 200), 2),
+            'active': rng.random() > 0.05,
+            'category_id': rng.randint(1, len(CATEGORIES)), 'supplier_id': rng.randint(1, suppliers),
+        } for i in range(1, products + 1)))
+
+        insert_batches(conn, Movement, ({
+            'type': rng.choice(('IN', 'OUT')), 'quantity': rng.randint(1, 20),
+            'date': now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60)),
+            'user_id': rng.randint(1, users), 'product_id': rng.randint(1, products),
+        } for _ in range(movements)))
+
+        insert_batches(conn, PurchaseOrder, ({
+            'invoice_number': f'NF-{i}', 'supplier_id': (i % suppliers) + 1,
+            'status': 'pending' if rng.random() < PENDING_RATIO else 'completed',
+            'created_at': now - timedelta(days=rng.randint(0, 730)), 'created_by_id': rng.randint(1, users),
+        } for i in range(1, orders + 1)))
+
+        # Itens distintos por pedido (a conferência soma por produto)
+        insert_batches(conn, PurchaseOrderItem, ({
+            'purchase_order_id': order_id, 'product_id': product_id,
+            'quantity_expected': 10, 'quantity_received': 0, 'unit_cost': 1.0,
+        } for order_id in range(1, orders + 1)
+            for product_id in rng.sample(range(1, products + 1), min(ITEMS_PER_ORDER, products))))
+
+
+def seed_scale(engine, scale, rng_seed=42, progress=None):
+    """Atalho: seed() com uma das escalas de SCALES. Retorna os tamanhos usados."""
+    sizes = SCALES[scale]
+    seed(engine, rng_seed=rng_seed, progress=progress, **sizes)
+    return sizes
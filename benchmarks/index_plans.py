@@ -0,0 +1,146 @@
+"""
+Benchmark dos índices dos caminhos quentes (migração 8c41e07b2a93).
+
+Cria um banco SQLite temporário (ou usa --database-url), povoa com um volume
+grande de dados sintéticos e roda as consultas das rotas duas vezes: sem os
+índices ("antes") e com eles ("depois"), mostrando o plano de execução e o
+tempo mediano de cada uma.
+
+    python -m benchmarks.index_plans --products 50000 --movements 1000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+from app.extensions import db
+from benchmarks.datagen import seed
+
+# Consultas equivalentes às das rotas: (SQL, função que sorteia os parâmetros)
+HOT_QUERIES = {
+    'movimentos_hoje_usuario (new_movement)': (
+        "SELECT id, type, quantity, date FROM movement WHERE user_id = :user_id AND date >= :since ORDER BY date DESC",
+        lambda ctx: {'user_id': random.randint(1, ctx['users']), 'since': ctx['today']},
+    ),
+    'extrato_produto (product_details)': (
+        "SELECT id, type, quantity, date FROM movement WHERE product_id = :product_id ORDER BY date DESC LIMIT 50",
+        lambda ctx: {'product_id': random.randint(1, ctx['products'])},
+    ),
+    'pedidos_pendentes (menu)': (
+        "SELECT count(*) FROM purchase_order WHERE status = 'pending'",
+        lambda ctx: {},
+    ),
+    'nf_duplicada (new_order)': (
+        "SELECT id FROM purchase_order WHERE supplier_id = :supplier_id AND invoice_number = :invoice LIMIT 1",
+        lambda ctx: {'supplier_id': random.randint(1, ctx['suppliers']), 'invoice': f"NF-{random.randint(1, ctx['orders'])}"},
+    ),
+    'produtos_fornecedor (order_details)': (
+        "SELECT id, name FROM product WHERE supplier_id = :supplier_id AND active = :active",
+        lambda ctx: {'supplier_id': random.randint(1, ctx['suppliers']), 'active': True},
+    ),
+    'itens_pedido (receive_check)': (
+        "SELECT id, product_id FROM purchase_order_item WHERE purchase_order_id = :order_id",
+        lambda ctx: {'order_id': random.randint(1, ctx['orders'])},
+    ),
+}
+
+
+def hot_indexes():
+    """Todos os índices declarados nos models (os que a migração cria)."""
+    return [index for table in db.metadata.sorted_tables for index in table.indexes]
+
+
+def explain(conn, sql, params):
+    if conn.dialect.name == 'sqlite':
+        rows = conn.execute(text('EXPLAIN QUERY PLAN ' + sql), params).all()
+        return ' | '.join(row[-1] for row in rows)
+    if conn.dialect.name == 'postgresql':
+        rows = conn.execute(text('EXPLAIN ' + sql), params).all()
+        return ' | '.join(row[0].strip() for row in rows)
+    return '-'
+
+
+def measure(engine, repeat, ctx):
+    results = {}
+    with engine.connect() as conn:
+        for name, (sql, make_params) in HOT_QUERIES.items():
+            timings = []
+            for _ in range(repeat):
+                params = make_params(ctx)
+                started = time.perf_counter()
+                conn.execute(text(sql), params).all()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = {'median_ms': statistics.median(timings), 'plan': explain(conn, sql, make_params(ctx))}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Banco vazio para o teste (padrão: SQLite temporário)')
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--movements', type=int, default=300000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', help='Salva o resultado neste arquivo')
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    url = args.database_url
+    if not url:
+        tmpdir = tempfile.mkdtemp(prefix='stockmaster-bench-')
+        url = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+
+    engine = create_engine(url)
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+
+    print(f'Povoando {args.products} produtos, {args.movements} movimentações, {args.orders} pedidos...')
+    started = time.perf_counter()
+    seed(engine, args.products, args.movements, args.orders)
+    print(f'  pronto em {time.perf_counter() - started:.1f}s')
+
+    ctx = {'users': 20, 'suppliers': 50, 'products': args.products, 'orders': args.orders,
+           'today': datetime.combine(datetime.now().date(), datetime.min.time())}
+
+    indexes = hot_indexes()
+    for index in indexes:
+        index.drop(engine)
+    with engine.begin() as conn:
+        if conn.dialect.name in ('sqlite', 'postgresql'):
+            conn.execute(text('ANALYZE'))
+    before = measure(engine, args.repeat, ctx)
+
+    for index in indexes:
+        index.create(engine)
+    with engine.begin() as conn:
+        if conn.dialect.name in ('sqlite', 'postgresql'):
+            conn.execute(text('ANALYZE'))
+    after = measure(engine, args.repeat, ctx)
+
+    for name in HOT_QUERIES:
+        b, a = before[name], after[name]
+        speedup = b['median_ms'] / a['median_ms'] if a['median_ms'] else float('inf')
+        print(f'\n{name}')
+        print(f"  antes : {b['median_ms']:9.3f} ms  {b['plan']}")
+        print(f"  depois: {a['median_ms']:9.3f} ms  {a['plan']}")
+        print(f'  ganho : {speedup:.1f}x')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'before': before, 'after': after}, f, indent=2, default=str)
+
+    db.metadata.drop_all(engine)
+    engine.dispose()
+    if tmpdir:
+        os.remove(os.path.join(tmpdir, 'bench.db'))
+        os.rmdir(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
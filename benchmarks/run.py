@@ -0,0 +1,150 @@
+"""
+Benchmark das rotas com um armazém sintético.
+
+Povoa um banco (SQLite temporário ou --database-url vazio) numa das escalas de
+benchmarks.datagen, roda cada cenário pelo test client e, com --concurrency,
+uma carga HTTP concorrente contra um servidor local (ou --base-url). Grava
+throughput e latências p50/p99 em JSON e compara com um baseline salvo:
+
+    python -m benchmarks.run --scale small --save baseline.json
+    # ...mudança no código...
+    python -m benchmarks.run --scale small --compare baseline.json   # sai com 1 se regrediu
+
+A escala 'large' (1M produtos, 50M movimentações) leva horas para povoar;
+use --database-url com --skip-seed para reaproveitar um banco já povoado.
+Um --database-url que já tem tabelas só é apagado com --reset explícito.
+"""
+import argparse
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import inspect
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import create_app
+from app.extensions import db
+from benchmarks import baseline
+from benchmarks.datagen import SCALES, seed_scale
+from benchmarks.scenarios import ClientDriver, HttpDriver, build_context, run_load, run_sequential
+from config import Config
+
+
+def bench_config(url):
+    return type('BenchConfig', (Config,), {'SQLALCHEMY_DATABASE_URI': url, 'SQL_DEBUG_PANEL': False})
+
+
+def _progress(table, count):
+    if count % 100000 == 0:
+        print(f'  {table}: {count}', flush=True)
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass # uma linha por requisição atrapalharia a leitura (e o tempo) da carga
+
+
+def start_server(app):
+    """Servidor WSGI local (threads) numa porta livre. Retorna (url, server)."""
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=_QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--database-url', help='Banco para o teste (padrão: SQLite temporário)')
+    parser.add_argument('--skip-seed', action='store_true', help='Usa o banco como está (já povoado nesta escala)')
+    parser.add_argument('--reset', action='store_true', help='Apaga as tabelas de --database-url antes de povoar')
+    parser.add_argument('--seed', type=int, default=42, help='Semente dos dados e dos sorteios')
+    parser.add_argument('--iterations', type=int, default=50, help='Requisições por cenário no test client')
+    parser.add_argument('--concurrency', type=int, default=0, help='Threads da carga HTTP (0 = sem carga)')
+    parser.add_argument('--duration', type=float, default=20.0, help='Segundos de carga HTTP')
+    parser.add_argument('--base-url', help='Servidor já rodando para a carga (padrão: sobe um local)')
+    parser.add_argument('--save', help='Grava o resultado neste JSON')
+    parser.add_argument('--compare', help='Baseline JSON para comparar')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Folga antes de acusar regressão (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    url = args.database_url
+    if not url:
+        tmpdir = tempfile.mkdtemp(prefix='stockmaster-bench-')
+        url = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+
+    app = create_app(bench_config(url))
+    with app.app_context():
+        if not args.skip_seed:
+            existing = inspect(db.engine).get_table_names()
+            if existing and not args.reset:
+                parser.error(f'{url} já tem {len(existing)} tabelas: use --skip-seed para reaproveitar '
+                             'ou --reset para APAGAR tudo e povoar de novo')
+            if existing:
+                print(f'--reset: apagando as tabelas de {url}', flush=True)
+                db.drop_all()
+            db.create_all()
+            print(f'Povoando escala {args.scale}: {SCALES[args.scale]}', flush=True)
+            started = time.perf_counter()
+            seed_scale(db.engine, args.scale, rng_seed=args.seed, progress=_progress)
+            print(f'  pronto em {time.perf_counter() - started:.1f}s')
+        ctx = build_context(SCALES[args.scale])
+        dialect = db.engine.dialect.name
+
+    result = {
+        'meta': {'scale': args.scale, 'sizes': SCALES[args.scale], 'seed': args.seed, 'dialect': dialect,
+                 'iterations': args.iterations, 'concurrency': args.concurrency, 'duration': args.duration,
+                 'python': platform.python_version(), 'created_at': datetime.now().isoformat()},
+    }
+
+    print(f'\nTest client: {args.iterations} requisições por cenário')
+    result['client'] = run_sequential(ClientDriver(app), ctx, args.iterations, rng_seed=args.seed)
+    _print_section(result['client'])
+
+    if args.concurrency:
+        server = None
+        base_url = args.base_url
+        if not base_url:
+            base_url, server = start_server(app)
+        print(f'\nCarga HTTP: {args.concurrency} threads por {args.duration:.0f}s em {base_url}')
+        result['load'] = run_load(lambda: HttpDriver(base_url), ctx, args.concurrency, args.duration,
+                                  rng_seed=args.seed)
+        _print_section(result['load'])
+        if server:
+            server.shutdown()
+
+    if args.save:
+        baseline.save(args.save, result)
+
+    status = 0
+    if args.compare:
+        regressions = baseline.compare(baseline.load(args.compare), result, args.tolerance)
+        if regressions:
+            print('\nREGRESSÕES:')
+            for line in regressions:
+                print(f'  {line}')
+            status = 1
+        else:
+            print('\nSem regressões em relação ao baseline.')
+
+    if tmpdir:
+        with app.app_context():
+            db.engine.dispose()
+        os.remove(os.path.join(tmpdir, 'bench.db'))
+        os.rmdir(tmpdir)
+    return status
+
+
+def _print_section(results):
+    print(f"  {'cenário':<16}{'req':>7}{'erros':>7}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, row in results.items():
+        print(f"  {name:<16}{row['requests']:>7}{row['errors']:>7}{row['throughput_rps']:>10.1f}"
+              f"{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
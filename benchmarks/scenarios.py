@@ -0,0 +1,190 @@
+"""
+Cenários de rota e os dois jeitos de dispará-los.
+
+Cada cenário sorteia uma requisição real (método, caminho, formulário) a partir
+do contexto do banco povoado. Os drivers executam a requisição:
+
+    - ClientDriver: test client do Flask, no mesmo processo (mede a rota sem
+                    rede nem servidor; bom para comparar mudanças de código).
+    - HttpDriver:   HTTP de verdade (urllib) contra um servidor rodando; usado
+                    pelo gerador de carga concorrente (run_load).
+
+Os redirects não são seguidos: um POST que responde 302 conta como uma
+requisição só, como no navegador antes de buscar a próxima página.
+"""
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+from sqlalchemy import select
+
+from app.extensions import db
+from app.models import PurchaseOrder, PurchaseOrderItem
+from benchmarks.baseline import summarize
+from benchmarks.datagen import BENCH_PASSWORD, BENCH_USER, NOUNS
+
+
+def build_context(sizes):
+    """Dados que os cenários sorteiam (chamar dentro do app context)."""
+    rows = db.session.execute(
+        select(PurchaseOrderItem.purchase_order_id, PurchaseOrderItem.id)
+        .join(PurchaseOrder, PurchaseOrder.id == PurchaseOrderItem.purchase_order_id)
+        .where(PurchaseOrder.status == 'pending')
+    ).all()
+    pending = {}
+    for order_id, item_id in rows:
+        pending.setdefault(order_id, []).append(item_id)
+    return {'products': sizes['products'], 'pending_orders': pending}
+
+
+def index_search(ctx, rng):
+    return 'GET', '/?' + urllib.parse.urlencode({'q': rng.choice(NOUNS)[:4]}), None
+
+
+def report(ctx, rng):
+    return 'GET', '/reports/', None
+
+
+def export_csv(ctx, rng):
+    return 'GET', '/reports/export/csv?columns=sku,name,quantity', None
+
+
+def new_movement(ctx, rng):
+    # Entrada: nunca falta saldo, o custo medido é o da gravação
+    data = {'product_id': rng.randint(1, ctx['products']), 'type': 'IN', 'quantity': rng.randint(1, 5)}
+    return 'POST', '/movement/new', data
+
+
+def receive_check(ctx, rng):
+    if not ctx['pending_orders']:
+        return 'GET', '/orders', None
+    order_id = rng.choice(list(ctx['pending_orders']))
+    # Conferência parcial: o pedido continua pendente para as próximas rodadas
+    data = {f'received_{item_id}': 1 for item_id in ctx['pending_orders'][order_id]}
+    data['action'] = 'partial'
+    return 'POST', f'/orders/{order_id}/receive', data
+
+
+SCENARIOS = {
+    'index_search': index_search,
+    'report': report,
+    'export_csv': export_csv,
+    'new_movement': new_movement,
+    'receive_check': receive_check,
+}
+
+# Peso de cada cenário na carga mista (leitura domina, como no depósito)
+LOAD_MIX = {'index_search': 50, 'new_movement': 25, 'receive_check': 10, 'report': 10, 'export_csv': 5}
+
+
+def _login(driver):
+    driver.request('POST', '/auth/login', {'username': BENCH_USER, 'password': BENCH_PASSWORD})
+    # Sem sessão tudo vira 302 para o login, e o benchmark mediria o redirect
+    if driver.request('GET', '/orders', None) != 200:
+        raise RuntimeError(f"Login de '{BENCH_USER}' falhou: o banco foi povoado pelo benchmarks.datagen?")
+
+
+class ClientDriver:
+    def __init__(self, app):
+        self.client = app.test_client()
+        _login(self)
+
+    def request(self, method, path, data):
+        response = self.client.open(path, method=method, data=data)
+        response.get_data() # consome o corpo (streams incluídos)
+        return response.status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect())
+        _login(self)
+
+    def request(self, method, path, data):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def _ok(status):
+    return status < 400
+
+
+def run_sequential(driver, ctx, iterations, rng_seed=42):
+    """Cada cenário 'iterations' vezes, um depois do outro."""
+    rng = random.Random(rng_seed)
+    results = {}
+    for name, scenario in SCENARIOS.items():
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            method, path, data = scenario(ctx, rng)
+            t0 = time.perf_counter()
+            status = driver.request(method, path, data)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            errors += not _ok(status)
+        results[name] = summarize(latencies, errors, time.perf_counter() - started)
+    return results
+
+
+def run_load(make_driver, ctx, concurrency, duration, mix=None, rng_seed=42):
+    """
+    Carga concorrente: 'concurrency' threads, cada uma com seu driver (sessão
+    própria), sorteando cenários pelo peso de 'mix' durante 'duration' segundos.
+    """
+    mix = mix or LOAD_MIX
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        rng = random.Random(rng_seed + index)
+        driver = make_driver()
+        local = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            method, path, data = SCENARIOS[name](ctx, rng)
+            t0 = time.perf_counter()
+            try:
+                status = driver.request(method, path, data)
+            except OSError:
+                status = 599
+            local[name].append((time.perf_counter() - t0) * 1000)
+            local_errors[name] += not _ok(status)
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {name: summarize(samples[name], errors[name], elapsed) for name in names}
+    results['total'] = summarize([ms for name in names for ms in samples[name]], sum(errors.values()), elapsed)
+    return results
@@ -7,6 +7,36 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 # Carrega o .env (apenas para uso local)
 load_dotenv(os.path.join(basedir, '.env'))
 
+
+def database_url(name):
+    """URL do ambiente, com o 'postgres://' do Render corrigido para 'postgresql://'."""
+    url = os.environ.get(name)
+    if url and url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def engine_options(url):
+    """
+    Pool de conexões por deploy (variáveis DB_*). Conta: workers do gunicorn x
+    (DB_POOL_SIZE + DB_MAX_OVERFLOW) tem que caber no max_connections do banco.
+    O SQLite fica com o pool padrão do SQLAlchemy.
+    """
+    if not url or url.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),      # espera por uma conexão livre (s)
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),    # antes do timeout do proxy/servidor (s)
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1', # descarta conexão morta antes de usar
+    }
+    timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if timeout and url.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout}'}
+    return options
+
+
 class Config:
     # Segurança
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'chave-secreta-dev'
@@ -15,14 +45,103 @@ class Config:
     # Gerenciamento de Arquivos
     UPLOAD_FOLDER = os.path.join(basedir, 'app', 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024 # 16MB
+
+    # Imagens pelo hash do conteúdo + miniaturas WebP em segundo plano (ver app/media.py)
+    MEDIA_FOLDER = os.environ.get('MEDIA_FOLDER') or os.path.join(basedir, 'instance', 'media')
+    MEDIA_WORKERS = int(os.environ.get('MEDIA_WORKERS', 2))  # threads de redimensionamento por processo
+    MEDIA_VARIANTS = {'thumb': 96, 'medium': 320}           # lado maior, em px (2x o tamanho exibido)
+
+    # API de movimentações em lote (coletores)
+    MOVEMENT_BATCH_LIMIT = int(os.environ.get('MOVEMENT_BATCH_LIMIT', 5000))
+
+    # Conexões longas (long-poll em /orders/status e SSE em /events/stream) prendem um
+    # worker cada. Com os workers síncronos do gunicorn (padrão) ficam DESLIGADAS e o
+    # navegador consulta a cada 15s. Para ligar: gunicorn -k gevent (ou gthread com
+    # threads de sobra) e STREAMING_WORKERS=1; o SSE com mais de um worker
+    # (WEB_CONCURRENCY > 1) ainda exige EVENT_BUS_URL (Redis).
+    STREAMING_WORKERS = os.environ.get('STREAMING_WORKERS') == '1'
+    STREAM_MAX_CONNECTIONS = int(os.environ.get('STREAM_MAX_CONNECTIONS', 100))  # por processo; acima, sem espera
+
+    # Contador de recebimentos pendentes (cache + long-poll em /orders/status)
+    PENDING_STATUS_TTL = int(os.environ.get('PENDING_STATUS_TTL', 10))      # segundos em cache
+    PENDING_POLL_INTERVAL = 1                                               # checagem durante o long-poll
+    PENDING_LONGPOLL_MAX = int(os.environ.get('PENDING_LONGPOLL_MAX', 25))  # espera máxima por requisição
+
+    # Cache de dados de referência (ver app/reference_data.py)
+    # Sem URL = LRU na memória de cada worker. Com vários workers: redis://...
+    CACHE_URL = os.environ.get('CACHE_URL')
+    REFERENCE_CACHE_TTL = int(os.environ.get('REFERENCE_CACHE_TTL', 300))  # segundos
+    REFERENCE_CACHE_SIZE = 256                                             # chaves no LRU
+    # Usuário logado (app/user_cache.py). Vários workers: use CACHE_URL, senão rebaixar um
+    # admin leva até USER_CACHE_TTL nas rotas comuns (as de admin conferem no banco)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 3600))   # trechos de template (app/http_cache.py)
+    # Sem CACHE_URL as versões das tabelas (ETag/fragmentos) são por worker: a tela de
+    # um worker pode ficar até N segundos sem ver a gravação feita em outro (0 = um worker só)
+    HTTP_CACHE_LOCAL_WINDOW = int(os.environ.get('HTTP_CACHE_LOCAL_WINDOW',
+                                                 30 if int(os.environ.get('WEB_CONCURRENCY', 1)) > 1 else 0))
+
+    # Autocomplete de produtos (ver app/product_lookup.py)
+    # O índice em memória é POR WORKER: ~320 bytes por produto ativo, o dobro durante a
+    # reconstrução (1M produtos ~ 320-650 MB em cada processo do gunicorn). Catálogos
+    # grandes com muitos workers: PRODUCT_LOOKUP_INDEX=0 (prefixo no banco, índice lower(sku))
+    PRODUCT_LOOKUP_INDEX = os.environ.get('PRODUCT_LOOKUP_INDEX', '1') == '1'   # False = prefixo direto no banco
+    PRODUCT_LOOKUP_TTL = int(os.environ.get('PRODUCT_LOOKUP_TTL', 600))    # reconstrução completa (s)
+    PRODUCT_LOOKUP_LIMIT = 20                                              # sugestões por consulta
+
+    # Indicadores do relatório/dashboard (ver app/analytics.py): um cálculo por dia
+    ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', 24 * 3600))
+
+    # Sugestão de compra (ver app/replenishment.py)
+    REORDER_LEAD_TIME_DAYS = int(os.environ.get('REORDER_LEAD_TIME_DAYS', 7))  # prazo sem histórico do fornecedor
+    REORDER_REVIEW_DAYS = int(os.environ.get('REORDER_REVIEW_DAYS', 14))      # consumo coberto por cada compra
+    REORDER_SERVICE_Z = float(os.environ.get('REORDER_SERVICE_Z', 1.65))     # estoque de segurança (~95%)
+
+    # Tarefas em segundo plano ('flask worker', ver app/jobs.py)
+    JOBS_FOLDER = os.environ.get('JOBS_FOLDER') or os.path.join(basedir, 'instance', 'jobs')
+    WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', 2))
+    JOB_POLL_SECONDS = 2             # espera entre consultas com a fila vazia
+    JOB_HEARTBEAT_SECONDS = 10
+    JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 120))  # sem heartbeat: volta para a fila
+    JOB_MAX_ATTEMPTS = 3
+    JOB_RESULT_DAYS = 7              # arquivos de resultado ficam disponíveis por N dias
+
+    # Paginação por chave: até quantas linhas contar para o total (acima disso mostra "N+")
+    PAGINATION_COUNT_CAP = int(os.environ.get('PAGINATION_COUNT_CAP', 10000))
+    # O total é calculado na primeira página e reaproveitado nas seguintes por N segundos
+    PAGINATION_COUNT_TTL = int(os.environ.get('PAGINATION_COUNT_TTL', 60))
+    MOVEMENTS_PER_PAGE = 50
+
+    # Retenção: movimentações mais antigas que isso vão para o arquivo ('flask archive-movements')
+    MOVEMENT_RETENTION_DAYS = int(os.environ.get('MOVEMENT_RETENTION_DAYS', 365))
+
+    # Busca de produtos: 'auto' (FTS5 no SQLite, pg_trgm no PostgreSQL), 'like', 'fts5' ou 'trgm'
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+
+    # Eventos em tempo real (SSE em /events/stream)
+    # Sem URL = barramento em memória (um worker). Com vários workers: redis://...
+    EVENT_BUS_URL = os.environ.get('EVENT_BUS_URL')
+    EVENT_BUS_CHANNEL = 'stockmaster:events'
+    EVENT_STREAM_HEARTBEAT = 15       # segundos entre pings (mantém proxies abertos)
+    EVENT_STREAM_MAX_SECONDS = 300    # o navegador reconecta sozinho depois disso
     
-    # --- AJUSTE SÊNIOR PARA O RENDER ---
-    # Capturamos a URL do ambiente
-    _db_url = os.environ.get('DATABASE_URL')
+    # Painel com as queries de cada página (None = só em modo debug)
+    SQL_DEBUG_PANEL = None
+
+    # Métricas em /metrics (Prometheus) e log de SQL lento (ver app/instrumentation.py)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')                    # se definido, exige "Authorization: Bearer <token>"
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 0)) or None  # 0 = desligado
     
-    # Se a URL existir e começar com 'postgres://', corrigimos para 'postgresql://'
-    if _db_url and _db_url.startswith("postgres://"):
-        _db_url = _db_url.replace("postgres://", "postgresql://", 1)
+    # --- AJUSTE SÊNIOR PARA O RENDER ---
+    # Capturamos a URL do ambiente ('postgres://' corrigido para 'postgresql://')
+    _db_url = database_url('DATABASE_URL')
     
     # Define a URI final (Nuvem ou SQLite local)
-    SQLALCHEMY_DATABASE_URI = _db_url or 'sqlite:///' + os.path.join(basedir, 'instance', 'stock.db')
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = _db_url or 'sqlite:///' + os.path.join(basedir, 'instance', 'stock.db')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+
+    # Réplica de leitura opcional (ver app/db_routing.py)
+    _replica_url = database_url('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = {'replica': {'url': _replica_url, **engine_options(_replica_url)}} if _replica_url else {}
+    DB_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 10))  # lê do primário depois de gravar
@@ -0,0 +1,28 @@
+"""Stock summary: a single row for products without category
+
+Revision ID: 5c8f1e3a9d26
+Revises: e3b9d52c4f71
+Create Date: 2026-10-19 00:12:35.502917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8f1e3a9d26'
+down_revision = 'e3b9d52c4f71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Linhas NULL duplicadas (UNIQUE não as impedia): os totais já não batem.
+    # Esvazia a tabela; a migração seguinte (8d2f6a1c4b90) a preenche de novo.
+    op.execute("DELETE FROM stock_summary WHERE (SELECT COUNT(*) FROM stock_summary WHERE category_id IS NULL) > 1")
+    op.create_index('uq_stock_summary_category_key', 'stock_summary',
+                    [sa.text('coalesce(category_id, 0)')], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_stock_summary_category_key', table_name='stock_summary')
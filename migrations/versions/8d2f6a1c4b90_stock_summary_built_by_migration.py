@@ -0,0 +1,66 @@
+"""Stock summary: drop UNIQUE(category_id), fill the table on migration
+
+Revision ID: 8d2f6a1c4b90
+Revises: 5c8f1e3a9d26
+Create Date: 2026-10-19 09:41:07.318264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2f6a1c4b90'
+down_revision = '5c8f1e3a9d26'
+branch_labels = None
+depends_on = None
+
+
+def _create_table(unique_category):
+    constraints = [sa.UniqueConstraint('category_id')] if unique_category else []
+    op.create_table('stock_summary',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('product_count', sa.Integer(), nullable=False),
+    sa.Column('total_quantity', sa.Integer(), nullable=False),
+    sa.Column('total_cost', sa.Float(), nullable=False),
+    sa.Column('total_revenue', sa.Float(), nullable=False),
+    sa.Column('low_stock_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['category_id'], ['category.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    *constraints
+    )
+    op.create_index('uq_stock_summary_category_key', 'stock_summary',
+                    [sa.text('coalesce(category_id, 0)')], unique=True)
+
+
+def upgrade():
+    # A restrição UNIQUE(category_id) não tem nome estável entre bancos: recriar a tabela
+    # é mais simples que removê-la. Só o índice coalesce(category_id, 0) fica.
+    op.drop_index('uq_stock_summary_category_key', table_name='stock_summary')
+    op.drop_table('stock_summary')
+    _create_table(unique_category=False)
+
+    # O relatório só lê (réplica): a varredura completa roda aqui, uma vez, no deploy
+    op.execute("""
+        INSERT INTO stock_summary (category_id, product_count, total_quantity, total_cost,
+                                   total_revenue, low_stock_count, updated_at)
+        SELECT category_id,
+               COUNT(id),
+               COALESCE(SUM(COALESCE(quantity, 0)), 0),
+               COALESCE(SUM(COALESCE(quantity, 0) * COALESCE(cost, 0.0)), 0.0),
+               COALESCE(SUM(COALESCE(quantity, 0) * COALESCE(price, 0.0)), 0.0),
+               COALESCE(SUM(CASE WHEN COALESCE(quantity, 0) <= min_level THEN 1 ELSE 0 END), 0),
+               CURRENT_TIMESTAMP
+        FROM product
+        WHERE active = true
+        GROUP BY category_id
+    """)
+
+
+def downgrade():
+    op.drop_index('uq_stock_summary_category_key', table_name='stock_summary')
+    op.drop_table('stock_summary')
+    _create_table(unique_category=True)
+    # Volta vazia: 'flask rebuild-stats' preenche
@@ -0,0 +1,33 @@
+"""Job: at most one active job per unique kind (analytics)
+
+Revision ID: b4e7d2a90c15
+Revises: 8d2f6a1c4b90
+Create Date: 2026-10-19 10:26:51.640318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e7d2a90c15'
+down_revision = '8d2f6a1c4b90'
+branch_labels = None
+depends_on = None
+
+ACTIVE_UNIQUE_WHERE = sa.text("kind IN ('analytics') AND status IN ('queued', 'running')")
+
+
+def upgrade():
+    # Duplicados já enfileirados (antes do índice): fica o mais antigo
+    op.execute("""
+        UPDATE job SET status = 'failed', message = 'Duplicado: outro cálculo do dia já estava na fila.'
+        WHERE kind IN ('analytics') AND status IN ('queued', 'running')
+          AND id > (SELECT MIN(j.id) FROM job j WHERE j.kind = job.kind AND j.status IN ('queued', 'running'))
+    """)
+    op.create_index('uq_job_active_kind', 'job', ['kind'], unique=True,
+                    sqlite_where=ACTIVE_UNIQUE_WHERE, postgresql_where=ACTIVE_UNIQUE_WHERE)
+
+
+def downgrade():
+    op.drop_index('uq_job_active_kind', table_name='job')
@@ -0,0 +1,64 @@
+"""Product search index (FTS5 / pg_trgm)
+
+Revision ID: b7d3f6a18c20
+Revises: 8c41e07b2a93
+Create Date: 2026-10-18 13:40:51.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3f6a18c20'
+down_revision = '8c41e07b2a93'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_UPGRADE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, sku, content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, sku) VALUES (new.id, new.name, new.sku);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, sku) VALUES ('delete', old.id, old.name, old.sku);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, sku ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, sku) VALUES ('delete', old.id, old.name, old.sku);
+        INSERT INTO product_fts(rowid, name, sku) VALUES (new.id, new.name, new.sku);
+    END""",
+    "INSERT INTO product_fts(product_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_UPGRADE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_product_name_trgm ON product USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_product_sku_trgm ON product USING gin (sku gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_product_sku_prefix ON product (sku text_pattern_ops)",
+]
+
+
+def upgrade():
+    # Índices de texto são específicos de cada banco (não há autogenerate)
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        for statement in POSTGRES_UPGRADE:
+            op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for trigger in ('product_fts_ai', 'product_fts_ad', 'product_fts_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS product_fts')
+    elif dialect == 'postgresql':
+        for index in ('ix_product_sku_prefix', 'ix_product_sku_trgm', 'ix_product_name_trgm'):
+            op.execute(f'DROP INDEX IF EXISTS {index}')
@@ -0,0 +1,29 @@
+"""SKU prefix index on lower(sku)
+
+Revision ID: e3b9d52c4f71
+Revises: 7a4e2c9f1b08
+Create Date: 2026-10-18 23:41:09.374512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b9d52c4f71'
+down_revision = '7a4e2c9f1b08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A busca compara lower(sku) LIKE 'x%': o índice em sku puro não servia ao ILIKE
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_product_sku_prefix')
+        op.execute('CREATE INDEX ix_product_sku_prefix ON product (lower(sku) text_pattern_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_product_sku_prefix')
+        op.execute('CREATE INDEX ix_product_sku_prefix ON product (sku text_pattern_ops)')
@@ -0,0 +1,30 @@
+"""Drop change_version: table versions live in the cache backend
+
+Revision ID: f1c3a7e5b208
+Revises: b4e7d2a90c15
+Create Date: 2026-10-19 11:02:13.907455
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c3a7e5b208'
+down_revision = 'b4e7d2a90c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Os contadores das telas condicionais saíram do banco (ver app/http_cache.py)
+    op.drop_table('change_version')
+
+
+def downgrade():
+    op.create_table('change_version',
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
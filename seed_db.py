@@ -10,7 +10,8 @@ def seed():
         
         # GARANTIA SÊNIOR: Cria as tabelas no PostgreSQL do Render
         try:
-            db.drop_all() # Isso apaga as tabelas antigas (limite 128)
+            # Não apagamos nada: create_all só cria o que falta.
+            # Catálogos grandes: use 'flask import products arquivo.csv'.
             db.create_all()
             print("✅ Banco de Dados: Tabelas verificadas/criadas.")
         except Exception as e:
@@ -1,6 +1,12 @@
+import json
+import os
+import threading
 import unittest
 from app import create_app, db
-from app.models import User, Product, Supplier, Category, Movement
+from app.models import User, Product, Supplier, Category, Movement, PurchaseOrder, PurchaseOrderItem, StockSummary
+from app.stock_stats import load_summary, rebuild_stock_summary, verify_stock_summary
+from app.ledger import record_movement, InsufficientStock
+from config import Config
 
 class StockMasterAdvancedTestCase(unittest.TestCase):
     def setUp(self):
@@ -156,5 +162,1082 @@ class StockMasterAdvancedTestCase(unittest.TestCase):
         db.drop_all()
         self.app_context.pop()
 
+    # --- AGREGADOS DO RELATÓRIO ---
+
+    def login_admin(self):
+        self.client.post('/auth/login', data=dict(username='admin', password='admin123'), follow_redirects=True)
+
+    def create_product(self, sku='AGG01', quantity=10, cost=2.0, price=5.0, min_level=5):
+        prod = Product(name=f'Produto {sku}', sku=sku, quantity=quantity, cost=cost, price=price,
+                       min_level=min_level, supplier=Supplier.query.first(), category=Category.query.first())
+        db.session.add(prod)
+        db.session.commit()
+        return prod
+
+    def test_stock_summary_follows_movements(self):
+        """(Agregados) Movimentação, edição e arquivamento atualizam os KPIs incrementalmente"""
+        prod = self.create_product()
+        rebuild_stock_summary()
+        db.session.commit()
+        self.login_admin()
+
+        self.client.post('/movement/new', data=dict(product_id=prod.id, type='OUT', quantity=6), follow_redirects=True)
+        summary = load_summary()
+        self.assertEqual(summary['total_quantity'], 4)
+        self.assertAlmostEqual(summary['total_cost'], 8.0)
+        self.assertEqual(summary['low_stock_count'], 1)
+
+        self.client.post(f'/product/edit/{prod.id}', data=dict(
+            name=prod.name, supplier_id=prod.supplier_id, category_id=prod.category_id,
+            min_level=2, cost=3.0, price=6.0), follow_redirects=True)
+        summary = load_summary()
+        self.assertAlmostEqual(summary['total_revenue'], 24.0)
+        self.assertEqual(summary['low_stock_count'], 0)
+
+        self.client.get(f'/product/delete/{prod.id}', follow_redirects=True)
+        self.assertEqual(load_summary()['product_count'], 0)
+        self.assertEqual(verify_stock_summary(), [])
+
+    def test_stock_summary_single_row_without_category(self):
+        """(Agregados) Produtos sem categoria somam numa única linha (NULL não escapa do índice único)"""
+        from sqlalchemy.exc import IntegrityError
+        from app.stock_stats import apply_change, product_state
+        self.create_product(sku='CAT01')
+        rebuild_stock_summary()
+        db.session.commit()
+
+        for sku in ('SEM01', 'SEM02'):
+            prod = Product(name=sku, sku=sku, quantity=4, cost=1.0, price=2.0, supplier=Supplier.query.first())
+            db.session.add(prod)
+            db.session.flush()
+            apply_change(None, product_state(prod))
+            db.session.commit()
+        self.assertEqual(StockSummary.query.filter(StockSummary.category_id.is_(None)).count(), 1)
+        self.assertEqual(verify_stock_summary(), [])
+
+        db.session.add(StockSummary(category_id=None, product_count=0, total_quantity=0, total_cost=0.0,
+                                    total_revenue=0.0, low_stock_count=0))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_report_only_reads_summary(self):
+        """(Agregados) Relatório só lê a tabela; o rebuild fica no 'flask rebuild-stats'"""
+        self.create_product(quantity=3, cost=10.0)
+        self.login_admin()
+
+        response = self.client.get('/reports/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StockSummary.query.count(), 0)
+
+        result = self.app.test_cli_runner().invoke(args=['rebuild-stats'])
+        self.assertIn('Sucesso', result.output)
+        response = self.client.get('/reports/')
+        self.assertIn(b'R$ 30.00', response.data)
+        self.assertEqual(verify_stock_summary(), [])
+
+    # --- EXPORTAÇÃO CSV ---
+
+    def test_export_csv_streams_selected_columns(self):
+        """(Exportação) CSV em streaming com seleção de colunas e gzip"""
+        import gzip
+        for i in range(3):
+            self.create_product(sku=f'EXP{i}', quantity=i)
+        self.login_admin()
+
+        response = self.client.get('/reports/export/csv?columns=sku,supplier,quantity')
+        self.assertTrue(response.is_streamed)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(lines[0], 'SKU,Fornecedor,Estoque Atual')
+        self.assertEqual(lines[3], 'EXP2,Fornecedor Padrão,2')
+
+        response = self.client.get('/reports/export/csv?gzip=1', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(len(gzip.decompress(response.data).decode('utf-8').splitlines()), 4)
+
+        self.assertEqual(self.client.get('/reports/export/csv?columns=senha').status_code, 400)
+
+    # --- API DE MOVIMENTAÇÕES EM LOTE ---
+
+    def test_batch_movements_all_or_nothing(self):
+        """(Lote) Modo atômico rejeita o lote inteiro se uma linha falhar"""
+        prod = self.create_product(sku='LOTE01', quantity=5)
+        self.login_admin()
+
+        response = self.client.post('/api/movements/batch', json={'movements': [
+            {'sku': 'LOTE01', 'type': 'OUT', 'quantity': 3},
+            {'sku': 'LOTE01', 'type': 'OUT', 'quantity': 3},
+        ]})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json['results'][1]['error'], 'Saldo insuficiente! Estoque atual: 2')
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Product, prod.id).quantity, 5)
+        self.assertEqual(Movement.query.count(), 0)
+
+    def test_batch_movements_partial(self):
+        """(Lote) Modo parcial aplica as linhas válidas e devolve erro por linha"""
+        prod = self.create_product(sku='LOTE02', quantity=5)
+        self.login_admin()
+
+        response = self.client.post('/api/movements/batch', json={'atomic': False, 'movements': [
+            {'product_id': prod.id, 'type': 'IN', 'quantity': 10},
+            {'sku': 'NAOEXISTE', 'type': 'IN', 'quantity': 1},
+            {'sku': 'LOTE02', 'type': 'OUT', 'quantity': 12},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['applied'], 2)
+        self.assertEqual(response.json['results'][1]['error'], 'Produto não encontrado.')
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Product, prod.id).quantity, 3)
+        self.assertEqual(Movement.query.count(), 2)
+
+    # --- CONCORRÊNCIA NO SALDO (LEDGER) ---
+
+    def hammer_stock(self, app, product_id, user_id, workers=12, attempts=4):
+        """Dispara várias saídas simultâneas de 1 unidade contra o mesmo SKU."""
+        outcome = {'ok': 0, 'refused': 0, 'errors': []}
+        lock = threading.Lock()
+        start = threading.Barrier(workers)
+
+        def worker():
+            start.wait()
+            for _ in range(attempts):
+                with app.app_context():
+                    try:
+                        record_movement(product_id, 'OUT', 1, user_id)
+                        db.session.commit()
+                        key = 'ok'
+                    except InsufficientStock:
+                        db.session.rollback()
+                        key = 'refused'
+                    except Exception as e:
+                        db.session.rollback()
+                        with lock:
+                            outcome['errors'].append(e)
+                        continue
+                    with lock:
+                        outcome[key] += 1
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return outcome
+
+    def assert_no_oversell(self, app, initial=20):
+        with app.app_context():
+            prod = self.create_product(sku='CONC01', quantity=initial)
+            user_id = User.query.filter_by(username='operador').first().id
+            product_id = prod.id
+
+        outcome = self.hammer_stock(app, product_id, user_id)
+
+        with app.app_context():
+            final = db.session.get(Product, product_id).quantity
+            self.assertEqual(outcome['errors'], [])
+            self.assertGreaterEqual(final, 0)
+            self.assertEqual(outcome['ok'], initial)
+            self.assertEqual(final, initial - outcome['ok'])
+            self.assertEqual(Movement.query.filter_by(product_id=product_id).count(), outcome['ok'])
+
+    def test_concurrent_outs_never_oversell_sqlite(self):
+        """(Concorrência) Várias threads tirando do mesmo SKU não deixam saldo negativo"""
+        self.assert_no_oversell(self.app)
+
+    @unittest.skipUnless(os.environ.get('TEST_POSTGRES_URL'), 'defina TEST_POSTGRES_URL para rodar contra PostgreSQL')
+    def test_concurrent_outs_never_oversell_postgres(self):
+        """(Concorrência) Mesmo teste contra um PostgreSQL local"""
+        class PostgresConfig(Config):
+            SQLALCHEMY_DATABASE_URI = os.environ['TEST_POSTGRES_URL']
+
+        pg_app = create_app(PostgresConfig)
+        with pg_app.app_context():
+            db.create_all()
+            self.create_base_data()
+        try:
+            self.assert_no_oversell(pg_app)
+        finally:
+            with pg_app.app_context():
+                db.session.remove()
+                db.drop_all()
+
+    # --- CONFERÊNCIA DE RECEBIMENTO ---
+
+    def create_order(self, lines):
+        admin = User.query.filter_by(username='admin').first()
+        order = PurchaseOrder(supplier=Supplier.query.first(), invoice_number='NF-100', created_by_id=admin.id)
+        for prod, expected in lines:
+            order.items.append(PurchaseOrderItem(product=prod, quantity_expected=expected, quantity_received=0))
+        db.session.add(order)
+        db.session.commit()
+        return order
+
+    def test_receive_check_in_chunks(self):
+        """(Recebimento) Conferência parcial soma ao estoque e mantém o pedido pendente"""
+        a = self.create_product(sku='REC01', quantity=1)
+        b = self.create_product(sku='REC02', quantity=0)
+        order = self.create_order([(a, 10), (b, 4)])
+        item_a, item_b = order.items
+        self.login_admin()
+
+        self.client.post(f'/orders/{order.id}/receive', data={
+            f'received_{item_a.id}': 6, f'received_{item_b.id}': 0, 'action': 'partial'})
+        db.session.expire_all()
+        self.assertEqual(db.session.get(PurchaseOrder, order.id).status, 'pending')
+        self.assertEqual(db.session.get(Product, a.id).quantity, 7)
+
+        self.client.post(f'/orders/{order.id}/receive', data={
+            f'received_{item_a.id}': 4, f'received_{item_b.id}': 4, 'action': 'finalize'})
+        db.session.expire_all()
+        self.assertEqual(db.session.get(PurchaseOrder, order.id).status, 'completed')
+        self.assertEqual(db.session.get(PurchaseOrderItem, item_a.id).quantity_received, 10)
+        self.assertEqual(db.session.get(Product, a.id).quantity, 11)
+        self.assertEqual(db.session.get(Product, b.id).quantity, 4)
+        self.assertEqual(Movement.query.count(), 3)
+
+    # --- CONTADOR DE PENDENTES ---
+
+    def test_pending_status_is_cached_and_invalidated(self):
+        """(Pendentes) Contador em cache muda de versão quando um pedido é criado"""
+        self.login_admin()
+        first = self.client.get('/orders/status').json
+        self.assertEqual(first['pending'], 0)
+
+        # Workers síncronos (padrão): não segura a requisição, o navegador volta ao intervalo
+        same = self.client.get(f"/orders/status?since={first['version']}&wait=1").json
+        self.assertEqual((same['changed'], same['longpoll']), (False, False))
+
+        # Com workers assíncronos, o long-poll devolve a mesma versão ao fim da espera
+        self.app.config['STREAMING_WORKERS'] = True
+        same = self.client.get(f"/orders/status?since={first['version']}&wait=1").json
+        self.assertEqual((same['changed'], same['longpoll']), (False, True))
+
+        # Um rascunho antigo, antes do pedido novo (não é o maior id nem pendente)
+        sup = Supplier.query.first()
+        admin = User.query.filter_by(username='admin').first()
+        draft = PurchaseOrder(supplier=sup, invoice_number='NF-0', status='draft', created_by_id=admin.id)
+        db.session.add(draft)
+        db.session.commit()
+
+        self.client.post('/orders/new', data=dict(supplier_id=sup.id, invoice_number='NF-1'))
+        after = self.client.get(f"/orders/status?since={first['version']}").json
+        self.assertTrue(after['changed'])
+        self.assertEqual(after['pending'], 1)
+
+        # Excluir o rascunho não muda pendentes, max(id) nem a última alteração: o total muda a versão
+        self.client.post(f'/orders/{draft.id}/delete')
+        deleted = self.client.get(f"/orders/status?since={after['version']}").json
+        self.assertTrue(deleted['changed'])
+
+    # --- EVENTOS EM TEMPO REAL (SSE) ---
+
+    def test_events_published_after_commit(self):
+        """(Eventos) Pedido criado e estoque abaixo do mínimo geram eventos após o commit"""
+        prod = self.create_product(sku='EVT01', quantity=6, min_level=5)
+        subscription = self.app.extensions['event_bus'].subscribe()
+        self.login_admin()
+
+        self.client.post('/orders/new', data=dict(supplier_id=prod.supplier_id, invoice_number='NF-EVT'))
+        self.assertEqual(json.loads(subscription.get(timeout=1))['type'], 'order_created')
+
+        # Saída recusada (rollback) não publica nada
+        self.client.post('/movement/new', data=dict(product_id=prod.id, type='OUT', quantity=99))
+        self.assertIsNone(subscription.get(timeout=0.1))
+
+        self.client.post('/movement/new', data=dict(product_id=prod.id, type='OUT', quantity=2))
+        message = json.loads(subscription.get(timeout=1))
+        self.assertEqual(message['type'], 'stock_low')
+        self.assertEqual(message['data']['quantity'], 4)
+        subscription.close()
+
+    def test_event_stream_pushes_messages(self):
+        """(Eventos) /events/stream entrega os eventos no formato SSE, só com workers assíncronos e até o limite"""
+        self.login_admin()
+        self.assertEqual(self.client.get('/events/stream').status_code, 204) # workers síncronos: desligado
+        self.assertIn('streamUrl: null', self.client.get('/orders').get_data(as_text=True))
+
+        self.app.config['STREAMING_WORKERS'] = True
+        self.app.extensions['stream_slots'] = threading.BoundedSemaphore(1) # STREAM_MAX_CONNECTIONS = 1
+        response = self.client.get('/events/stream', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), b'retry: 5000\n\n')
+        self.app.extensions['event_bus'].publish('order_completed', order_id=7)
+        self.assertTrue(next(chunks).startswith(b'event: order_completed\ndata: '))
+
+        self.assertEqual(self.client.get('/events/stream').status_code, 503) # no limite
+        response.close()
+        second = self.client.get('/events/stream', buffered=False)
+        self.assertEqual(second.status_code, 200) # a vaga voltou ao fechar
+        second.close()
+
+    # --- ÍNDICES ---
+
+    def test_duplicate_invoice_blocked_by_unique_index(self):
+        """(Índices) O banco recusa a mesma NF duas vezes para o mesmo fornecedor"""
+        from sqlalchemy.exc import IntegrityError
+        self.create_order([])
+        admin = User.query.filter_by(username='admin').first()
+        db.session.add(PurchaseOrder(supplier=Supplier.query.first(), invoice_number='NF-100', created_by_id=admin.id))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    # --- BUSCA DE PRODUTOS ---
+
+    def test_search_uses_text_index_with_prefixes(self):
+        """(Busca) FTS acha por prefixo de nome e de SKU e acompanha edições"""
+        from app.search import get_backend
+        self.assertEqual(get_backend().name, 'fts5')
+        skol = self.create_product(sku='BEB-001')
+        skol.name = 'Cerveja Skol Lata'
+        self.create_product(sku='ALI-001').name = 'Chocolate Cervejeiro'
+        db.session.commit()
+        self.login_admin()
+
+        html = self.client.get('/?q=cerv').get_data(as_text=True)
+        self.assertIn('Cerveja Skol Lata', html)
+        self.assertIn('Chocolate Cervejeiro', html)
+
+        html = self.client.get('/?q=BEB-0').get_data(as_text=True)
+        self.assertIn('Cerveja Skol Lata', html)
+        self.assertNotIn('Chocolate Cervejeiro', html)
+
+        skol.name = 'Refrigerante Guaraná'
+        db.session.commit()
+        html = self.client.get('/?q=guarana').get_data(as_text=True)
+        self.assertIn('Refrigerante Guaraná', html)
+
+    # --- PAGINAÇÃO POR CHAVE ---
+
+    def test_keyset_pagination_walks_both_ways(self):
+        """(Paginação) Próxima/anterior por cursor, sem OFFSET, e cursor adulterado volta ao início"""
+        from app.pagination import keyset_paginate
+        for i in range(7):
+            self.create_product(sku=f'PG{i:02d}')
+        query = Product.query.filter(Product.sku.like('PG%'))
+        keys = [Product.name, Product.id]
+
+        first = keyset_paginate(query, keys, 3, count_cap=5)
+        self.assertEqual([p.sku for p in first.items], ['PG00', 'PG01', 'PG02'])
+        self.assertFalse(first.has_prev)
+        self.assertEqual(first.total_label, '5+')
+
+        second = keyset_paginate(query, keys, 3, after=first.next_cursor)
+        third = keyset_paginate(query, keys, 3, after=second.next_cursor)
+        self.assertEqual([p.sku for p in second.items], ['PG03', 'PG04', 'PG05'])
+        self.assertEqual([p.sku for p in third.items], ['PG06'])
+        self.assertFalse(third.has_next)
+
+        back = keyset_paginate(query, keys, 3, before=third.prev_cursor)
+        self.assertEqual([p.sku for p in back.items], ['PG03', 'PG04', 'PG05'])
+        back = keyset_paginate(query, keys, 3, before=back.prev_cursor)
+        self.assertEqual([p.sku for p in back.items], ['PG00', 'PG01', 'PG02'])
+        self.assertFalse(back.has_prev)
+
+        tampered = keyset_paginate(query, keys, 3, after='nao-e-um-cursor!')
+        self.assertEqual([p.sku for p in tampered.items], ['PG00', 'PG01', 'PG02'])
+
+    def test_keyset_total_counted_on_first_page_only(self):
+        """(Paginação) O total é contado na primeira página; as seguintes reaproveitam"""
+        from app.pagination import keyset_paginate
+        for i in range(4):
+            self.create_product(sku=f'PC{i:02d}')
+        query = Product.query.filter(Product.sku.like('PC%'))
+        keys = [Product.name, Product.id]
+
+        first = keyset_paginate(query, keys, 2, count_cap=100)
+        self.assertEqual(first.total_label, '4')
+        self.create_product(sku='PC99')
+        second = keyset_paginate(query, keys, 2, after=first.next_cursor, count_cap=100)
+        self.assertEqual(second.total_label, '4')
+        self.assertEqual(keyset_paginate(query, keys, 2, count_cap=100).total_label, '5')
+
+    def test_search_term_with_colon(self):
+        """(Paginação) Termo com ':' não vira parâmetro SQL no total da listagem"""
+        self.create_product(sku='CLN:abc')
+        self.login_admin()
+        for term in (':abc', 'CLN:abc', 'x :y'):
+            response = self.client.get('/', query_string={'q': term})
+            self.assertEqual(response.status_code, 200, term)
+
+    def test_movement_history_is_paginated(self):
+        """(Paginação) Histórico do produto: mais recentes primeiro, cursor com data"""
+        prod = self.create_product(sku='HIST1', quantity=0)
+        admin = User.query.filter_by(username='admin').first()
+        for qty in range(1, 6):
+            record_movement(prod.id, 'IN', qty, admin.id)
+        db.session.commit()
+        self.app.config['MOVEMENTS_PER_PAGE'] = 2
+        self.login_admin()
+
+        html = self.client.get(f'/product/{prod.id}').get_data(as_text=True)
+        self.assertIn('Mais antigas', html)
+        from app.pagination import keyset_paginate
+        page = keyset_paginate(Movement.query.filter_by(product_id=prod.id), [Movement.date, Movement.id], 2, descending=True)
+        self.assertEqual([m.quantity for m in page.items], [5, 4])
+        page = keyset_paginate(Movement.query.filter_by(product_id=prod.id), [Movement.date, Movement.id], 2,
+                               after=page.next_cursor, descending=True)
+        self.assertEqual([m.quantity for m in page.items], [3, 2])
+        response = self.client.get(f'/product/{prod.id}?after={page.next_cursor}')
+        self.assertEqual(response.status_code, 200)
+
+    # --- ORÇAMENTO DE QUERIES (N+1) ---
+
+    def query_count(self, url):
+        """Queries da página, com a sessão limpa (nada vem do identity map dos testes)."""
+        db.session.remove()
+        self.client.get(url) # aquece caches (contador de pendentes)
+        db.session.remove()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return int(response.headers['X-Query-Count'])
+
+    def test_listing_pages_stay_within_query_budget(self):
+        """(N+1) Telas de listagem rodam num número constante de queries"""
+        admin = User.query.filter_by(username='admin').first()
+        products = [self.create_product(sku=f'QB{i:02d}') for i in range(3)]
+        order = self.create_order([(p, 2) for p in products])
+        self.login_admin()
+        budgets = {
+            '/': 3,
+            '/orders': 2,
+            f'/orders/{order.id}': 4,
+            f'/orders/{order.id}/receive': 3,
+            '/suppliers': 3,
+            '/movement/new': 4,
+        }
+        before = {url: self.query_count(url) for url in budgets}
+
+        # Mais linhas, fornecedores e categorias diferentes: o número não pode crescer
+        order = db.session.get(PurchaseOrder, order.id)
+        other_supplier = Supplier(name='Outro Fornecedor', cnpj='11111111000111')
+        other_category = Category(name='Outra')
+        db.session.add_all([other_supplier, other_category])
+        for i in range(12):
+            prod = self.create_product(sku=f'QC{i:02d}')
+            prod.supplier, prod.category = other_supplier, other_category
+            order.items.append(PurchaseOrderItem(product=prod, quantity_expected=1, quantity_received=0))
+            record_movement(prod.id, 'IN', 1, admin.id)
+        db.session.add(PurchaseOrder(supplier=other_supplier, invoice_number='NF-200', created_by_id=admin.id))
+        db.session.commit()
+
+        for url, budget in budgets.items():
+            count = self.query_count(url)
+            self.assertLessEqual(count, budget, f'{url} passou do orçamento de queries')
+            self.assertEqual(count, before[url], f'{url} cresce com o número de linhas (N+1)')
+
+    # --- MÉTRICAS ---
+
+    def test_metrics_endpoint_and_slow_query_log(self):
+        """(Métricas) /metrics em texto Prometheus e SQL lento logado com a rota"""
+        class MetricsConfig(Config):
+            METRICS_ENABLED = True
+            METRICS_TOKEN = 'segredo'
+            SLOW_QUERY_MS = 0.000001 # tudo é "lento" no teste
+
+        app = create_app(MetricsConfig)
+        client = app.test_client()
+        with self.assertLogs('app.instrumentation.slow', level='WARNING') as logs:
+            client.post('/auth/login', data=dict(username='admin', password='admin123'))
+            self.assertEqual(client.get('/suppliers').status_code, 200)
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(entry['endpoint'], 'inventory.suppliers_list')
+        self.assertIn('SELECT', entry['statement'])
+
+        self.assertEqual(client.get('/metrics').status_code, 401)
+        body = client.get('/metrics', headers={'Authorization': 'Bearer segredo'}).get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_count{endpoint="inventory.suppliers_list",method="GET",status="200"} 1', body)
+        self.assertIn('http_request_sql_queries_total{endpoint="inventory.suppliers_list"}', body)
+        self.assertIn('http_request_template_seconds_total{endpoint="inventory.suppliers_list"}', body)
+
+    # --- BENCHMARKS ---
+
+    def test_benchmark_baseline_flags_regressions(self):
+        """(Benchmark) Comparação com o baseline acusa p99/throughput piores e erros novos"""
+        from benchmarks.baseline import compare, percentile, summarize
+        self.assertEqual(percentile([5, 1, 3, 2, 4], 50), 3)
+        self.assertEqual(percentile(list(range(1, 101)), 99), 99)
+
+        base = {'client': {'report': summarize([10.0] * 100, 0, 1.0)}}
+        same = {'client': {'report': summarize([11.0] * 100, 0, 1.0)}}
+        slower = {'client': {'report': summarize([10.0] * 98 + [50.0, 50.0], 0, 2.0)}}
+        self.assertEqual(compare(base, same), [])
+        regressions = compare(base, slower)
+        self.assertTrue(any('p99_ms' in r for r in regressions))
+        self.assertTrue(any('throughput' in r for r in regressions))
+
+    # --- IMPORTAÇÃO EM MASSA ---
+
+    def test_import_products_upserts_by_sku(self):
+        """(Importação) CSV em lotes: cria, atualiza pelo SKU sem mexer no saldo e ignora linhas ruins"""
+        import tempfile
+        from app.importer import import_products, import_stock, read_records
+        existing = self.create_product(sku='IMP-1', quantity=7, cost=1.0)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'catalogo.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('sku,name,cost,price,quantity,category,supplier,supplier_cnpj\n'
+                        'IMP-1,Produto Renomeado,"2,50",,99,,,\n'
+                        'IMP-2,Produto Novo,3.00,6.00,4,Importados,Fornecedor Novo,\n'
+                        'IMP-3,,1,2,0,,,\n'
+                        ',Sem SKU,1,2,0,,,\n'
+                        'IMP-1,,,,,,,99999999000199\n') # CNPJ desconhecido sem nome: linha recusada
+            admin = User.query.filter_by(username='admin').first()
+            result = import_products(read_records(path), chunk_size=2, user_id=admin.id)
+
+            self.assertEqual(result.processed, 2)
+            self.assertEqual(result.skipped, 3)
+            db.session.expire_all()
+            existing = db.session.get(Product, existing.id)
+            self.assertEqual((existing.name, existing.cost, existing.price, existing.quantity),
+                             ('Produto Renomeado', 2.5, 5.0, 7))
+            new = Product.query.filter_by(sku='IMP-2').one()
+            self.assertEqual((new.quantity, new.category.name, new.supplier.name), (4, 'Importados', 'Fornecedor Novo'))
+            self.assertEqual(new.image_file, 'default.jpg')
+            # Saldo de abertura do SKU novo entra pelo razão, com Movement IN
+            self.assertEqual([(m.type, m.quantity) for m in new.movements], [('IN', 4)])
+
+            # Saldo de abertura (JSONL): ajusta pelo razão e grava a diferença no extrato
+            path = os.path.join(tmp, 'saldos.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('{"sku": "IMP-1", "quantity": 2}\n{"sku": "IMP-2", "quantity": 1}\n{"sku": "NAO-EXISTE", "quantity": 1}\n')
+            subscription = self.app.extensions['event_bus'].subscribe()
+            result = import_stock(read_records(path), user_id=admin.id)
+        self.assertEqual((result.processed, result.skipped), (2, 1))
+        history = {(m.product.sku, m.type, m.quantity) for m in Movement.query.all()}
+        self.assertEqual(history, {('IMP-2', 'IN', 4), ('IMP-1', 'OUT', 5), ('IMP-2', 'OUT', 3)})
+        message = json.loads(subscription.get(timeout=1)) # IMP-1 cruzou o mínimo (7 -> 2)
+        subscription.close()
+        self.assertEqual((message['type'], message['data']['product_id']), ('stock_low', existing.id))
+        self.assertEqual(verify_stock_summary(), [])
+
+    # --- CACHE DE DADOS DE REFERÊNCIA ---
+
+    def test_reference_cache_invalidated_by_writes(self):
+        """(Cache) Fornecedores e contagem de produtos vêm do cache e mudam após gravações"""
+        from app import reference_data
+        cache = reference_data.get_cache()
+        prod = self.create_product(sku='REF01', quantity=3)
+
+        self.assertEqual([s.name for s in reference_data.suppliers()], ['Fornecedor Padrão'])
+        reference_data.suppliers()
+        self.assertEqual(cache.stats()['suppliers'], {'hits': 1, 'misses': 1})
+
+        # Gravação pelo ORM: nova versão só depois do commit
+        supplier = Supplier.query.first()
+        supplier.name = 'Fornecedor Renomeado'
+        db.session.flush()
+        self.assertEqual(reference_data.suppliers()[0].name, 'Fornecedor Padrão')
+        db.session.commit()
+        self.assertEqual(reference_data.suppliers()[0].name, 'Fornecedor Renomeado')
+
+        # Rollback não invalida
+        version = cache.version('categories')
+        db.session.add(Category(name='Temporária'))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(cache.version('categories'), version)
+
+        # Produto novo muda a contagem por fornecedor
+        self.assertEqual(reference_data.product_counts(), {prod.supplier_id: 1})
+        self.create_product(sku='REF02')
+        self.assertEqual(reference_data.product_counts(), {prod.supplier_id: 2})
+
+    # --- SALDO HISTÓRICO (FOTOS + EXTRATO) ---
+
+    def test_balance_at_uses_snapshots_and_reconcile_flags_drift(self):
+        """(Histórico) Saldo em qualquer data = foto anterior + extrato; reconciliação acha divergência"""
+        from datetime import datetime, timedelta
+        from app.models import StockSnapshot
+        from app.snapshots import SnapshotError, balance_at, reconcile, take_snapshot
+        admin = User.query.filter_by(username='admin').first()
+        a = self.create_product(sku='SNAP-A', quantity=0)
+        b = self.create_product(sku='SNAP-B', quantity=0)
+        day = datetime(2026, 1, 10)
+
+        def move(product, mov_type, qty, when):
+            record_movement(product.id, mov_type, qty, admin.id)
+            db.session.flush()
+            Movement.query.order_by(Movement.id.desc()).first().date = when
+            db.session.commit()
+
+        move(a, 'IN', 10, day + timedelta(hours=9))
+        move(b, 'IN', 4, day + timedelta(hours=10))
+        self.assertEqual(take_snapshot(day + timedelta(days=1)), 2)
+        move(a, 'OUT', 3, day + timedelta(days=1, hours=8))
+        self.assertEqual(take_snapshot(day + timedelta(days=2)), 1) # só quem movimentou
+        db.session.commit()
+        move(a, 'IN', 5, day + timedelta(days=2, hours=8))
+        self.assertEqual(StockSnapshot.query.count(), 3)
+
+        self.assertEqual(balance_at(a.id, day), 0)
+        self.assertEqual(balance_at(a.id, day + timedelta(hours=12)), 10)
+        self.assertEqual(balance_at(a.id, day + timedelta(days=1, hours=12)), 7)
+        self.assertEqual(balance_at(a.id), 12)
+        self.assertEqual(balance_at(b.id, day + timedelta(days=5)), 4) # foto antiga continua valendo
+
+        self.assertEqual(take_snapshot(day + timedelta(days=2)), 0) # idempotente
+        with self.assertRaises(SnapshotError):
+            take_snapshot(day)
+
+        self.login_admin()
+        data = self.client.get('/api/stock/balance', query_string={
+            'product_id': [a.id, b.id], 'at': '2026-01-11T12:00'}).get_json()
+        self.assertEqual(data['balances'], [{'product_id': a.id, 'quantity': 7}, {'product_id': b.id, 'quantity': 4}])
+
+        self.assertEqual(reconcile(), [])
+        b.quantity = 9 # saldo alterado sem movimentação
+        db.session.commit()
+        self.assertEqual([(p.sku, p.quantity, p.ledger) for p in reconcile()], [('SNAP-B', 9, 4)])
+
+    # --- ARQUIVO DE MOVIMENTAÇÕES ---
+
+    def test_archived_movements_stay_visible_in_history(self):
+        """(Retenção) Movimentações antigas saem da tabela quente e o histórico continua completo"""
+        from datetime import datetime, timedelta
+        from flask import template_rendered
+        from app.archive import archive_movements, retention_cutoff
+        from app.models import MovementArchive
+        from app.snapshots import balance_at, reconcile, take_snapshot
+        admin = User.query.filter_by(username='admin').first()
+        prod = self.create_product(sku='ARQ1', quantity=0)
+        old = datetime.now() - timedelta(days=800)
+        for qty in range(1, 7):
+            movement = record_movement(prod.id, 'IN', qty, admin.id)
+            db.session.flush()
+            if qty <= 4:
+                movement.date = old + timedelta(days=qty)
+        db.session.commit()
+
+        cutoff = retention_cutoff(365)
+        take_snapshot(cutoff)
+        self.assertEqual(archive_movements(cutoff, batch_size=3), 4)
+        self.assertEqual((Movement.query.count(), MovementArchive.query.count()), (2, 4))
+        db.session.expire_all()
+
+        # Saldos: foto + extrato, inclusive numa data dentro do período arquivado
+        self.assertEqual(balance_at(prod.id), 21)
+        self.assertEqual(balance_at(prod.id, old + timedelta(days=2, hours=1)), 3)
+        self.assertEqual(reconcile(), [])
+
+        rendered = []
+
+        def record(sender, template, context, **extra):
+            rendered.append(context)
+
+        self.app.config['MOVEMENTS_PER_PAGE'] = 4
+        self.login_admin()
+        with template_rendered.connected_to(record, self.app):
+            self.client.get(f'/product/{prod.id}')
+            page = rendered[-1]['movements']
+            self.assertEqual([m.quantity for m in page.items], [6, 5, 4, 3])
+            self.client.get(f'/product/{prod.id}?after={page.next_cursor}')
+            self.assertEqual([m.quantity for m in rendered[-1]['movements'].items], [2, 1])
+
+            self.client.get('/movement/new')
+            self.assertEqual([m.quantity for m in rendered[-1]['movements_history']], [4, 3, 2, 1])
+
+    # --- INDICADORES (ABC, GIRO, COBERTURA) ---
+
+    def test_inventory_analytics(self):
+        """(Indicadores) ABC, giro, cobertura e parados calculados por SKU e servidos do cache do dia"""
+        from datetime import date, datetime, timedelta
+        from app.analytics import abc_classes, compute, inventory_analytics, moving_average
+        from app.reference_data import get_cache
+        import numpy as np
+        self.assertEqual(abc_classes(np.array([50.0, 30.0, 15.0, 5.0, 0.0])).tolist(), [0, 0, 1, 2, 2])
+        self.assertEqual(moving_average(np.array([3, 3, 6]), 2).tolist(), [3.0, 3.0, 4.5])
+
+        admin = User.query.filter_by(username='admin').first()
+        now = datetime.now()
+
+        def move(product, mov_type, qty, days_ago):
+            movement = record_movement(product.id, mov_type, qty, admin.id)
+            db.session.flush()
+            movement.date = now - timedelta(days=days_ago)
+            db.session.commit()
+
+        fast = self.create_product(sku='GIRO-A', quantity=0, cost=10.0)
+        slow = self.create_product(sku='GIRO-C', quantity=0, cost=1.0)
+        idle = self.create_product(sku='PARADO', quantity=10, cost=5.0)
+        move(fast, 'IN', 100, 40)
+        move(fast, 'OUT', 60, 10)
+        move(slow, 'IN', 50, 100)
+        move(slow, 'OUT', 30, 50)
+
+        result = compute(date.today())
+        self.assertEqual([row['count'] for row in result['abc']], [1, 0, 2])
+        self.assertAlmostEqual(result['turnover'], 630 / 260)
+        self.assertEqual([(p['sku'], p['cover_days'], p['abc']) for p in result['at_risk']], [('GIRO-A', 20.0, 'A')])
+        self.assertEqual([p['sku'] for p in result['idle']], ['PARADO'])
+        self.assertEqual(sum(result['daily_out']), 90)
+
+        # As telas não calculam: enfileiram o job (uma vez) e mostram "calculando"
+        import shutil
+        import tempfile
+        from app.jobs import run_worker
+        from app.models import Job
+        self.app.config['JOBS_FOLDER'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.app.config['JOBS_FOLDER'])
+        self.login_admin()
+        self.assertIn('Calculando', self.client.get('/reports/').get_data(as_text=True))
+        self.assertIn('Calculando', self.client.get('/reports/dashboard').get_data(as_text=True))
+        self.assertEqual(Job.query.filter_by(kind='analytics').count(), 1)
+        # Sem SELECT de existência: quem decide é o índice único parcial (ON CONFLICT DO NOTHING)
+        from app.analytics import request_analytics
+        self.assertIsNone(request_analytics(admin.id))
+        db.session.commit()
+
+        self.assertEqual(run_worker(once=True), 1)
+        self.assertEqual(inventory_analytics()['turnover'], result['turnover'])
+        self.assertIn('GIRO-A', self.client.get('/reports/dashboard').get_data(as_text=True))
+
+        # Cache vazio (LRU de outro processo): o resultado vem do arquivo do job
+        get_cache().bump('analytics')
+        self.assertIn('GIRO-A', self.client.get('/reports/').get_data(as_text=True))
+        self.assertEqual(Job.query.filter_by(kind='analytics').count(), 1)
+
+    # --- AUTOCOMPLETE DE PRODUTOS ---
+
+    def test_product_lookup_by_prefix(self):
+        """(Autocomplete) Prefixo de SKU/nome, filtro de fornecedor e produtos novos sem reconstruir"""
+        self.login_admin()
+        cafe = self.create_product(sku='CAF-01')
+        cafe.name = 'Café Pilão'
+        self.create_product(sku='ACU-01').name = 'Açúcar Cristal'
+        other = Supplier(name='Outro', cnpj='99999999000199')
+        db.session.add(other)
+        db.session.commit()
+
+        def lookup(**params):
+            data = self.client.get('/api/products/lookup', query_string=params).get_json()
+            return [p['sku'] for p in data['results']]
+
+        self.assertEqual(lookup(q='caf'), ['CAF-01'])      # SKU
+        self.assertEqual(lookup(q='acucar'), ['ACU-01'])   # nome, sem acento
+        self.assertEqual(lookup(q='CAFE P'), ['CAF-01'])
+        self.assertEqual(lookup(q='caf', supplier_id=other.id), [])
+        self.assertEqual(lookup(q=''), [])
+
+        # Criado, renomeado e arquivado depois do índice montado
+        novo = self.create_product(sku='CAF-02')
+        cafe.name = 'Chá Mate'
+        cafe.active = False
+        db.session.commit()
+        self.assertEqual(lookup(q='caf'), ['CAF-02'])
+        novo.supplier = other
+        db.session.commit()
+        self.assertEqual(lookup(q='caf', supplier_id=other.id), ['CAF-02'])
+        self.assertEqual(lookup(q='produto', limit=1), ['CAF-02'])
+
+        # Direto no banco (sem índice): também sem diferenciar maiúsculas
+        self.app.config['PRODUCT_LOOKUP_INDEX'] = False
+        self.assertEqual(lookup(q='caf'), ['CAF-02'])
+        self.assertEqual(lookup(q='açúcar c'), ['ACU-01'])
+        self.app.config['PRODUCT_LOOKUP_INDEX'] = True
+
+        # Item de pedido só aceita produto do fornecedor do pedido
+        admin = User.query.filter_by(username='admin').first()
+        order = PurchaseOrder(supplier=other, invoice_number='NF-LK', created_by_id=admin.id)
+        db.session.add(order)
+        db.session.commit()
+        acucar = Product.query.filter_by(sku='ACU-01').first()
+        self.client.post(f'/orders/{order.id}', data=dict(product_id=acucar.id, quantity=5))
+        self.assertEqual(PurchaseOrderItem.query.count(), 0)
+
+    # --- SUGESTÃO DE COMPRA ---
+
+    def test_replenishment_suggestions_and_drafts(self):
+        """(Reposição) Consumo médio incremental, sugestão pelo ponto de pedido e rascunhos em lote"""
+        from datetime import date, datetime, timedelta
+        from app.models import ProductDemand
+        from app.order_status import pending_status
+        from app.replenishment import ALPHA, create_drafts, suggestions, update_demand
+
+        admin = User.query.filter_by(username='admin').first()
+        now = datetime.now()
+
+        def move(product, mov_type, qty, days_ago):
+            movement = record_movement(product.id, mov_type, qty, admin.id)
+            db.session.flush()
+            movement.date = now - timedelta(days=days_ago)
+            db.session.commit()
+
+        busy = self.create_product(sku='REP-01', quantity=0)
+        low = self.create_product(sku='REP-02', quantity=2, min_level=5)
+        self.create_product(sku='REP-03', quantity=10, min_level=5)
+        move(busy, 'IN', 200, 30)
+        for days_ago in range(1, 21):
+            move(busy, 'OUT', 10, days_ago)
+
+        self.assertEqual(update_demand(), 1)
+        self.assertEqual(update_demand(), 0) # nada novo desde a última rodada
+        expected = sum(ALPHA * (1 - ALPHA) ** (d - 1) * 10 for d in range(1, 21))
+        self.assertAlmostEqual(db.session.get(ProductDemand, busy.id).daily_mean, expected)
+
+        by_product = {s.product_id: s for s in suggestions()}
+        self.assertEqual(set(by_product), {busy.id, low.id})
+        self.assertEqual(by_product[low.id].suggested, 3) # sem consumo: completa o min_level
+        self.assertGreater(by_product[busy.id].suggested, by_product[busy.id].reorder_point)
+
+        orders = create_drafts(list(by_product.values()), admin.id)
+        db.session.commit()
+        order = db.session.get(PurchaseOrder, orders[busy.supplier_id])
+        self.assertEqual((order.status, len(order.items)), ('draft', 2))
+        self.assertEqual(pending_status()[0], 0)
+        self.assertEqual(suggestions(), []) # o que já está no rascunho conta como pedido
+
+        self.login_admin()
+        self.client.post(f'/orders/{order.id}/release', data=dict(invoice_number='NF-REP'))
+        db.session.refresh(order)
+        self.assertEqual((order.status, order.invoice_number), ('pending', 'NF-REP'))
+        self.assertEqual(self.client.get('/orders/suggestions').status_code, 200)
+
+    # --- IMAGENS ---
+
+    def test_uploaded_images_are_content_addressed(self):
+        """(Imagens) Upload pelo hash do conteúdo, sem duplicar, com miniatura WebP e cache imutável"""
+        import io
+        import shutil
+        import tempfile
+        from PIL import Image
+        from app.media import drain, media_url
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        self.app.config['MEDIA_FOLDER'] = folder
+        self.login_admin()
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(buffer, 'PNG')
+        first, second = self.create_product(sku='IMG-01'), self.create_product(sku='IMG-02')
+        for product in (first, second):
+            self.client.post(f'/product/edit/{product.id}', data=dict(
+                name=product.name, supplier_id=product.supplier_id, category_id=product.category_id,
+                min_level=5, cost=1, price=2, image=(io.BytesIO(buffer.getvalue()), 'foto.png')),
+                content_type='multipart/form-data')
+        drain()
+        db.session.expire_all()
+        key = first.image_file
+        self.assertEqual(second.image_file, key)
+        self.assertTrue(key.endswith('.png'))
+        self.assertEqual(sorted(os.listdir(os.path.join(folder, key[:2]))), [key, key.split('.')[0] + '_medium.webp',
+                                                                           key.split('.')[0] + '_thumb.webp'])
+
+        with self.app.test_request_context():
+            thumb_url, legacy_url = media_url(key, 'thumb'), media_url('antiga.jpg')
+        response = self.client.get(thumb_url)
+        self.assertEqual(response.mimetype, 'image/webp')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertEqual(Image.open(io.BytesIO(response.data)).size, (96, 64))
+        self.assertIn(thumb_url, self.client.get('/').get_data(as_text=True))
+        self.assertEqual(self.client.get('/media/huge/' + key).status_code, 404)
+
+        # Arquivo que não é imagem não troca a foto; chave antiga continua em static/uploads
+        self.client.post(f'/product/edit/{first.id}', data=dict(
+            name=first.name, supplier_id=first.supplier_id, category_id=first.category_id,
+            min_level=5, cost=1, price=2, image=(io.BytesIO(b'nada'), 'foto.jpg')),
+            content_type='multipart/form-data')
+        db.session.expire_all()
+        self.assertEqual(first.image_file, key)
+        self.assertEqual(legacy_url, '/static/uploads/antiga.jpg')
+
+    # --- TAREFAS EM SEGUNDO PLANO ---
+
+    def test_background_jobs_run_and_recover(self):
+        """(Tarefas) Exportação enfileirada pela web, executada pelo worker e reenfileirada se ele morrer"""
+        import shutil
+        import tempfile
+        from datetime import datetime, timedelta
+        from app.jobs import claim, execute, requeue_stale, run_worker
+        from app.models import Job
+        self.app.config['JOBS_FOLDER'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.app.config['JOBS_FOLDER'])
+        self.create_product(sku='JOB-01')
+        self.login_admin()
+
+        response = self.client.post('/reports/jobs/export', data=dict(columns='sku,quantity'),
+                                    headers={'Accept': 'application/json'})
+        self.assertEqual((response.status_code, response.get_json()['status']), (202, 'queued'))
+        job_id = response.get_json()['id']
+
+        # Worker morreu no meio: o supervisor devolve o job para a fila
+        row = claim('host:999')
+        self.assertEqual((row.id, row.status, row.attempts), (job_id, 'running', 1))
+        self.assertEqual(requeue_stale(worker='host:999'), 1)
+        self.assertEqual(run_worker(once=True), 1)
+
+        status = self.client.get(f'/reports/jobs/{job_id}').get_json()
+        self.assertEqual((status['status'], status['attempts'], status['has_result']), ('done', 2, True))
+        csv_text = self.client.get(f'/reports/jobs/{job_id}/download').get_data(as_text=True)
+        self.assertIn('JOB-01,10', csv_text)
+        self.assertIn(f'/reports/jobs/{job_id}/download', self.client.get('/reports/jobs').get_data(as_text=True))
+
+        # Heartbeat parado em todas as tentativas: falha; o "zumbi" não grava resultado
+        job = Job(kind='analytics', params='{}', status='running', attempts=self.app.config['JOB_MAX_ATTEMPTS'],
+                  worker='host:998', heartbeat_at=datetime.now() - timedelta(hours=1))
+        db.session.add(job)
+        db.session.commit()
+        self.assertEqual(requeue_stale(), 0)
+        self.assertFalse(execute(job, 'host:998'))
+        db.session.refresh(job)
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(job.result_file)
+
+    # --- RÉPLICA DE LEITURA ---
+
+    def test_read_routes_use_replica_until_a_write(self):
+        """(Réplica) Rotas de leitura leem da réplica; depois de gravar, o usuário lê do primário"""
+        import shutil
+        import tempfile
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+
+        class ReplicaConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{folder}/primary.db'
+            SQLALCHEMY_BINDS = {'replica': f'sqlite:///{folder}/replica.db'}
+
+        app = create_app(ReplicaConfig)
+        try:
+            app.config['TESTING'] = True
+            with app.app_context():
+                db.create_all()
+                admin = User(username='admin', role='admin')
+                admin.set_password('admin123')
+                supplier = Supplier(name='Fornecedor', cnpj='123')
+                product = Product(name='Nome Antigo', sku='REPL-01', quantity=10, supplier=supplier)
+                db.session.add_all([admin, product])
+                db.session.commit()
+                product_id = product.id
+                db.engines['replica'].dispose()
+                shutil.copy(f'{folder}/primary.db', f'{folder}/replica.db') # réplica "atrasada"
+                product.name = 'Nome Novo'
+                db.session.commit()
+                db.session.remove()
+
+            client = app.test_client()
+            client.post('/auth/login', data=dict(username='admin', password='admin123'))
+            self.assertIn('Nome Antigo', client.get(f'/product/{product_id}').get_data(as_text=True))
+            self.assertIn('Nome Antigo', client.get('/').get_data(as_text=True))
+
+            client.post('/movement/new', data=dict(product_id=product_id, type='IN', quantity=5))
+            self.assertIn('Nome Novo', client.get(f'/product/{product_id}').get_data(as_text=True))
+
+            with client.session_transaction() as sess:
+                sess['_db_pinned_until'] = 0 # passou o tempo de alcançar a réplica
+            self.assertIn('Nome Antigo', client.get(f'/product/{product_id}').get_data(as_text=True))
+            with app.app_context():
+                self.assertEqual(db.session.get(Product, product_id).quantity, 15) # a escrita foi no primário
+        finally:
+            # O bind 'replica' registra um metadata no db global; o tearDown (drop_all) não o conhece
+            db.metadatas.pop('replica', None)
+
+    # --- USUÁRIO LOGADO EM CACHE ---
+
+    def test_logged_user_comes_from_cache(self):
+        """(Login) current_user sai do cache; edição invalida e troca de função exige novo login"""
+        import re
+        from flask import g
+        from sqlalchemy import event
+
+        def call(client, method, url, **kwargs):
+            # As requisições reaproveitam o contexto da app do setUp: sem isto o
+            # Flask-Login acharia em g o usuário da requisição anterior (de outro cliente)
+            g.pop('_login_user', None)
+            return client.open(url, method=method, **kwargs)
+
+        operator_id = User.query.filter_by(username='operador').first().id
+        admin_id = User.query.filter_by(username='admin').first().id
+        operator, admin = self.app.test_client(), self.app.test_client()
+        call(operator, 'POST', '/auth/login', data=dict(username='operador', password='user123'))
+        call(admin, 'POST', '/auth/login', data=dict(username='admin', password='admin123'))
+        db.session.remove()
+
+        user_selects = []
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if re.search(r'\bFROM "?user"?\s', statement):
+                user_selects.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            for _ in range(3):
+                self.assertEqual(call(operator, 'GET', '/').status_code, 200)
+            self.assertEqual(len(user_selects), 1) # só a primeira requisição foi ao banco
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        # Nome novo aparece já na requisição seguinte
+        call(admin, 'POST', f'/auth/users/edit/{operator_id}', data=dict(username='operador2', role='operator'))
+        self.assertIn('operador2', call(operator, 'GET', '/').get_data(as_text=True))
+
+        # O admin troca a própria senha e continua logado
+        call(admin, 'POST', f'/auth/users/edit/{admin_id}', data=dict(username='admin', role='admin', password='nova123'))
+        self.assertEqual(call(admin, 'GET', '/auth/users').status_code, 200)
+
+        # Mudou a função depois do login: a sessão antiga deixa de valer
+        call(admin, 'POST', f'/auth/users/edit/{operator_id}', data=dict(username='operador2', role='admin'))
+        response = call(operator, 'GET', '/')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/auth/login', response.headers['Location'])
+
+        # Rebaixado por outro worker (cache LRU deste processo não sabe): rota de admin confere no banco
+        self.assertEqual(call(admin, 'GET', '/').status_code, 200) # admin no cache deste processo
+        with db.engine.begin() as conn:
+            conn.execute(User.__table__.update().where(User.id == admin_id).values(role='operator'))
+        self.assertEqual(call(admin, 'GET', '/auth/users').status_code, 403)
+
+    # --- RESPOSTAS CONDICIONAIS (ETag) ---
+
+    def test_listings_answer_304_until_a_write(self):
+        """(ETag) Sem gravação nas tabelas da tela a resposta é 304, sem rodar a view"""
+        admin = User.query.filter_by(username='admin').first()
+        prod = self.create_product(sku='ETG01', quantity=10)
+        self.login_admin()
+
+        first = self.client.get('/')
+        etag = first.headers['ETag']
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first.headers['Cache-Control'])
+
+        again = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.get_data(), b'')
+        self.assertEqual(again.headers['X-Query-Count'], '0') # versões vêm do cache, não do banco
+
+        # Rollback não muda a versão; commit muda
+        db.session.add(Category(name='Temporária'))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.client.get('/', headers={'If-None-Match': etag}).status_code, 304)
+        record_movement(prod.id, 'OUT', 3, admin.id)
+        db.session.commit()
+        changed = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+
+        # Tela sem relação com a tabela gravada continua em 304
+        orders_etag = self.client.get('/orders').headers['ETag']
+        record_movement(prod.id, 'OUT', 1, admin.id)
+        db.session.commit()
+        self.assertEqual(self.client.get('/orders', headers={'If-None-Match': orders_etag}).status_code, 304)
+
+        # A tabela de pedidos vem do cache de fragmentos até um pedido mudar
+        self.assertNotIn('NF-100', self.client.get('/orders').get_data(as_text=True))
+        self.create_order([(prod, 2)])
+        response = self.client.get('/orders', headers={'If-None-Match': orders_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('NF-100', response.get_data(as_text=True))
+
+        # Cache por worker (LRU) com vários workers: a versão ganha uma janela de tempo
+        from unittest import mock
+        self.app.config['HTTP_CACHE_LOCAL_WINDOW'] = 30
+        with mock.patch('app.http_cache.time.time', return_value=3000.0):
+            etag = self.client.get('/orders').headers['ETag']
+            self.assertEqual(self.client.get('/orders', headers={'If-None-Match': etag}).status_code, 304)
+        with mock.patch('app.http_cache.time.time', return_value=3030.0):
+            self.assertEqual(self.client.get('/orders', headers={'If-None-Match': etag}).status_code, 200)
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file